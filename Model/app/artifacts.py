@@ -0,0 +1,16 @@
+"""
+Location of artifacts the API writes at runtime (exported ONNX graphs, KB snapshots)
+HEALTHSYNC_ARTIFACT_DIR, else $XDG_CACHE_HOME/healthsync, else ~/.cache/healthsync;
+never the source tree
+"""
+
+import os
+from pathlib import Path
+
+
+def artifact_dir() -> Path:
+    configured = os.environ.get("HEALTHSYNC_ARTIFACT_DIR")
+    if configured:
+        return Path(configured)
+    cache_home = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(cache_home) / "healthsync"
@@ -0,0 +1,158 @@
+"""
+Dynamic micro-batching for ClinicalBERT inference
+Collects concurrent encode requests over a bounded wait window, runs one padded
+forward pass per batch and fans the per-note results back to the awaiting coroutines
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class MicroBatcher:
+    """Batch scheduler in front of ``encode_fn(list[str]) -> list``.
+
+    A batch is dispatched as soon as ``max_batch_size`` items are queued or the
+    oldest queued item has waited ``max_latency_ms``, whichever comes first.
+    ``encode_fn`` is either a coroutine function or a blocking callable that is
+    run on ``executor``.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], Any],
+        max_batch_size: int = 16,
+        max_latency_ms: float = 10.0,
+        executor: Optional[Any] = None,
+        name: str = "clinical_bert"
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max(0.0, float(max_latency_ms)) / 1000.0
+        self.executor = executor
+        self.name = name
+        self.batch_size_histogram = Histogram(
+            f"{name}_batch_size", "Number of notes per forward pass", BATCH_SIZE_BUCKETS
+        )
+        self.queue_wait_histogram = Histogram(
+            f"{name}_queue_wait_ms", "Time a note waited in the batch queue (ms)"
+        )
+        self.batch_latency_histogram = Histogram(
+            f"{name}_batch_latency_ms", "Wall time of one batched forward pass (ms)"
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run(), name=f"{self.name}-batcher")
+        logger.info(
+            "Micro-batcher '%s' started (max_batch_size=%d, max_latency_ms=%.1f)",
+            self.name, self.max_batch_size, self.max_latency * 1000
+        )
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        # Fail anything still queued so callers don't hang forever
+        while self._queue is not None and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Micro-batcher stopped"))
+
+    async def submit(self, text: str) -> Any:
+        """Queue one note and wait for its encoding."""
+        if not self.running:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            # Drain whatever is already waiting without yielding
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Skip callers that have already gone away (e.g. client disconnect)
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            dispatched_at = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                self.queue_wait_histogram.observe((dispatched_at - enqueued_at) * 1000)
+            self.batch_size_histogram.observe(len(batch))
+
+            texts = [text for text, _, _ in batch]
+            try:
+                if inspect.iscoroutinefunction(self.encode_fn):
+                    results = await self.encode_fn(texts)
+                else:
+                    results = await loop.run_in_executor(self.executor, self.encode_fn, texts)
+            except asyncio.CancelledError:
+                # stop() while a batch is in flight: its callers would otherwise wait forever
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError("Micro-batcher stopped"))
+                raise
+            except Exception as e:
+                logger.error(f"Batched encode failed for {len(batch)} notes: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.batch_latency_histogram.observe((time.perf_counter() - dispatched_at) * 1000)
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "running": self.running,
+            "max_batch_size": self.max_batch_size,
+            "max_latency_ms": self.max_latency * 1000,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_ms": self.queue_wait_histogram.snapshot(),
+            "batch_latency_ms": self.batch_latency_histogram.snapshot()
+        }
@@ -0,0 +1,327 @@
+"""
+Reproducible benchmark suite for the Hybrid Model API
+Runs fully offline against a generated tiny BERT checkpoint (or --model-path) and
+a synthetic CSV corpus: micro-benchmarks of the analysis stages plus an in-process
+ASGI load generator for /analyze. Results are written as JSON so runs can be
+diffed between releases; --baseline flags regressions.
+
+    python benchmark.py --out bench.json
+    python benchmark.py --quick --baseline bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+# Phrase bank for synthetic notes; every word also goes into the tiny model's vocabulary
+NOTE_PHRASES = [
+    "patient reports chest pain radiating to the left arm",
+    "shortness of breath on exertion and palpitations at night",
+    "history of hypertension with elevated blood pressure readings",
+    "blood sugar poorly controlled with excessive thirst and frequent urination",
+    "complains of headache and dizziness since last week",
+    "double vision and ptosis of the left eyelid noted on exam",
+    "numbness and tingling in both feet with weakness",
+    "mild fever and productive cough for three days",
+    "fatigue and unintended weight loss over two months",
+    "currently on prednisone for suspected autoimmune inflammation",
+    "no nausea or vomiting reported",
+    "family history of cardiac disease and diabetes",
+]
+NOTE_LENGTHS = {"short": 1, "medium": 8, "long": 40}  # phrases per note
+
+# Run sizes; --quick swaps in the smaller set for any of these not given explicitly
+FULL_DEFAULTS = {"repeat": 200, "requests": 200, "kb_rows": 100000, "concurrency": [1, 8, 32]}
+QUICK_DEFAULTS = {"repeat": 30, "requests": 40, "kb_rows": 10000, "concurrency": [1, 8]}
+
+
+def make_note(phrases: int, seed: int) -> str:
+    rng = random.Random(seed)
+    return ". ".join(rng.choice(NOTE_PHRASES) for _ in range(phrases)) + f". visit {seed}."
+
+
+def build_tiny_bert(out_dir: Path, hidden_size: int = 64, layers: int = 2, seed: int = 0) -> Path:
+    """Write a randomly initialised BERT + WordPiece tokenizer that loads like ClinicalBERT"""
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words = sorted({w for phrase in NOTE_PHRASES for w in phrase.split()})
+    chars = list("abcdefghijklmnopqrstuvwxyz0123456789")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + list(".,;:/()-") + chars + [f"##{c}" for c in chars] + words
+    vocab_file = out_dir / "vocab.txt"
+    vocab_file.write_text("\n".join(dict.fromkeys(vocab)) + "\n", encoding="utf-8")
+    BertTokenizerFast(str(vocab_file), do_lower_case=True).save_pretrained(str(out_dir))
+
+    torch.manual_seed(seed)
+    config = BertConfig(
+        vocab_size=len(dict.fromkeys(vocab)),
+        hidden_size=hidden_size,
+        num_hidden_layers=layers,
+        num_attention_heads=max(1, hidden_size // 32),
+        intermediate_size=hidden_size * 4,
+        max_position_embeddings=512
+    )
+    BertModel(config).save_pretrained(str(out_dir))
+    return out_dir
+
+
+def build_synthetic_corpus(out_dir: Path, diseases: int = 2000, test_rows: int = 100000, seed: int = 0) -> Path:
+    """CSV corpus shaped like data/output_data for DataKnowledgeBase benchmarks"""
+    rng = random.Random(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    names = ["Cardiovascular Disease", "Hypertension", "Diabetes"] + [f"condition {i} type {i % 7}" for i in range(diseases)]
+    with (out_dir / "Diagnoses.csv").open("w", encoding="utf-8") as f:
+        f.write("Diagnosis\n" + "\n".join(names) + "\n")
+    with (out_dir / "Tests.csv").open("w", encoding="utf-8") as f:
+        f.write("PatientID,Diagnosis,TestName,Value\n")
+        for i in range(test_rows):
+            f.write(f"{i},{rng.choice(names)},test {rng.randrange(300)},{rng.random():.3f}\n")
+    with (out_dir / "MeasurementsLookup.csv").open("w", encoding="utf-8") as f:
+        f.write("Diagnosis,MeasurementName\n")
+        f.write("".join(f"{rng.choice(names)},measurement {i}\n" for i in range(diseases)))
+    with (out_dir / "DrugLookup.csv").open("w", encoding="utf-8") as f:
+        f.write("Diagnosis,DrugName\n")
+        f.write("".join(f"{rng.choice(names)},drug {i}\n" for i in range(diseases)))
+    return out_dir
+
+
+def summarize(latencies_ms: List[float]) -> Dict[str, Any]:
+    values = np.asarray(latencies_ms, dtype=np.float64)
+    if not values.size:
+        return {"n": 0, "mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {
+        "n": int(values.size),
+        "mean_ms": round(float(values.mean()), 4),
+        "p50_ms": round(float(np.percentile(values, 50)), 4),
+        "p95_ms": round(float(np.percentile(values, 95)), 4),
+        "p99_ms": round(float(np.percentile(values, 99)), 4)
+    }
+
+
+def measure(fn: Callable[[], Any], repeat: int, warmup: int = 3) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return summarize(latencies)
+
+
+def run_micro(main: Any, repeat: int) -> Dict[str, Any]:
+    from knowledge_base import DataKnowledgeBase
+
+    patient = main.PatientData(
+        age=62, gender="Male", cholesterol=240, blood_glucose=150, blood_pressure="150/95",
+        clinical_notes=make_note(NOTE_LENGTHS["medium"], 0)
+    )
+    bert = main.analyze_with_clinical_bert(patient.clinical_notes)
+    xgb = main.analyze_with_xgboost(patient)
+    rag = main.retrieve_medical_guidelines(bert["diseases_detected"], bert["symptoms_identified"],
+                                           reported=bert.get("symptoms_reported"))
+    results = {}
+    for length, phrases in NOTE_LENGTHS.items():
+        note = make_note(phrases, 1)
+        results[f"analyze_with_clinical_bert[{length}]"] = measure(lambda: main.analyze_with_clinical_bert(note), repeat)
+    results["analyze_with_xgboost"] = measure(lambda: main.analyze_with_xgboost(patient), repeat)
+    results["retrieve_medical_guidelines"] = measure(
+        lambda: main.retrieve_medical_guidelines(bert["diseases_detected"], bert["symptoms_identified"],
+                                                 reported=bert.get("symptoms_reported")), repeat
+    )
+    results["fuse_analysis_results"] = measure(lambda: main.fuse_analysis_results(bert, xgb, rag), repeat)
+    results["DataKnowledgeBase.build"] = measure(lambda: DataKnowledgeBase(main.DATA_DIR), max(3, repeat // 50), warmup=1)
+    kb = DataKnowledgeBase(main.DATA_DIR)
+    queries = ["Hypertension", "condition 1234 type 2", "cardiovascular", "conditon 77 typ 0"]
+    for query in queries:
+        # match() is the raw index search; retrieve() is memoized through the alias table
+        results[f"DataKnowledgeBase.match[{query}]"] = measure(lambda: kb.match(query), repeat)
+        results[f"DataKnowledgeBase.retrieve[{query}]"] = measure(lambda: kb.retrieve(query), repeat)
+    return results
+
+
+async def run_load(main: Any, concurrency_levels: List[int], requests: int, unique_notes: bool) -> List[Dict[str, Any]]:
+    """Closed-loop load: ``concurrency`` clients each send requests back to back"""
+    import httpx
+
+    await main.start_inference()
+    await main.components.start_background_load()
+    transport = httpx.ASGITransport(app=main.app)
+    scenarios = []
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for length, phrases in NOTE_LENGTHS.items():
+                for concurrency in concurrency_levels:
+                    counter = iter(range(requests))
+                    latencies, statuses = [], {}
+
+                    def payload(i: int) -> Dict[str, Any]:
+                        seed = i if unique_notes else 0
+                        return {
+                            "age": 40 + i % 40, "gender": "Male" if i % 2 else "Female",
+                            "cholesterol": 180 + i % 80, "blood_glucose": 90 + i % 90,
+                            "clinical_notes": make_note(phrases, seed + concurrency * 1_000_000)
+                        }
+
+                    async def client_loop():
+                        for i in counter:
+                            started = time.perf_counter()
+                            response = await client.post("/analyze", json=payload(i))
+                            # Shed (503) or failed requests return fast; they must not count as served
+                            if response.is_success:
+                                latencies.append((time.perf_counter() - started) * 1000)
+                            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+                    # Warm the batcher and caches for this note length before measuring
+                    await client.post("/analyze", json=payload(-1))
+                    started = time.perf_counter()
+                    await asyncio.gather(*[client_loop() for _ in range(concurrency)])
+                    wall = time.perf_counter() - started
+                    scenarios.append({
+                        "note_length": length,
+                        "concurrency": concurrency,
+                        "throughput_rps": round(len(latencies) / wall, 2),
+                        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+                        **summarize(latencies)
+                    })
+                    scenarios[-1]["rejection_rate"] = rejection_rate(scenarios[-1])
+                    print(f"load {length:>6} c={concurrency:<3} {scenarios[-1]['throughput_rps']:>8} rps "
+                          f"p50={scenarios[-1]['p50_ms']}ms p99={scenarios[-1]['p99_ms']}ms "
+                          f"rejected={scenarios[-1]['rejection_rate']:.1%}", file=sys.stderr)
+    finally:
+        await main.stop_inference()
+    return scenarios
+
+
+def rejection_rate(scenario: Dict[str, Any]) -> float:
+    """Share of a load scenario's responses that were not 2xx"""
+    statuses = scenario.get("statuses", {})
+    total = sum(statuses.values())
+    rejected = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return round(rejected / total, 4) if total else 0.0
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Human-readable regressions beyond ``threshold`` (fractional) versus a baseline run"""
+    regressions = []
+    for name, stats in current.get("micro", {}).items():
+        base = baseline.get("micro", {}).get(name)
+        if base and base["p50_ms"] > 0 and stats["p50_ms"] > base["p50_ms"] * (1 + threshold):
+            regressions.append(f"micro {name}: p50 {base['p50_ms']} -> {stats['p50_ms']} ms")
+    base_load = {(s["note_length"], s["concurrency"]): s for s in baseline.get("load", [])}
+    for scenario in current.get("load", []):
+        base = base_load.get((scenario["note_length"], scenario["concurrency"]))
+        if not base:
+            continue
+        label = f"load {scenario['note_length']} c={scenario['concurrency']}"
+        # Computed from statuses so baselines written before rejection_rate was recorded compare too
+        if rejection_rate(scenario) > rejection_rate(base):
+            regressions.append(f"{label}: non-2xx share {rejection_rate(base):.1%} -> {rejection_rate(scenario):.1%}")
+        p99, base_p99 = scenario["p99_ms"], base["p99_ms"]
+        # No 2xx responses means no latency to compare; the share and throughput checks flag that run
+        if p99 is not None and base_p99 is not None and p99 > base_p99 * (1 + threshold):
+            regressions.append(f"{label}: p99 {base_p99} -> {p99} ms")
+        if scenario["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{label}: throughput {base['throughput_rps']} -> {scenario['throughput_rps']} rps")
+    return regressions
+
+
+def _environment(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    versions = {}
+    for module in ("torch", "transformers", "numpy", "fastapi", "xgboost"):
+        try:
+            versions[module] = __import__(module).__version__
+        except Exception:
+            versions[module] = None
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")}
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the Hybrid Model API offline")
+    parser.add_argument("--out", type=Path, default=None, help="Write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", type=Path, default=None, help="Compare against an earlier results JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Regression tolerance (fraction)")
+    parser.add_argument("--model-path", type=Path, default=None, help="Benchmark this checkpoint instead of a tiny BERT")
+    parser.add_argument("--hidden-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=None, help="Iterations per micro-benchmark (default: 200)")
+    parser.add_argument("--requests", type=int, default=None, help="Requests per load scenario (default: 200)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=None, help="Client counts (default: 1 8 32)")
+    parser.add_argument("--kb-rows", type=int, default=None, help="Rows in the synthetic Tests.csv (default: 100000)")
+    parser.add_argument("--repeat-notes", action="store_true", help="Reuse one note per scenario (measures cache hits)")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--quick", action="store_true", help="Small run for CI smoke checks")
+    args = parser.parse_args()
+    for name, value in (QUICK_DEFAULTS if args.quick else FULL_DEFAULTS).items():
+        if getattr(args, name) is None:
+            setattr(args, name, value)
+
+    # Removed on exit, including when a regression exits non-zero
+    with tempfile.TemporaryDirectory(prefix="healthsync-bench-") as tmp:
+        workdir = Path(tmp)
+        model_path = args.model_path or build_tiny_bert(workdir / "tiny-bert", hidden_size=args.hidden_size)
+        data_dir = build_synthetic_corpus(workdir / "data", test_rows=args.kb_rows)
+        # Configure before importing main: isolated, offline, no snapshot or persistent cache
+        os.environ.update({
+            "HEALTHSYNC_MODEL_PATH": str(model_path),
+            "HEALTHSYNC_OFFLINE": "1",
+            "HEALTHSYNC_DATA_DIR": str(data_dir),
+            "HEALTHSYNC_KB_SNAPSHOT": "",
+            "HEALTHSYNC_VECTOR_INDEX_PATH": str(workdir / "no-vector-index.npz"),
+            "HEALTHSYNC_ARTIFACT_DIR": str(workdir / "artifacts")
+        })
+        os.environ.pop("HEALTHSYNC_CACHE_PATH", None)
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+        import main
+
+        for name in list(main.components.components):
+            main.components.load_sync(name)
+        results = {"environment": _environment(args), "micro": run_micro(main, args.repeat)}
+        if not args.skip_load:
+            main.analysis_cache.clear()
+            results["load"] = asyncio.run(run_load(main, args.concurrency, args.requests, not args.repeat_notes))
+
+        text = json.dumps(results, indent=2)
+        if args.out:
+            args.out.write_text(text + "\n", encoding="utf-8")
+        else:
+            print(text)
+
+        if args.baseline:
+            regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.threshold)
+            for line in regressions:
+                print(f"REGRESSION {line}", file=sys.stderr)
+            if regressions:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
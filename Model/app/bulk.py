@@ -0,0 +1,182 @@
+"""
+Incremental parsing for bulk analysis uploads
+Turns a streamed request body (JSON array or NDJSON) into records one at a time,
+so memory use does not grow with the size of the upload
+"""
+
+import codecs
+import json
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from fastapi.responses import StreamingResponse
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+_LONGEST_LITERAL = len("-Infinity")
+# Largest single record (array element or NDJSON line) buffered while it arrives; sizes
+# are counted in decoded characters, which is bytes for the ASCII JSON clients send
+DEFAULT_MAX_RECORD_BYTES = 1024 * 1024
+
+
+class BulkParseError(ValueError):
+    """The upload is malformed in a way that prevents reading further records."""
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes],
+                      max_record_bytes: int = DEFAULT_MAX_RECORD_BYTES) -> AsyncIterator[Tuple[Any, str]]:
+    """Yield ``(record, error)`` per non-blank line; bad lines are reported, not fatal"""
+    utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    offset = 0  # of the start of ``buffer`` in the decoded body
+    async for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            offset += len(line) + 1
+            if line.strip():
+                yield _parse_line(line)
+        if len(buffer) > max_record_bytes:
+            raise BulkParseError(f"Line at offset {offset} exceeds {max_record_bytes} bytes")
+    buffer += utf8.decode(b"", final=True)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+def _parse_line(line: str) -> Tuple[Any, str]:
+    try:
+        return json.loads(line), None
+    except json.JSONDecodeError as e:
+        return None, f"Invalid JSON: {e.msg}"
+
+
+def _needs_more_input(error: json.JSONDecodeError, buffer: str) -> bool:
+    """Whether a failed element decode may only be cut short by the end of ``buffer``.
+
+    An open string is reported at its opening quote; any other error that more input
+    could fix sits within a partial literal ("-Infinity" being the longest) of the end.
+    """
+    return error.msg.startswith("Unterminated string") or len(buffer) - error.pos <= _LONGEST_LITERAL
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes],
+                          max_record_bytes: int = DEFAULT_MAX_RECORD_BYTES) -> AsyncIterator[Tuple[Any, str]]:
+    """Yield ``(record, None)`` for each element of a top-level JSON array as it arrives.
+
+    Only the element being decoded is buffered; one that is invalid, or that grows past
+    ``max_record_bytes`` before it is complete, ends the upload with BulkParseError.
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    pos = 0
+    offset = 0  # of the start of ``buffer`` in the decoded body
+    state = "start"  # start -> first -> (separator -> item)* until the closing bracket
+    eof = False
+    iterator = chunks.__aiter__()
+
+    while True:
+        # Skip whitespace and structural characters we can resolve with the current buffer
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos < len(buffer):
+            ch = buffer[pos]
+            if state == "start":
+                if ch != "[":
+                    raise BulkParseError("Expected a JSON array or NDJSON body")
+                pos += 1
+                state = "first"
+                continue
+            if state in ("first", "separator") and ch == "]":
+                return
+            if state == "separator":
+                if ch != ",":
+                    raise BulkParseError(f"Expected ',' or ']' at offset {offset + pos}")
+                pos += 1
+                state = "item"
+                continue
+            if state in ("first", "item"):
+                try:
+                    record, end = _decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as e:
+                    if eof or not _needs_more_input(e, buffer):
+                        raise BulkParseError(f"Invalid JSON array element at offset {offset + pos}: {e.msg}")
+                    if len(buffer) - pos > max_record_bytes:
+                        raise BulkParseError(f"JSON array element at offset {offset + pos} exceeds {max_record_bytes} bytes")
+                else:
+                    # A number at the very end of the buffer may continue in the next chunk
+                    if end < len(buffer) or eof:
+                        pos = end
+                        state = "separator"
+                        yield record, None
+                        continue
+        elif eof:
+            raise BulkParseError("Unexpected end of JSON array")
+
+        if eof:
+            raise BulkParseError(f"Truncated JSON array element at offset {offset + pos}")
+        # Drop consumed text so the buffer only holds the current element
+        offset += pos
+        buffer = buffer[pos:]
+        pos = 0
+        try:
+            chunk = await iterator.__anext__()
+            buffer += utf8.decode(chunk)
+        except StopAsyncIteration:
+            buffer += utf8.decode(b"", final=True)
+            eof = True
+
+
+async def iter_records(chunks: AsyncIterator[bytes], content_type: str = "",
+                       max_record_bytes: int = DEFAULT_MAX_RECORD_BYTES) -> AsyncIterator[Tuple[Any, str]]:
+    """Dispatch on content type (or the first non-blank byte) between array and NDJSON parsing"""
+    iterator = chunks.__aiter__()
+    head = b""
+    async for chunk in iterator:
+        head += chunk
+        if head.strip():
+            break
+
+    async def replay() -> AsyncIterator[bytes]:
+        if head:
+            yield head
+        async for chunk in iterator:
+            yield chunk
+
+    is_ndjson = "ndjson" in content_type or "jsonl" in content_type
+    if not is_ndjson and not head.lstrip().startswith(b"["):
+        is_ndjson = True
+    parser = iter_ndjson if is_ndjson else iter_json_array
+    async for item in parser(replay(), max_record_bytes):
+        yield item
+
+
+async def iter_chunks(records: AsyncIterator[Tuple[Any, str]], size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Group parsed records into lists of ``size`` items tagged with their input index"""
+    chunk = []
+    index = 0
+    async for record, error in records:
+        chunk.append({"index": index, "record": record, "error": error})
+        index += 1
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class RequestBodyStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body iterator may keep reading the request body.
+
+    Starlette's StreamingResponse concurrently awaits ``receive()`` to detect client
+    disconnects, which would steal the remaining request-body messages from the
+    generator. Here a disconnect surfaces as a failed ``send()`` instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        async for chunk in self.body_iterator:
+            if not isinstance(chunk, (bytes, memoryview)):
+                chunk = chunk.encode(self.charset)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
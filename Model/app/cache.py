@@ -0,0 +1,466 @@
+"""
+Analysis cache for repeated clinical notes
+In-process LRU/TTL tier bounded by entry count and bytes, with an optional
+pluggable persistent tier that survives restarts: SQLite on one node, or any
+Redis-protocol server shared by every replica. Concurrent misses for one note are
+coalesced, and entries near expiry are refreshed early (XFetch) to avoid stampedes.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_note(text: str) -> str:
+    """Case- and whitespace-insensitive form of a note used for cache keys"""
+    return " ".join(text.lower().split())
+
+
+def note_cache_key(text: str, model_version: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(model_version.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_note(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory footprint in bytes (numpy buffers counted exactly)"""
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes)
+    if isinstance(value, dict):
+        return sum(estimate_size(v) for v in value.values()) + 64 * len(value)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 1024
+
+
+class MemoryTier:
+    """Thread-safe LRU with per-entry TTL and a total byte budget."""
+
+    def __init__(self, max_entries: int = 4096, max_bytes: int = 64 * 1024 * 1024, ttl_s: float = 3600.0):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl_s = float(ttl_s)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, size: Optional[int] = None):
+        size = estimate_size(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl_s if self.ttl_s > 0 else None
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            self._bytes -= entry[1]
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl_s,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class SQLiteTier:
+    """Persistent tier backed by a single SQLite file; values are pickled.
+
+    Any object with ``get(key)``, ``set(key, value)``, ``clear()`` and ``stats()``
+    can be plugged in instead.
+    """
+
+    def __init__(self, path: Path, ttl_s: float = 7 * 24 * 3600.0):
+        self.path = Path(path)
+        self.ttl_s = float(ttl_s)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        if hasattr(os, "register_at_fork"):
+            # sqlite3 connections must not cross fork(); forked workers open their own
+            os.register_at_fork(after_in_child=self._reset_connections)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+
+    def _reset_connections(self):
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shareable across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            with self._connect() as conn:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+        try:
+            return pickle.loads(value)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {key[:12]}: {e}")
+            return None
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_s if self.ttl_s > 0 else None
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, blob, expires_at)
+            )
+
+    def acquire_lease(self, key: str, ttl_s: float) -> bool:
+        """Claim the computation of ``key`` for ``ttl_s`` seconds; False if another process holds it"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)", (key, now + ttl_s))
+            return cursor.rowcount == 1
+
+    def release_lease(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {"backend": "sqlite", "path": str(self.path), "entries": entries, "ttl_s": self.ttl_s}
+
+
+class RedisTier:
+    """Shared tier on a Redis-protocol server (Redis, Valkey, KeyDB); needs the ``redis`` package.
+
+    Every replica pointed at the same server reuses the others' embeddings and
+    analyses, and a restarted replica starts warm. Values are pickled, so the server
+    must be trusted as much as the replicas themselves.
+    """
+
+    def __init__(self, url: str, ttl_s: float = 7 * 24 * 3600.0, prefix: str = "healthsync:cache:"):
+        import redis
+
+        self.url = url
+        self.ttl_s = float(ttl_s)
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.client.ping()
+
+    def get(self, key: str) -> Optional[Any]:
+        blob = self.client.get(self.prefix + key)
+        if blob is None:
+            return None
+        try:
+            return pickle.loads(blob)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {key[:12]}: {e}")
+            return None
+
+    def set(self, key: str, value: Any):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.client.set(self.prefix + key, blob, px=int(self.ttl_s * 1000) if self.ttl_s > 0 else None)
+
+    def acquire_lease(self, key: str, ttl_s: float) -> bool:
+        """SET NX PX: exactly one replica wins the lease until it is released or expires"""
+        return bool(self.client.set(f"{self.prefix}lease:{key}", os.getpid(), nx=True, px=int(ttl_s * 1000)))
+
+    def release_lease(self, key: str):
+        self.client.delete(f"{self.prefix}lease:{key}")
+
+    def clear(self):
+        batch = []
+        for name in self.client.scan_iter(match=self.prefix + "*", count=1000):
+            batch.append(name)
+            if len(batch) >= 1000:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+    def stats(self) -> Dict[str, Any]:
+        parts = urlsplit(self.url)
+        # Never report credentials embedded in the URL
+        netloc = parts.hostname or ""
+        if parts.port:
+            netloc = f"{netloc}:{parts.port}"
+        return {
+            "backend": "redis",
+            "url": urlunsplit((parts.scheme, netloc, parts.path, "", "")),
+            "entries": self.client.dbsize(),
+            "ttl_s": self.ttl_s
+        }
+
+
+class SingleFlight:
+    """Coalesces concurrent async computations of the same key into one.
+
+    The computation runs as its own task, so a caller that disconnects does not
+    cancel it for the others waiting on the same key. With a ``scheduler`` (see
+    scheduler.RequestScheduler) the task runs in the most urgent waiter's lane rather
+    than the first caller's, and each caller waits only until its own deadline.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Tuple[asyncio.Task, Any]] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.scheduler = None
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            self.leaders += 1
+            if self.scheduler is not None:
+                call = self.scheduler.run_shared(fn)
+            else:
+                call = (asyncio.ensure_future(fn()), None)
+            self._calls[key] = call
+            call[0].add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        task, shared = call
+        if shared is None:
+            return await asyncio.shield(task)
+        with self.scheduler.waiting_on(shared):
+            return await self.scheduler.within_deadline(asyncio.shield(task))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+class AnalysisCache:
+    """Memory tier in front of an optional persistent tier, with hit/miss counters.
+
+    Entries remember how long they took to compute and when they expire; a lookup
+    close to expiry is reported as a miss with probability rising as expiry nears
+    (XFetch, beta = HEALTHSYNC_CACHE_XFETCH_BETA), so one caller recomputes ahead of
+    time instead of every replica recomputing at the moment the entry lapses.
+    """
+
+    def __init__(self, memory: MemoryTier, persistent: Optional[Any] = None,
+                 xfetch_beta: float = 1.0, lease_s: float = 10.0):
+        self.memory = memory
+        self.persistent = persistent
+        self.xfetch_beta = float(xfetch_beta)
+        self.lease_s = float(lease_s)
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.early_refreshes = 0
+        self.lease_waits = 0
+        self.lease_wait_hits = 0
+
+    @classmethod
+    def from_env(cls) -> "AnalysisCache":
+        """HEALTHSYNC_CACHE_REDIS_URL selects the shared Redis tier; HEALTHSYNC_CACHE_PATH a local SQLite file"""
+        memory = MemoryTier(
+            max_entries=int(os.environ.get("HEALTHSYNC_CACHE_MAX_ENTRIES", "4096")),
+            max_bytes=int(os.environ.get("HEALTHSYNC_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl_s=float(os.environ.get("HEALTHSYNC_CACHE_TTL_S", "3600"))
+        )
+        persistent = None
+        disk_ttl_s = float(os.environ.get("HEALTHSYNC_CACHE_DISK_TTL_S", str(7 * 24 * 3600)))
+        redis_url = os.environ.get("HEALTHSYNC_CACHE_REDIS_URL")
+        disk_path = os.environ.get("HEALTHSYNC_CACHE_PATH")
+        if redis_url:
+            try:
+                persistent = RedisTier(redis_url, ttl_s=disk_ttl_s)
+            except Exception as e:
+                logger.warning(f"Shared Redis cache disabled: {e}")
+        if persistent is None and disk_path:
+            try:
+                persistent = SQLiteTier(Path(disk_path), ttl_s=disk_ttl_s)
+            except Exception as e:
+                logger.warning(f"Persistent cache disabled, could not open {disk_path}: {e}")
+        return cls(
+            memory, persistent,
+            xfetch_beta=float(os.environ.get("HEALTHSYNC_CACHE_XFETCH_BETA", "1.0")),
+            lease_s=float(os.environ.get("HEALTHSYNC_CACHE_LEASE_S", "10"))
+        )
+
+    @property
+    def ttl_s(self) -> float:
+        """Lifetime of an entry: the persistent tier's when there is one"""
+        return getattr(self.persistent, "ttl_s", self.memory.ttl_s) if self.persistent is not None else self.memory.ttl_s
+
+    def _unwrap(self, entry: Any) -> Optional[Any]:
+        """Entry value, or None when XFetch picks this lookup to refresh it early"""
+        if not isinstance(entry, dict) or "xfetch_expires_at" not in entry:
+            # Written before entries carried expiry metadata
+            return entry
+        if self.xfetch_beta > 0 and entry["xfetch_expires_at"] is not None:
+            # -log(u) is Exp(1)-distributed: rare early refreshes long before expiry, likely ones just before
+            jitter = entry["xfetch_delta_s"] * self.xfetch_beta * -math.log(1.0 - random.random())
+            if time.time() + jitter >= entry["xfetch_expires_at"]:
+                self.early_refreshes += 1
+                return None
+        return entry["value"]
+
+    def get_memory(self, key: str) -> Optional[Any]:
+        """Memory-only lookup; cheap enough to call on the event loop"""
+        entry = self.memory.get(key)
+        if entry is None:
+            return None
+        value = self._unwrap(entry)
+        if value is not None:
+            self.hits += 1
+        return value
+
+    def get_persistent(self, key: str, record: bool = True) -> Optional[Any]:
+        """Persistent-tier lookup (blocking I/O); promotes hits into memory"""
+        entry = None
+        if self.persistent is not None:
+            try:
+                entry = self.persistent.get(key)
+            except Exception as e:
+                logger.warning(f"Persistent cache read failed: {e}")
+        value = self._unwrap(entry) if entry is not None else None
+        if value is None:
+            if record:
+                self.misses += 1
+            return None
+        if record:
+            self.persistent_hits += 1
+        self.memory.set(key, entry)
+        return value
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.get_memory(key)
+        return value if value is not None else self.get_persistent(key)
+
+    def set(self, key: str, value: Any, compute_s: float = 0.0):
+        """Store ``value``; ``compute_s`` (how long it took) scales the XFetch early-refresh window"""
+        ttl_s = self.ttl_s
+        entry = {
+            "value": value,
+            "xfetch_delta_s": float(compute_s),
+            "xfetch_expires_at": time.time() + ttl_s if ttl_s > 0 else None
+        }
+        self.memory.set(key, entry)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, entry)
+            except Exception as e:
+                logger.warning(f"Persistent cache write failed: {e}")
+
+    def acquire_lease(self, key: str) -> bool:
+        """Claim the computation of ``key`` across processes; always granted without a shared tier"""
+        if self.persistent is None or not hasattr(self.persistent, "acquire_lease"):
+            return True
+        try:
+            return self.persistent.acquire_lease(key, self.lease_s)
+        except Exception as e:
+            logger.warning(f"Cache lease failed, computing without it: {e}")
+            return True
+
+    def release_lease(self, key: str):
+        if self.persistent is not None and hasattr(self.persistent, "release_lease"):
+            try:
+                self.persistent.release_lease(key)
+            except Exception as e:
+                logger.warning(f"Cache lease release failed: {e}")
+
+    async def wait_for_leader(self, key: str, run_sync: Callable[..., Awaitable[Any]]) -> Optional[Any]:
+        """Poll the persistent tier while another process computes ``key``; None after ``lease_s``"""
+        self.lease_waits += 1
+        deadline = time.monotonic() + self.lease_s
+        delay = 0.01
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.25)
+            value = await run_sync(self.get_persistent, key, False)
+            if value is not None:
+                self.lease_wait_hits += 1
+                return value
+        return None
+
+    def clear(self):
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.persistent_hits + self.misses
+        persistent_lookups = self.persistent_hits + self.misses
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "hit_ratio": ((self.hits + self.persistent_hits) / lookups) if lookups else 0.0,
+            "memory_hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            "persistent_hit_ratio": (self.persistent_hits / persistent_lookups) if persistent_lookups else 0.0,
+            "early_refreshes": self.early_refreshes,
+            "lease_waits": self.lease_waits,
+            "lease_wait_hits": self.lease_wait_hits,
+            "memory": self.memory.stats(),
+            "persistent": self.persistent.stats() if self.persistent is not None else None
+        }
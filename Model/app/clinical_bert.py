@@ -0,0 +1,514 @@
+"""
+ClinicalBERT loading and encoding helpers
+Shared by the API process and by out-of-process inference workers.
+torch/transformers are imported lazily so importing this module stays cheap.
+
+CPU inference backends (HEALTHSYNC_BERT_BACKEND):
+    torch       fp32 PyTorch model (default)
+    torch-int8  dynamic int8 quantization of every nn.Linear
+    onnx        exported CLS graph run by onnxruntime (optional dependency)
+    onnx-int8   the exported graph with onnxruntime dynamic int8 quantization
+
+    python clinical_bert.py export [--int8]
+    python clinical_bert.py parity --backend torch-int8
+    python clinical_bert.py bench [--backends torch torch-int8 onnx]
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Tuple, Any, Dict, List, Optional
+
+import numpy as np
+
+from artifacts import artifact_dir
+from tokenization import pool_windows, tokenize_notes
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "medicalai/ClinicalBERT"
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+ONNX_FILENAME = "clinicalbert.onnx"
+ONNX_OPSET = 17
+
+# Notes used to compare a backend's CLS embeddings against fp32 torch
+PARITY_NOTES = [
+    "Patient reports chest pain radiating to the left arm with shortness of breath.",
+    "Elevated fasting glucose, polyuria and polydipsia over the last three months.",
+    "Persistent cough, fever and fatigue; wheezing on auscultation.",
+    "Headache and dizziness, blood pressure 168/102 on repeat measurement.",
+    "Joint pain and swelling in both knees, morning stiffness lasting an hour.",
+    "No acute complaints."
+]
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def model_config() -> Dict[str, Any]:
+    """Resolve model location from the environment.
+
+    HEALTHSYNC_MODEL_PATH      local directory or hub id of the model (default: medicalai/ClinicalBERT)
+    HEALTHSYNC_TOKENIZER_PATH  tokenizer location (default: the model path)
+    HEALTHSYNC_OFFLINE         never touch the network; only local files / the HF cache are used
+    HEALTHSYNC_BERT_BACKEND    torch | torch-int8 | onnx | onnx-int8 (default: torch)
+    HEALTHSYNC_ONNX_PATH       exported fp32 graph (default: <artifact dir>/clinicalbert.onnx, see
+                               artifacts); the int8 graph sits next to it as <name>.int8.onnx
+    HEALTHSYNC_BERT_PARITY_MIN_COSINE  minimum CLS cosine similarity to fp32 (default: 0.99)
+    """
+    model_path = os.environ.get("HEALTHSYNC_MODEL_PATH", MODEL_NAME)
+    return {
+        "model_path": model_path,
+        "tokenizer_path": os.environ.get("HEALTHSYNC_TOKENIZER_PATH", model_path),
+        "offline": _env_flag("HEALTHSYNC_OFFLINE"),
+        "backend": os.environ.get("HEALTHSYNC_BERT_BACKEND", "torch").strip().lower(),
+        "onnx_path": os.environ.get("HEALTHSYNC_ONNX_PATH") or str(artifact_dir() / ONNX_FILENAME),
+        "parity_min_cosine": float(os.environ.get("HEALTHSYNC_BERT_PARITY_MIN_COSINE", "0.99"))
+    }
+
+
+def model_version() -> str:
+    """Identifier of the served model, used to key caches (HEALTHSYNC_MODEL_VERSION overrides)"""
+    if os.environ.get("HEALTHSYNC_MODEL_VERSION"):
+        return os.environ["HEALTHSYNC_MODEL_VERSION"]
+    config = model_config()
+    # Quantized backends produce slightly different embeddings, so they get their own cache keys
+    if config["backend"] == "torch":
+        return config["model_path"]
+    return f"{config['model_path']}@{config['backend']}"
+
+
+def int8_onnx_path(onnx_path: Path) -> Path:
+    onnx_path = Path(onnx_path)
+    return onnx_path.with_name(f"{onnx_path.stem}.int8{onnx_path.suffix}")
+
+
+def parity_stamp_path(graph: Path) -> Path:
+    graph = Path(graph)
+    return graph.with_name(f"{graph.name}.parity.json")
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_parity_stamp(graph: Path, config: Dict[str, Any], parity: Dict[str, Any]):
+    """Record that ``graph`` passed its parity check against the configured fp32 model"""
+    stamp = {"model_path": config["model_path"], "sha256": _file_digest(graph), "parity": parity}
+    path = parity_stamp_path(graph)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(stamp, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def has_valid_parity_stamp(graph: Path, config: Dict[str, Any]) -> bool:
+    """True when ``graph`` is byte-for-byte the one that passed parity for this model at this threshold"""
+    try:
+        stamp = json.loads(parity_stamp_path(graph).read_text(encoding="utf-8"))
+        return (
+            stamp["model_path"] == config["model_path"]
+            and stamp["parity"]["passed"]
+            and stamp["parity"]["min_cosine"] >= config["parity_min_cosine"]
+            and stamp["sha256"] == _file_digest(graph)
+        )
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+
+
+def remove_onnx_artifacts(onnx_path: Path):
+    for path in (onnx_path, int8_onnx_path(onnx_path)):
+        for target in (path, parity_stamp_path(path)):
+            try:
+                target.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _intra_op_threads() -> int:
+    """Follow the torch thread count set by the executor; 0 lets onnxruntime decide"""
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        return torch.get_num_threads()
+    return int(os.environ.get("HEALTHSYNC_TORCH_THREADS", "0"))
+
+
+class OnnxEncoder:
+    """onnxruntime session over an exported CLS graph; stands in for the torch model.
+
+    The graph returns only the [CLS] row, so the full (batch, seq, hidden) activations
+    never leave the runtime.
+    """
+
+    backend = "onnx"
+
+    def __init__(self, path: Path, threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = Path(path)
+        self.session = ort.InferenceSession(str(self.path), options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def cls_embeddings(self, inputs: Dict[str, Any]) -> np.ndarray:
+        feed = {name: np.asarray(inputs[name], dtype=np.int64) for name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+def export_onnx(tokenizer: Any, model: Any, path: Path, int8: bool = False) -> Path:
+    """Export the [CLS] output of ``model`` to ONNX with dynamic batch and sequence axes.
+
+    With ``int8`` the exported graph is also dynamically quantized by onnxruntime;
+    returns the path of the graph to serve.
+    """
+    import torch
+
+    path = Path(path)
+    input_names = [n for n in tokenizer.model_input_names if n in ("input_ids", "attention_mask", "token_type_ids")]
+
+    class _ClsGraph(torch.nn.Module):
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, *args):
+            return self.encoder(**dict(zip(input_names, args))).last_hidden_state[:, 0]
+
+    sample = tokenizer(PARITY_NOTES[:2], return_tensors="pt", padding=True)
+    axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    axes["cls"] = {0: "batch"}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                _ClsGraph(model).eval(), tuple(sample[n] for n in input_names), str(tmp),
+                input_names=input_names, output_names=["cls"], dynamic_axes=axes,
+                opset_version=ONNX_OPSET, dynamo=False
+            )
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    logger.info(f"Exported ClinicalBERT CLS graph to {path}")
+    if not int8:
+        return path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized = int8_onnx_path(path)
+    quantize_dynamic(str(path), str(quantized), weight_type=QuantType.QInt8)
+    logger.info(f"Quantized ClinicalBERT CLS graph to {quantized}")
+    return quantized
+
+
+def quantize_int8(model: Any) -> Any:
+    """Dynamic int8 quantization of every nn.Linear, in place so the fp32 weights are freed"""
+    import torch
+    from torch.ao.quantization import quantize_dynamic
+
+    return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def compare_embeddings(expected: np.ndarray, actual: np.ndarray, min_cosine: float = 0.99) -> Dict[str, Any]:
+    """Parity report of backend CLS embeddings against fp32 ones (one row per note)"""
+    cosine = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1) + 1e-12
+    )
+    return {
+        "notes": len(expected),
+        "min_cosine": round(float(cosine.min()), 6),
+        "max_abs_diff": round(float(np.abs(expected - actual).max()), 6),
+        "min_cosine_required": min_cosine,
+        "passed": bool(cosine.min() >= min_cosine)
+    }
+
+
+def parity_check(tokenizer: Any, reference: Any, candidate: Any, texts: Optional[List[str]] = None,
+                 min_cosine: float = 0.99) -> Dict[str, Any]:
+    """Compare ``candidate`` CLS embeddings against the fp32 ``reference`` model on ``texts``"""
+    texts = texts or PARITY_NOTES
+    expected = np.stack(encode_cls_embeddings(tokenizer, reference, texts))
+    actual = np.stack(encode_cls_embeddings(tokenizer, candidate, texts))
+    return compare_embeddings(expected, actual, min_cosine)
+
+
+def _prepare_offline(config: Dict[str, Any]) -> Dict[str, Any]:
+    if config["offline"]:
+        # Must be set before huggingface_hub is first imported
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    return {"local_files_only": True} if config["offline"] else {}
+
+
+def load_tokenizer(config: Optional[Dict[str, Any]] = None) -> Any:
+    config = config or model_config()
+    kwargs = _prepare_offline(config)
+    from transformers import AutoTokenizer
+
+    try:
+        return AutoTokenizer.from_pretrained(config["tokenizer_path"], **kwargs)
+    except Exception as e:
+        if config["tokenizer_path"] == MODEL_NAME:
+            raise
+        # Fine-tuned checkpoints often ship without tokenizer files
+        logger.warning(f"Tokenizer loading from {config['tokenizer_path']} failed: {e}")
+        return AutoTokenizer.from_pretrained(MODEL_NAME, **kwargs)
+
+
+def load_torch_model(config: Optional[Dict[str, Any]] = None) -> Any:
+    """Load the fp32 torch model"""
+    config = config or model_config()
+    kwargs = _prepare_offline(config)
+    from transformers import AutoModel
+
+    logger.info(f"Loading ClinicalBERT model from {config['model_path']} (offline={config['offline']})...")
+    try:
+        model = AutoModel.from_pretrained(config["model_path"], **kwargs)
+    except Exception as e:
+        if config["offline"] or config["model_path"] == MODEL_NAME:
+            raise
+        logger.warning(f"Model loading from {config['model_path']} failed: {e}")
+        logger.info("Falling back to online model...")
+        model = AutoModel.from_pretrained(MODEL_NAME)
+    model.eval()
+    logger.info("ClinicalBERT model loaded successfully")
+    return model
+
+
+def load_clinical_bert() -> Tuple[Any, Any]:
+    """Load tokenizer and model from the configured location, on the configured backend.
+
+    A quantized or ONNX backend is only served after its CLS embeddings match fp32
+    torch; anything that fails (parity, a missing onnxruntime, the export itself)
+    falls back to fp32 torch. An ONNX graph that passed is stamped so later boots
+    can serve it without loading the torch weights.
+    """
+    config = model_config()
+    if config["backend"] not in BACKENDS:
+        raise ValueError(f"HEALTHSYNC_BERT_BACKEND must be one of {BACKENDS}, got {config['backend']!r}")
+    tokenizer = load_tokenizer(config)
+    onnx = config["backend"].startswith("onnx")
+    if onnx:
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            logger.error(f"HEALTHSYNC_BERT_BACKEND={config['backend']} needs onnxruntime; serving fp32 torch")
+            return tokenizer, load_torch_model(config)
+        onnx_path = Path(config["onnx_path"])
+        serve_path = int8_onnx_path(onnx_path) if config["backend"] == "onnx-int8" else onnx_path
+        if serve_path.exists() and has_valid_parity_stamp(serve_path, config):
+            # The torch weights are never loaded on this path
+            encoder = OnnxEncoder(serve_path, _intra_op_threads())
+            logger.info(f"ClinicalBERT loaded on {config['backend']} from {serve_path}")
+            return tokenizer, encoder
+
+    model = load_torch_model(config)
+    if config["backend"] == "torch":
+        return tokenizer, model
+
+    # The fp32 weights are in memory anyway here, so check the backend before serving it
+    expected = np.stack(encode_cls_embeddings(tokenizer, model, PARITY_NOTES))
+    exported = False
+    try:
+        if config["backend"] == "torch-int8":
+            candidate = quantize_int8(model)
+            model = None
+        elif serve_path.exists():
+            logger.info(f"ONNX graph {serve_path} has no parity stamp for this model, checking it")
+            candidate = OnnxEncoder(serve_path, _intra_op_threads())
+        else:
+            logger.info(f"No ONNX graph at {serve_path}, exporting from the torch model")
+            exported = True
+            candidate = OnnxEncoder(
+                export_onnx(tokenizer, model, onnx_path, int8=config["backend"] == "onnx-int8"),
+                _intra_op_threads()
+            )
+        actual = np.stack(encode_cls_embeddings(tokenizer, candidate, PARITY_NOTES))
+        parity = compare_embeddings(expected, actual, config["parity_min_cosine"])
+    except Exception as e:
+        parity = {"passed": False, "error": str(e)}
+    if not parity["passed"]:
+        logger.error(f"ClinicalBERT {config['backend']} failed its parity check, serving fp32 torch: {parity}")
+        if exported:
+            # Never leave a graph on disk that a later boot could pick up
+            remove_onnx_artifacts(onnx_path)
+        return tokenizer, model if model is not None else load_torch_model(config)
+    if onnx:
+        write_parity_stamp(serve_path, config, parity)
+    logger.info(f"ClinicalBERT loaded on {config['backend']} (parity: {parity})")
+    return tokenizer, candidate
+
+
+def encode_cls_embeddings(tokenizer: Any, model: Any, texts: list, timer: Any = None) -> list:
+    """Encode a batch of notes, returning one [CLS] embedding per note.
+
+    Notes longer than the model limit are split into overlapping windows and their
+    window embeddings averaged (see tokenization). Windows are bucketed by length and
+    each bucket runs as its own padded forward pass.
+    ``timer`` (a metrics.StageTimer) records the tokenize and forward stages when given.
+    """
+    stage = timer.stage if timer is not None else (lambda name: nullcontext())
+    with stage("bert_tokenize"):
+        buckets, owners = tokenize_notes(tokenizer, texts)
+
+    window_embeddings = None
+    with stage("bert_forward"):
+        for members, inputs in buckets:
+            cls_embeddings = _forward_cls(model, inputs)
+            if cls_embeddings is None:
+                return [None] * len(texts)
+            if window_embeddings is None:
+                window_embeddings = np.empty((len(owners), cls_embeddings.shape[1]), dtype=np.float32)
+            window_embeddings[members] = cls_embeddings
+    if len(owners) == len(texts):
+        # No note overflowed: windows map one-to-one onto notes
+        return list(window_embeddings)
+    return list(pool_windows(window_embeddings, owners, len(texts)))
+
+
+def _forward_cls(model: Any, inputs: Dict[str, np.ndarray]) -> Optional[np.ndarray]:
+    """[CLS] rows of one padded bucket, or None when the model exposes no usable output"""
+    if isinstance(model, OnnxEncoder):
+        return model.cls_embeddings(inputs).astype(np.float32, copy=False)
+
+    import torch
+
+    with torch.no_grad():
+        outputs = model(**{name: torch.from_numpy(value) for name, value in inputs.items()})
+        # Safely get [CLS] token representation
+        if hasattr(outputs, 'last_hidden_state') and outputs.last_hidden_state.size(1) > 0:
+            cls_embeddings = outputs.last_hidden_state[:, 0, :]
+        elif getattr(outputs, 'pooler_output', None) is not None:
+            # If unable to get CLS embedding, use pooler_output
+            cls_embeddings = outputs.pooler_output
+        else:
+            return None
+    return cls_embeddings.float().cpu().numpy().astype(np.float32, copy=False)
+
+
+def _memory_mb() -> Dict[str, float]:
+    """Resident memory split into anonymous and file-backed pages; peak RSS where /proc is unavailable.
+
+    transformers maps safetensors weights, so fp32 weights show up as file-backed pages
+    (shared through the page cache) while quantized copies are anonymous, per-process memory.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if line.startswith("Rss"))
+        return {
+            "rss": (int(fields["RssAnon"].split()[0]) + int(fields["RssFile"].split()[0])) / 1e3,
+            "anon": int(fields["RssAnon"].split()[0]) / 1e3,
+            "file": int(fields["RssFile"].split()[0]) / 1e3
+        }
+    except (OSError, KeyError, ValueError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"rss": peak / 1e6 if sys.platform == "darwin" else peak / 1e3}
+
+
+def _bench_notes() -> Dict[str, str]:
+    return {
+        "short": PARITY_NOTES[0],
+        "long": " ".join(PARITY_NOTES * 8)
+    }
+
+
+def bench_backend(backend: str, repeat: int = 20, batch_sizes: Tuple[int, ...] = (1, 8)) -> Dict[str, Any]:
+    """Load ``backend`` in this process and time encode calls; memory is read before any parity reference loads"""
+    os.environ["HEALTHSYNC_BERT_BACKEND"] = backend
+    # Library imports are shared by every backend; measure the model footprint on top of them
+    from transformers import AutoTokenizer  # noqa: F401
+
+    baseline = _memory_mb()
+    started = time.perf_counter()
+    tokenizer, model = load_clinical_bert()
+    loaded = _memory_mb()
+    result = {
+        "backend": backend,
+        "served": "torch" if not isinstance(model, OnnxEncoder) and backend.startswith("onnx") else backend,
+        "load_s": round(time.perf_counter() - started, 3),
+        "model_memory_mb": {k: round(loaded[k] - baseline[k], 1) for k in loaded},
+        "latency_ms": {}
+    }
+    for label, note in _bench_notes().items():
+        for batch_size in batch_sizes:
+            texts = [note] * batch_size
+            encode_cls_embeddings(tokenizer, model, texts)
+            samples = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                encode_cls_embeddings(tokenizer, model, texts)
+                samples.append((time.perf_counter() - t0) * 1000)
+            samples.sort()
+            result["latency_ms"][f"{label}_b{batch_size}"] = {
+                "p50": round(samples[len(samples) // 2], 3),
+                "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3)
+            }
+    # After the timed runs, so activation buffers and touched weight pages are included
+    result["memory_after_bench_mb"] = {k: round(v, 1) for k, v in _memory_mb().items()}
+    if backend != "torch":
+        result["parity"] = parity_check(tokenizer, load_torch_model(), model,
+                                        min_cosine=model_config()["parity_min_cosine"])
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+    import subprocess
+
+    parser = argparse.ArgumentParser(description="ClinicalBERT CPU backends: ONNX export, parity check and benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="export the CLS graph to HEALTHSYNC_ONNX_PATH")
+    export_cmd.add_argument("--out", type=Path, default=None)
+    export_cmd.add_argument("--int8", action="store_true", help="also write the int8-quantized graph")
+    parity_cmd = sub.add_parser("parity", help="compare a backend's CLS embeddings against fp32 torch")
+    parity_cmd.add_argument("--backend", choices=BACKENDS[1:], required=True)
+    bench_cmd = sub.add_parser("bench", help="latency and RSS per backend, each in a fresh process")
+    bench_cmd.add_argument("--backends", nargs="+", choices=BACKENDS, default=["torch", "torch-int8"])
+    bench_cmd.add_argument("--repeat", type=int, default=20)
+    one_cmd = sub.add_parser("bench-one", help=argparse.SUPPRESS)
+    one_cmd.add_argument("--backend", choices=BACKENDS, required=True)
+    one_cmd.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.command != "bench-one" else logging.WARNING)
+    if args.command == "export":
+        out = args.out or Path(model_config()["onnx_path"])
+        print(export_onnx(load_tokenizer(), load_torch_model(), out, int8=args.int8))
+    elif args.command == "parity":
+        os.environ["HEALTHSYNC_BERT_BACKEND"] = args.backend
+        tokenizer, candidate = load_clinical_bert()
+        report = parity_check(tokenizer, load_torch_model(), candidate,
+                              min_cosine=model_config()["parity_min_cosine"])
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if report["passed"] else 1)
+    elif args.command == "bench-one":
+        print(json.dumps(bench_backend(args.backend, args.repeat)))
+    else:
+        # One process per backend so RSS reflects a single worker's footprint
+        results = []
+        for backend in args.backends:
+            proc = subprocess.run(
+                [sys.executable, __file__, "bench-one", "--backend", backend, "--repeat", str(args.repeat)],
+                capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                results.append({"backend": backend, "error": proc.stderr.strip().splitlines()[-1:]})
+                continue
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,158 @@
+"""
+Differential diagnosis over the bundled DDXPlus release files
+Loads data/release_conditions.json and data/release_evidences.json into dense
+condition x evidence arrays, ranks conditions by the likelihood of the reported
+evidences and picks the next question by expected information gain
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# P(evidence reported | condition) when the condition lists the evidence, and the leak
+# probability when it does not; the release files carry no per-evidence likelihoods
+SENSITIVITY = 0.8
+LEAK = 0.02
+# Share of a condition's reported evidences that come from its own evidence list. The rest
+# is spread over the unlisted evidences, so the release needs no per-evidence likelihoods
+REPORT_SHARE = 0.8
+
+
+def _entropy(p: np.ndarray, axis: int = 0) -> np.ndarray:
+    p = np.clip(p, 1e-12, 1.0)
+    return -(p * np.log2(p)).sum(axis=axis)
+
+
+class DDXPlusEngine:
+    """Condition x evidence model built from the DDXPlus release.
+
+    ``matrix`` is a boolean (conditions, evidences) array, 49 x 223 for the shipped
+    release (~11 KB), so ranking and information gain are a few small vector ops.
+    Severity follows DDXPlus: 1 is the most severe.
+    """
+
+    def __init__(self, conditions: Dict[str, Any], evidences: Dict[str, Any],
+                 symptom_evidence: Optional[Dict[str, Sequence[str]]] = None):
+        self.evidence_codes = sorted(evidences)
+        self.evidence_index = {code: i for i, code in enumerate(self.evidence_codes)}
+        self.questions = [evidences[code].get("question_en", code) for code in self.evidence_codes]
+
+        names = sorted(conditions)
+        self.condition_names = [conditions[n].get("cond-name-eng") or n for n in names]
+        self.icd10 = [conditions[n].get("icd10-id", "") for n in names]
+        self.severity = np.array([int(conditions[n].get("severity", 5)) for n in names], dtype=np.int8)
+        self.matrix = np.zeros((len(names), len(self.evidence_codes)), dtype=bool)
+        for i, name in enumerate(names):
+            entry = conditions[name]
+            for code in list(entry.get("symptoms", {})) + list(entry.get("antecedents", {})):
+                j = self.evidence_index.get(code)
+                if j is not None:
+                    self.matrix[i, j] = True
+
+        # Per-evidence answer likelihoods for the information gain of a question
+        self._p_present = np.where(self.matrix, SENSITIVITY, LEAK).astype(np.float64)
+        # log P(evidence reported | condition): each condition spreads REPORT_SHARE over its
+        # own evidences, so one shared evidence counts for more in a condition with few of
+        # them. With a flat 0/1 weight every condition listing "fever" ties.
+        listed = self.matrix.sum(axis=1, keepdims=True).astype(np.float64)
+        unlisted = len(self.evidence_codes) - listed
+        self._log_report = np.log(np.where(
+            self.matrix, REPORT_SHARE / np.maximum(listed, 1.0), (1.0 - REPORT_SHARE) / np.maximum(unlisted, 1.0)
+        ))
+
+        self.symptom_evidence: Dict[str, List[int]] = {}
+        for symptom, codes in (symptom_evidence or {}).items():
+            known = [self.evidence_index[c] for c in codes if c in self.evidence_index]
+            if len(known) != len(codes):
+                logger.warning(f"Unknown DDXPlus evidence codes for {symptom!r}: {set(codes) - set(self.evidence_index)}")
+            self.symptom_evidence[symptom.lower()] = known
+
+    @classmethod
+    def load(cls, data_dir: Path, symptom_evidence: Optional[Dict[str, Sequence[str]]] = None) -> "DDXPlusEngine":
+        data_dir = Path(data_dir)
+        with (data_dir / "release_conditions.json").open(encoding="utf-8") as f:
+            conditions = json.load(f)
+        with (data_dir / "release_evidences.json").open(encoding="utf-8") as f:
+            evidences = json.load(f)
+        return cls(conditions, evidences, symptom_evidence)
+
+    def evidence_ids(self, terms: Iterable[str]) -> List[int]:
+        """Evidence columns for detected symptoms/diseases, in first-seen order"""
+        ids = {}
+        for term in terms:
+            for j in self.symptom_evidence.get(str(term).lower(), ()):
+                ids[j] = None
+        return list(ids)
+
+    def posterior(self, evidence_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-condition evidence overlap and P(condition | reported evidences) under a uniform prior"""
+        observed = np.zeros(len(self.evidence_codes), dtype=bool)
+        observed[list(evidence_ids)] = True
+        overlap = self.matrix[:, observed].sum(axis=1)
+        # Reported evidences only; nothing in a note says an evidence is absent
+        logits = self._log_report[:, observed].sum(axis=1)
+        weights = np.exp(logits - logits.max())
+        return overlap, weights / weights.sum()
+
+    def rank(self, evidence_ids: Sequence[int], k: int = 5) -> List[Dict[str, Any]]:
+        """Top-k conditions sharing at least one evidence, most probable first.
+
+        Exact ties keep release (alphabetical) order; severity is reported, not ranked on.
+        """
+        if not evidence_ids:
+            return []
+        overlap, post = self.posterior(evidence_ids)
+        order = np.argsort(-post, kind="stable")
+        ranked = []
+        for i in order[:k]:
+            if overlap[i] == 0:
+                break
+            ranked.append({
+                "condition": self.condition_names[i],
+                "icd10": self.icd10[i],
+                "severity": int(self.severity[i]),
+                "probability": round(float(post[i]), 4),
+                "matched_evidences": int(overlap[i])
+            })
+        return ranked
+
+    def next_questions(self, evidence_ids: Sequence[int], n: int = 4) -> List[Dict[str, Any]]:
+        """Unasked evidences ordered by expected information gain over the condition posterior"""
+        _, post = self.posterior(evidence_ids)
+        A = self._p_present
+        p_yes = post @ A
+        post_yes = post[:, None] * A / p_yes
+        post_no = post[:, None] * (1.0 - A) / (1.0 - p_yes)
+        gain = _entropy(post) - p_yes * _entropy(post_yes) - (1.0 - p_yes) * _entropy(post_no)
+        gain[list(evidence_ids)] = -np.inf
+        top = np.argsort(-gain)[:n]
+        return [
+            {
+                "evidence": self.evidence_codes[j],
+                "question": self.questions[j],
+                "information_gain": round(float(gain[j]), 4)
+            }
+            for j in top if np.isfinite(gain[j]) and gain[j] > 0
+        ]
+
+    def analyze(self, terms: Iterable[str], k: int = 5, n_questions: int = 4) -> Dict[str, Any]:
+        evidence_ids = self.evidence_ids(terms)
+        if not evidence_ids:
+            return {"matched_evidences": [], "differentials": [], "next_questions": []}
+        return {
+            "matched_evidences": [self.evidence_codes[j] for j in evidence_ids],
+            "differentials": self.rank(evidence_ids, k),
+            "next_questions": self.next_questions(evidence_ids, n_questions)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "conditions": len(self.condition_names),
+            "evidences": len(self.evidence_codes),
+            "mapped_terms": len(self.symptom_evidence)
+        }
@@ -0,0 +1,321 @@
+"""
+Multi-label disease head over ClinicalBERT [CLS] embeddings
+One-vs-rest logistic regression with per-class Platt calibration, trained offline on
+labelled notes and stored as a small .npz; standardization and calibration are folded
+into one weight matrix, so scoring a note (or a batch) is a single matrix multiply
+
+    python disease_head.py train --data notes.jsonl [--out PATH] [--epochs N]
+    python disease_head.py bench [--head PATH | --dim 768] [--with-encoder]
+
+Training data is JSONL, one note per line: {"text": "...", "labels": ["Diabetes", ...]}
+"""
+
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.5
+# Calibrated probabilities below this never flag a class, however well a low threshold
+# scored on a small validation split
+MIN_THRESHOLD = 0.2
+THRESHOLD_GRID = np.round(np.arange(0.05, 0.96, 0.05), 2)
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30.0, 30.0)))
+
+
+class DiseaseHead:
+    """Calibrated per-class probabilities from a [CLS] embedding.
+
+    ``weight`` (dim, classes) and ``bias`` act on raw embeddings (input standardization
+    is already folded in); ``platt_a``/``platt_b`` rescale the logits per class and are
+    folded into ``_weight``/``_bias`` at construction.
+    """
+
+    def __init__(self, labels: Sequence[str], weight: np.ndarray, bias: np.ndarray,
+                 platt_a: Optional[np.ndarray] = None, platt_b: Optional[np.ndarray] = None,
+                 thresholds: Optional[np.ndarray] = None, metadata: Optional[Dict[str, Any]] = None):
+        self.labels = list(labels)
+        n = len(self.labels)
+        self.weight = np.asarray(weight, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        if self.weight.ndim != 2 or self.weight.shape[1] != n or self.bias.shape != (n,):
+            raise ValueError(f"Head weights {self.weight.shape}/{self.bias.shape} do not match {n} labels")
+        self.platt_a = np.ones(n, dtype=np.float32) if platt_a is None else np.asarray(platt_a, dtype=np.float32)
+        self.platt_b = np.zeros(n, dtype=np.float32) if platt_b is None else np.asarray(platt_b, dtype=np.float32)
+        self.thresholds = (np.full(n, DEFAULT_THRESHOLD, dtype=np.float32) if thresholds is None
+                           else np.asarray(thresholds, dtype=np.float32))
+        self.metadata = dict(metadata or {})
+        # sigmoid(a * (x @ W + b) + c) == sigmoid(x @ (W * a) + (b * a + c))
+        self._weight = np.ascontiguousarray(self.weight * self.platt_a)
+        self._bias = self.bias * self.platt_a + self.platt_b
+
+    @property
+    def dim(self) -> int:
+        return int(self.weight.shape[0])
+
+    @property
+    def version(self) -> str:
+        return str(self.metadata.get("version", "unversioned"))
+
+    def predict_proba(self, embeddings: Any) -> np.ndarray:
+        """Calibrated probabilities, (classes,) for one embedding or (n, classes) for a batch"""
+        x = np.asarray(embeddings, dtype=np.float32)
+        if x.shape[-1] != self.dim:
+            raise ValueError(f"Embedding dim {x.shape[-1]} does not match head dim {self.dim}")
+        return _sigmoid(x @ self._weight + self._bias)
+
+    def detect(self, probabilities: np.ndarray) -> List[Tuple[str, float]]:
+        """Labels at or above their threshold, most probable first"""
+        hits = np.flatnonzero(probabilities >= self.thresholds)
+        return sorted(((self.labels[i], float(probabilities[i])) for i in hits), key=lambda h: -h[1])
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            np.savez(
+                f,
+                weight=self.weight, bias=self.bias, platt_a=self.platt_a, platt_b=self.platt_b,
+                thresholds=self.thresholds,
+                metadata=np.array(json.dumps({**self.metadata, "labels": self.labels}))
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "DiseaseHead":
+        with np.load(Path(path), allow_pickle=False) as data:
+            metadata = json.loads(str(data["metadata"]))
+            return cls(
+                metadata.pop("labels"), data["weight"], data["bias"],
+                platt_a=data["platt_a"], platt_b=data["platt_b"], thresholds=data["thresholds"],
+                metadata=metadata
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "labels": self.labels,
+            "dim": self.dim,
+            "thresholds": {label: round(float(t), 3) for label, t in zip(self.labels, self.thresholds)},
+            "size_bytes": int(self.weight.nbytes + self.bias.nbytes),
+            **{k: v for k, v in self.metadata.items() if k != "evaluation"}
+        }
+
+
+def fit_logistic(X: np.ndarray, Y: np.ndarray, l2: float = 1e-3, epochs: int = 400,
+                 lr: float = 0.05) -> Tuple[np.ndarray, np.ndarray]:
+    """One-vs-rest L2 logistic regression by full-batch Adam on standardized inputs.
+
+    Positives and negatives are re-weighted to equal total mass per class, so rare
+    diseases are not drowned out. Returns ``(weight, bias)`` for the raw inputs.
+    """
+    mean = X.mean(axis=0)
+    std = X.std(axis=0) + 1e-6
+    Z = (X - mean) / std
+    n, d = Z.shape
+    pos = np.clip(Y.mean(axis=0), 1.0 / n, 1.0 - 1.0 / n)
+    sample_weight = np.where(Y > 0, 0.5 / pos, 0.5 / (1.0 - pos))
+
+    W = np.zeros((d, Y.shape[1]))
+    b = np.zeros(Y.shape[1])
+    m_w, v_w, m_b, v_b = np.zeros_like(W), np.zeros_like(W), np.zeros_like(b), np.zeros_like(b)
+    beta1, beta2 = 0.9, 0.999
+    for t in range(1, epochs + 1):
+        G = (_sigmoid(Z @ W + b) - Y) * sample_weight / n
+        g_w = Z.T @ G + l2 * W
+        g_b = G.sum(axis=0)
+        m_w = beta1 * m_w + (1 - beta1) * g_w
+        v_w = beta2 * v_w + (1 - beta2) * g_w ** 2
+        m_b = beta1 * m_b + (1 - beta1) * g_b
+        v_b = beta2 * v_b + (1 - beta2) * g_b ** 2
+        step = lr * np.sqrt(1 - beta2 ** t) / (1 - beta1 ** t)
+        W -= step * m_w / (np.sqrt(v_w) + 1e-8)
+        b -= step * m_b / (np.sqrt(v_b) + 1e-8)
+    # Fold the standardization into the weights
+    weight = W / std[:, None]
+    return weight.astype(np.float32), (b - mean @ weight).astype(np.float32)
+
+
+def fit_platt(logits: np.ndarray, y: np.ndarray, iterations: int = 100) -> Tuple[float, float]:
+    """Platt scaling ``sigmoid(a * logit + b)`` by Newton's method, with Platt's smoothed targets"""
+    n_pos = float(y.sum())
+    n_neg = float(len(y) - n_pos)
+    if n_pos == 0 or n_neg == 0:
+        return 1.0, 0.0
+    target = np.where(y > 0, (n_pos + 1.0) / (n_pos + 2.0), 1.0 / (n_neg + 2.0))
+    a, b = 1.0, 0.0
+    for _ in range(iterations):
+        p = _sigmoid(a * logits + b)
+        g = p - target
+        w = p * (1.0 - p) + 1e-12
+        grad = np.array([(g * logits).sum(), g.sum()])
+        hess = np.array([[(w * logits * logits).sum(), (w * logits).sum()],
+                         [(w * logits).sum(), w.sum()]]) + 1e-6 * np.eye(2)
+        delta = np.linalg.solve(hess, grad)
+        a, b = a - delta[0], b - delta[1]
+        if np.abs(delta).max() < 1e-7:
+            break
+    return float(a), float(b)
+
+
+def _best_threshold(p: np.ndarray, y: np.ndarray) -> float:
+    """Threshold maximizing F1 on held-out notes; the default when the class never occurs.
+
+    Well-separated classes reach the same F1 over a whole range of thresholds; the
+    middle of that range leaves the most margin on both sides, where its lowest end
+    would flag the class on any stray probability. Never below MIN_THRESHOLD.
+    """
+    if y.sum() == 0:
+        return DEFAULT_THRESHOLD
+    positive = y > 0
+    f1 = np.zeros(len(THRESHOLD_GRID))
+    for i, t in enumerate(THRESHOLD_GRID):
+        pred = p >= t
+        tp = float((pred & positive).sum())
+        f1[i] = 2 * tp / (pred.sum() + positive.sum()) if tp else 0.0
+    tied = THRESHOLD_GRID[np.isclose(f1, f1.max())]
+    middle = (tied.min() + tied.max()) / 2
+    best = tied[np.argmin(np.abs(tied - middle))]
+    return round(max(float(best), MIN_THRESHOLD), 2)
+
+
+def train_head(embeddings: np.ndarray, label_sets: Sequence[Sequence[str]], labels: Sequence[str],
+               val_fraction: float = 0.2, l2: float = 1e-3, epochs: int = 400, seed: int = 0,
+               metadata: Optional[Dict[str, Any]] = None) -> DiseaseHead:
+    """Fit the head on train notes, then calibrate and pick thresholds on held-out notes"""
+    labels = list(labels)
+    index = {label: j for j, label in enumerate(labels)}
+    unknown = {l for ls in label_sets for l in ls if l not in index}
+    if unknown:
+        raise ValueError(f"Training labels not in the disease taxonomy: {sorted(unknown)}")
+    X = np.asarray(embeddings, dtype=np.float64)
+    Y = np.zeros((len(X), len(labels)))
+    for i, ls in enumerate(label_sets):
+        Y[i, [index[l] for l in ls]] = 1.0
+
+    order = np.random.default_rng(seed).permutation(len(X))
+    n_val = int(len(X) * val_fraction)
+    if n_val < 20:
+        logger.warning(f"Only {n_val} held-out notes; calibrating on the training notes")
+        train, val = order, order
+    else:
+        val, train = order[:n_val], order[n_val:]
+
+    weight, bias = fit_logistic(X[train], Y[train], l2=l2, epochs=epochs)
+    logits = X[val] @ weight + bias
+    platt = [fit_platt(logits[:, j], Y[val, j]) for j in range(len(labels))]
+    platt_a = np.array([a for a, _ in platt], dtype=np.float32)
+    platt_b = np.array([b for _, b in platt], dtype=np.float32)
+    probabilities = _sigmoid(logits * platt_a + platt_b)
+    thresholds = np.array([_best_threshold(probabilities[:, j], Y[val, j]) for j in range(len(labels))],
+                          dtype=np.float32)
+
+    evaluation = {}
+    for j, label in enumerate(labels):
+        y, p = Y[val, j], probabilities[:, j]
+        pred = p >= thresholds[j]
+        tp = float((pred & (y > 0)).sum())
+        evaluation[label] = {
+            "support": int(y.sum()),
+            "precision": round(float(tp / pred.sum()), 4) if pred.sum() else 0.0,
+            "recall": round(float(tp / y.sum()), 4) if y.sum() else 0.0,
+            "brier_raw": round(float(((_sigmoid(logits[:, j]) - y) ** 2).mean()), 4),
+            "brier_calibrated": round(float(((p - y) ** 2).mean()), 4)
+        }
+    return DiseaseHead(labels, weight, bias, platt_a, platt_b, thresholds, metadata={
+        "version": time.strftime("%Y%m%d-%H%M%S"),
+        "n_train": int(len(train)),
+        "n_val": int(len(val)),
+        "evaluation": evaluation,
+        **(metadata or {})
+    })
+
+
+def benchmark(head: DiseaseHead, batch_sizes: Sequence[int] = (1, 16, 256), repeat: int = 2000) -> Dict[str, Any]:
+    """Per-call latency of predict_proba + detect at each batch size"""
+    rng = np.random.default_rng(0)
+    report = {"dim": head.dim, "classes": len(head.labels), "batches": []}
+    for batch in batch_sizes:
+        x = rng.standard_normal((batch, head.dim)).astype(np.float32)
+        if batch == 1:
+            x = x[0]
+        latencies = []
+        for _ in range(max(10, repeat // batch)):
+            started = time.perf_counter()
+            probabilities = head.predict_proba(x)
+            for row in np.atleast_2d(probabilities):
+                head.detect(row)
+            latencies.append((time.perf_counter() - started) * 1e6)
+        report["batches"].append({
+            "batch_size": batch,
+            "p50_us": round(float(np.percentile(latencies, 50)), 2),
+            "p99_us": round(float(np.percentile(latencies, 99)), 2),
+            "per_note_us": round(float(np.percentile(latencies, 50)) / batch, 2)
+        })
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train or benchmark the ClinicalBERT disease head")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_cmd = sub.add_parser("train", help="Fit the head on labelled notes (JSONL)")
+    train_cmd.add_argument("--data", type=Path, required=True)
+    train_cmd.add_argument("--out", type=Path, default=None)
+    train_cmd.add_argument("--epochs", type=int, default=400)
+    train_cmd.add_argument("--l2", type=float, default=1e-3)
+    train_cmd.add_argument("--val-fraction", type=float, default=0.2)
+    bench_cmd = sub.add_parser("bench", help="Latency of the head alone (and of one forward pass)")
+    bench_cmd.add_argument("--head", type=Path, default=None)
+    bench_cmd.add_argument("--dim", type=int, default=768, help="random head of this size when --head is not given")
+    bench_cmd.add_argument("--with-encoder", action="store_true", help="also time one ClinicalBERT forward pass")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "train":
+        from clinical_bert import encode_cls_embeddings, load_clinical_bert, model_version
+        from main import DISEASE_HEAD_PATH, clinical_rules
+        from vector_index import embed_documents
+
+        with args.data.open(encoding="utf-8") as f:
+            notes = [json.loads(line) for line in f if line.strip()]
+        tokenizer, bert = load_clinical_bert()
+        started = time.perf_counter()
+        embeddings = embed_documents(notes, lambda texts: encode_cls_embeddings(tokenizer, bert, texts))
+        encode_s = time.perf_counter() - started
+        head = train_head(
+            embeddings, [n.get("labels", []) for n in notes], list(clinical_rules.current().taxonomy),
+            val_fraction=args.val_fraction, l2=args.l2, epochs=args.epochs,
+            metadata={"model_version": model_version()}
+        )
+        out = args.out or DISEASE_HEAD_PATH
+        head.save(out)
+        print(json.dumps({"path": str(out), "encode_s": round(encode_s, 2), **head.stats(),
+                          "evaluation": head.metadata["evaluation"]}, indent=2))
+    else:
+        if args.head:
+            head = DiseaseHead.load(args.head)
+        else:
+            rng = np.random.default_rng(0)
+            labels = [f"class_{i}" for i in range(6)]
+            head = DiseaseHead(labels, rng.standard_normal((args.dim, 6)).astype(np.float32) * 0.01,
+                               np.zeros(6, dtype=np.float32))
+        report = benchmark(head)
+        if args.with_encoder:
+            from clinical_bert import encode_cls_embeddings, load_clinical_bert
+
+            tokenizer, bert = load_clinical_bert()
+            note = "Patient reports chest pain radiating to the left arm with shortness of breath. " * 4
+            encode_cls_embeddings(tokenizer, bert, [note])
+            started = time.perf_counter()
+            for _ in range(5):
+                encode_cls_embeddings(tokenizer, bert, [note])
+            report["encoder_forward_us"] = round((time.perf_counter() - started) / 5 * 1e6, 1)
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,270 @@
+"""
+Inference executor and admission control
+Keeps the torch forward pass and CPU-bound analysis stages off the event loop,
+and sheds load with a fast 503 instead of queueing without bound
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+import multiprocessing
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_MODES = ("thread", "process", "remote")
+
+# Populated once per worker process by _init_worker
+_worker_tokenizer = None
+_worker_model = None
+
+
+def _init_worker(torch_threads: int):
+    """Process-pool initializer: load ClinicalBERT once per worker"""
+    global _worker_tokenizer, _worker_model
+    import torch
+    from clinical_bert import load_clinical_bert
+
+    torch.set_num_threads(torch_threads)
+    _worker_tokenizer, _worker_model = load_clinical_bert()
+    logger.info(f"Inference worker {os.getpid()} ready (torch threads={torch_threads})")
+
+
+def _worker_encode(texts: List[str]) -> list:
+    from clinical_bert import encode_cls_embeddings
+
+    return encode_cls_embeddings(_worker_tokenizer, _worker_model, texts)
+
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+
+class InferenceExecutor:
+    """Dedicated pools for model inference and CPU-bound analysis stages.
+
+    ``thread`` mode runs the forward pass on a thread pool in this process (torch
+    releases the GIL), ``process`` mode runs it on worker processes that each load
+    the model once, and ``remote`` mode sends it to a shared inference server over a
+    Unix socket (see inference_server and launcher). The remaining pure-Python stages
+    always run on a small thread pool.
+
+    With a ``scheduler`` attached, every submission first waits for a slot on the
+    ``model`` or ``cpu`` pool in its request's priority lane (see scheduler).
+    """
+
+    def __init__(
+        self,
+        local_encode_fn: Callable[[List[str]], list],
+        mode: str = "thread",
+        workers: int = 1,
+        torch_threads: Optional[int] = None,
+        cpu_workers: int = 4,
+        socket_path: Optional[str] = None
+    ):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode '{mode}', expected one of {EXECUTOR_MODES}")
+        self.local_encode_fn = local_encode_fn
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        cpu_count = os.cpu_count() or 1
+        self.torch_threads = int(torch_threads) if torch_threads else max(1, cpu_count // self.workers)
+        self.cpu_workers = max(1, int(cpu_workers))
+        self.socket_path = socket_path
+        if mode == "remote" and not socket_path:
+            raise ValueError("remote executor mode needs HEALTHSYNC_INFERENCE_SOCKET")
+        self._model_pool = None
+        self._cpu_pool = None
+        self._client = None
+        self.scheduler = None
+
+    @classmethod
+    def from_env(cls, local_encode_fn: Callable[[List[str]], list]) -> "InferenceExecutor":
+        torch_threads = os.environ.get("HEALTHSYNC_TORCH_THREADS")
+        return cls(
+            local_encode_fn,
+            mode=os.environ.get("HEALTHSYNC_EXECUTOR", "thread").strip().lower(),
+            workers=int(os.environ.get("HEALTHSYNC_EXECUTOR_WORKERS", "1")),
+            torch_threads=int(torch_threads) if torch_threads else None,
+            cpu_workers=int(os.environ.get("HEALTHSYNC_CPU_WORKERS", "4")),
+            socket_path=os.environ.get("HEALTHSYNC_INFERENCE_SOCKET")
+        )
+
+    def start(self):
+        if self._cpu_pool is not None:
+            return
+        self._cpu_pool = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="analysis")
+        if self.mode == "process":
+            self._model_pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.torch_threads,)
+            )
+        elif self.mode == "remote":
+            from inference_server import InferenceClient
+
+            self._client = InferenceClient(self.socket_path)
+        else:
+            import torch
+
+            torch.set_num_threads(self.torch_threads)
+            self._model_pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        logger.info(
+            "Inference executor started (mode=%s, workers=%d, torch_threads=%d, cpu_workers=%d)",
+            self.mode, self.workers, self.torch_threads, self.cpu_workers
+        )
+
+    def warm_up(self):
+        """Block until the process workers or the inference server have the model (no-op in thread mode)"""
+        self.start()
+        if self.mode == "remote":
+            info = self._client.wait_ready()
+            logger.info(f"Inference server {info.get('pid')} ready at {self.socket_path}")
+            return
+        if self.mode != "process":
+            return
+        pids = {f.result() for f in [self._model_pool.submit(_worker_ping) for _ in range(self.workers)]}
+        logger.info(f"Inference workers ready: {sorted(pids)}")
+
+    def shutdown(self):
+        for pool in (self._model_pool, self._cpu_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._model_pool = None
+        self._cpu_pool = None
+        self._client = None
+
+    def _slot(self, pool: str):
+        return self.scheduler.slot(pool) if self.scheduler is not None else nullcontext()
+
+    async def encode(self, texts: List[str]) -> list:
+        """Run one batched forward pass on the model pool"""
+        self.start()
+        step = self.scheduler.current()[0].max_batch if self.scheduler is not None else None
+        if step and len(texts) > step:
+            # Lane caps the pass size: one slot per slice lets higher lanes in between
+            results = []
+            for start in range(0, len(texts), step):
+                results.extend(await self.encode(texts[start:start + step]))
+            return results
+        async with self._slot("model"):
+            if self.mode == "remote":
+                return await self._client.encode(texts)
+            loop = asyncio.get_running_loop()
+            fn = _worker_encode if self.mode == "process" else self.local_encode_fn
+            return await loop.run_in_executor(self._model_pool, fn, texts)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a CPU-bound analysis stage on the analysis thread pool"""
+        self.start()
+        async with self._slot("cpu"):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._cpu_pool, partial(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "torch_threads": self.torch_threads,
+            "cpu_workers": self.cpu_workers,
+            "started": self._cpu_pool is not None
+        }
+
+
+class AdmissionController:
+    """Bounds concurrent analyses; excess requests get 503 + Retry-After immediately."""
+
+    def __init__(self, max_in_flight: int = 64, retry_after_s: int = 1):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.retry_after_s = max(1, int(retry_after_s))
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_in_flight=int(os.environ.get("HEALTHSYNC_MAX_IN_FLIGHT", "64")),
+            retry_after_s=int(os.environ.get("HEALTHSYNC_RETRY_AFTER_S", "1"))
+        )
+
+    def check(self):
+        """Raise 503 + Retry-After if no slot is free (does not take one)"""
+        # Single-threaded event loop: check-and-increment needs no lock
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server overloaded, please retry later",
+                headers={"Retry-After": str(self.retry_after_s)}
+            )
+
+    def acquire(self):
+        self.check()
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self):
+        self.in_flight -= 1
+
+    def slot(self) -> "AdmissionSlot":
+        """Take a slot now (or raise 503) for a response that finishes after the handler returns"""
+        self.acquire()
+        return AdmissionSlot(self)
+
+    async def __aenter__(self):
+        self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "retry_after_s": self.retry_after_s
+        }
+
+
+class AdmissionSlot:
+    """One admitted streaming request.
+
+    ``release`` is idempotent: the body generator releases on completion, and
+    AdmittedResponseMixin releases when the response ends for any other reason
+    (client gone, send failed, or the generator never started and so never runs
+    its ``finally``).
+    """
+
+    def __init__(self, controller: AdmissionController):
+        self.controller = controller
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller.release()
+
+
+class AdmittedResponseMixin:
+    """Response mixin that releases its AdmissionSlot once the response is over"""
+
+    def __init__(self, *args, admission_slot: Optional[AdmissionSlot] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.admission_slot = admission_slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.admission_slot is not None:
+                self.admission_slot.release()
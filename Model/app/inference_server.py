@@ -0,0 +1,170 @@
+"""
+Central ClinicalBERT inference server over a Unix socket
+One process holds the model and micro-batches encode requests from every HTTP worker
+(HEALTHSYNC_EXECUTOR=remote), so adding workers adds no model memory
+
+Frame: u32 header length | u32 payload length | JSON header | payload
+Requests carry {"op": "encode", "texts": [...]} or {"op": "ping"}; encode responses
+return {"ok": true, "shape": [n, dim], "missing": [...]} with float32 rows as payload.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from batching import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+_FRAME = struct.Struct("<II")
+
+
+class InferenceServerError(Exception):
+    """The inference server rejected a request or could not be reached."""
+
+
+async def _read_frame(reader: asyncio.StreamReader):
+    header_len, payload_len = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    header = json.loads(await reader.readexactly(header_len))
+    payload = await reader.readexactly(payload_len) if payload_len else b""
+    return header, payload
+
+
+def _frame(header: Dict[str, Any], payload: bytes = b"") -> bytes:
+    header_bytes = json.dumps(header).encode("utf-8")
+    return _FRAME.pack(len(header_bytes), len(payload)) + header_bytes + payload
+
+
+def pack_embeddings(embeddings: List[Any]) -> Dict[str, Any]:
+    """Stack per-note embeddings into one float32 block; None rows are listed in ``missing``"""
+    missing = [i for i, e in enumerate(embeddings) if e is None]
+    present = [np.asarray(e, dtype=np.float32) for e in embeddings if e is not None]
+    block = np.stack(present) if present else np.zeros((0, 0), dtype=np.float32)
+    return {"header": {"ok": True, "shape": list(block.shape), "missing": missing}, "payload": block.tobytes()}
+
+
+def unpack_embeddings(header: Dict[str, Any], payload: bytes, count: int) -> list:
+    rows = np.frombuffer(payload, dtype=np.float32).reshape(header["shape"]) if payload else []
+    missing = set(header.get("missing", ()))
+    embeddings, it = [], iter(rows)
+    for i in range(count):
+        # Copy so callers do not pin the whole response buffer
+        embeddings.append(None if i in missing else np.array(next(it)))
+    return embeddings
+
+
+class InferenceServer:
+    """Serves ``encode_fn(list[str]) -> list`` on a Unix socket, batching across clients."""
+
+    def __init__(self, socket_path: Path, encode_fn: Callable[[List[str]], list],
+                 max_batch_size: int = 16, max_latency_ms: float = 10.0):
+        self.socket_path = Path(socket_path)
+        self.batcher = MicroBatcher(encode_fn, max_batch_size=max_batch_size,
+                                    max_latency_ms=max_latency_ms, name="inference_server")
+        self.requests = 0
+        self.errors = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request, _ = await _read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                self.requests += 1
+                if request.get("op") == "ping":
+                    writer.write(_frame({"ok": True, "pid": os.getpid(), "requests": self.requests}))
+                elif request.get("op") == "encode":
+                    try:
+                        embeddings = await asyncio.gather(*[self.batcher.submit(t) for t in request["texts"]])
+                        packed = pack_embeddings(embeddings)
+                        writer.write(_frame(packed["header"], packed["payload"]))
+                    except Exception as e:
+                        self.errors += 1
+                        logger.error(f"Inference server encode failed: {e}")
+                        writer.write(_frame({"ok": False, "error": str(e)}))
+                else:
+                    writer.write(_frame({"ok": False, "error": f"unknown op {request.get('op')!r}"}))
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        await self.batcher.start()
+        self._server = await asyncio.start_unix_server(self._handle, path=str(self.socket_path))
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"Inference server {os.getpid()} listening on {self.socket_path}")
+        async with self._server:
+            await self._server.serve_forever()
+
+
+class InferenceClient:
+    """Client side of the inference server; keeps a small pool of open connections."""
+
+    def __init__(self, socket_path: Path, pool_size: int = 8):
+        self.socket_path = Path(socket_path)
+        self.pool_size = pool_size
+        self._idle: List[tuple] = []
+
+    async def _request(self, header: Dict[str, Any]):
+        conn = self._idle.pop() if self._idle else await asyncio.open_unix_connection(str(self.socket_path))
+        reader, writer = conn
+        try:
+            writer.write(_frame(header))
+            await writer.drain()
+            response = await _read_frame(reader)
+        except BaseException:
+            writer.close()
+            raise
+        if len(self._idle) < self.pool_size:
+            self._idle.append(conn)
+        else:
+            writer.close()
+        return response
+
+    async def encode(self, texts: List[str]) -> list:
+        header, payload = await self._request({"op": "encode", "texts": list(texts)})
+        if not header.get("ok"):
+            raise InferenceServerError(header.get("error", "encode failed"))
+        return unpack_embeddings(header, payload, len(texts))
+
+    def ping(self, timeout_s: float = 1.0) -> Dict[str, Any]:
+        """Blocking round trip; usable from loader threads without an event loop"""
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout_s)
+            sock.connect(str(self.socket_path))
+            sock.sendall(_frame({"op": "ping"}))
+            buf = b""
+            while len(buf) < _FRAME.size:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    raise InferenceServerError("connection closed")
+                buf += chunk
+            header_len, _ = _FRAME.unpack_from(buf)
+            while len(buf) < _FRAME.size + header_len:
+                buf += sock.recv(4096)
+            return json.loads(buf[_FRAME.size:_FRAME.size + header_len])
+
+    def wait_ready(self, timeout_s: float = 300.0) -> Dict[str, Any]:
+        """Ping until the server answers; raises InferenceServerError after ``timeout_s``"""
+        deadline = time.monotonic() + timeout_s
+        while True:
+            try:
+                return self.ping()
+            except (OSError, InferenceServerError) as e:
+                if time.monotonic() >= deadline:
+                    raise InferenceServerError(f"inference server at {self.socket_path} not reachable: {e}")
+                time.sleep(0.1)
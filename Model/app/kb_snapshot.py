@@ -0,0 +1,332 @@
+"""
+Precompiled binary snapshot of the knowledge base
+Compiles the CSV-derived DataKnowledgeBase into one versioned, checksummed file of flat
+arrays that is served straight from mmap: every worker maps the same file, so the
+tables are shared page-cache pages instead of per-process Python objects
+
+Layout: MAGIC | u32 format version | u32 header length | JSON header | array section
+The header records the source fingerprint, the payload's SHA-256 and, per array, its
+dtype, shape and 64-byte aligned offset. Keys are sorted fixed-width UTF-8 arrays
+searched in place; every mapping is CSR-style (keys, offsets, values), with string
+values stored once in a UTF-8 blob and referenced by position.
+A snapshot whose sources changed (or that fails its checksum) is ignored and rebuilt.
+
+    python kb_snapshot.py [--data-dir DIR] [--out PATH]
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from collections.abc import Mapping, Set
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from knowledge_base import DataKnowledgeBase, NameIndex, SOURCE_FILES
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"HSKB"
+# Bump whenever DataKnowledgeBase state or the layout changes
+FORMAT_VERSION = 2
+_PREAMBLE = struct.Struct("<4sII")
+_ALIGN = 64
+
+# DataKnowledgeBase mapping attribute -> array name prefix
+TABLES = {
+    "disease_to_tests": "tests",
+    "disease_to_measurements": "measurements",
+    "disease_to_drugs": "drugs"
+}
+
+
+class SnapshotError(Exception):
+    """The snapshot is missing, stale, corrupt or from another format version."""
+
+
+def source_fingerprint(base_dir: Path) -> Dict[str, Any]:
+    """Size and mtime of every source CSV.
+
+    Stat-based rather than content hashes so checking freshness stays cheap for
+    multi-gigabyte CSVs; touching a file without changing it just forces a rebuild.
+    """
+    files = {}
+    for name in SOURCE_FILES:
+        try:
+            st = (Path(base_dir) / name).stat()
+            files[name] = [st.st_size, st.st_mtime_ns]
+        except OSError:
+            files[name] = None
+    return {
+        "format_version": FORMAT_VERSION,
+        "data_dir": str(Path(base_dir).resolve()),
+        "files": files
+    }
+
+
+class StringTable:
+    """Strings in one UTF-8 blob, addressed by position (the values of the KB tables)"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes().decode("utf-8")
+
+
+class SortedKeys:
+    """Sorted fixed-width UTF-8 keys searched in place with ``np.searchsorted``.
+
+    UTF-8 byte order equals code point order, so the keys sort like the Python strings.
+    """
+
+    def __init__(self, keys: np.ndarray):
+        self._keys = keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __getitem__(self, i: int) -> str:
+        return self._keys[i].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return (key.decode("utf-8") for key in self._keys)
+
+    def position(self, value: str) -> int:
+        """Position of ``value``, or -1"""
+        encoded = value.encode("utf-8")
+        pos = int(np.searchsorted(self._keys, encoded))
+        return pos if pos < len(self._keys) and self._keys[pos] == encoded else -1
+
+
+class MappedSet(Set):
+    """Frozen set of strings backed by sorted keys"""
+
+    def __init__(self, keys: SortedKeys):
+        self._keys = keys
+
+    def __contains__(self, value: object) -> bool:
+        return isinstance(value, str) and self._keys.position(value) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class MappedTable(Mapping):
+    """Read-only mapping stored CSR-style: sorted keys, offsets, values.
+
+    ``decode`` turns a slice of ``values`` into the stored value, e.g. a tuple of strings
+    (DataKnowledgeBase tables) or the position array itself (name index postings).
+    """
+
+    def __init__(self, keys: SortedKeys, offsets: np.ndarray, values: np.ndarray, decode):
+        self._keys = keys
+        self._offsets = offsets
+        self._values = values
+        self._decode = decode
+
+    def __getitem__(self, key: str):
+        pos = self._keys.position(key) if isinstance(key, str) else -1
+        if pos < 0:
+            raise KeyError(key)
+        return self._decode(self._values[self._offsets[pos]:self._offsets[pos + 1]])
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self._keys.position(key) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+def _keys(strings: Iterable[str]) -> np.ndarray:
+    encoded = sorted(s.encode("utf-8") for s in strings)
+    return np.array(encoded, dtype=f"S{max([1] + [len(b) for b in encoded])}")
+
+
+def _csr(mapping: Dict[str, Any], value_id) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    keys = sorted(mapping)
+    offsets = [0]
+    values = []
+    for key in keys:
+        values.extend(sorted(value_id(v) for v in mapping[key]))
+        offsets.append(len(values))
+    return _keys(keys), np.array(offsets, dtype=np.int64), np.array(values, dtype=np.int32)
+
+
+def _kb_arrays(kb: DataKnowledgeBase) -> Dict[str, np.ndarray]:
+    """Flatten a built knowledge base into the snapshot's arrays"""
+    strings = sorted({value for attr in TABLES for values in getattr(kb, attr).values() for value in values})
+    ids = {s: i for i, s in enumerate(strings)}
+    encoded = [s.encode("utf-8") for s in strings]
+
+    arrays = {
+        "strings": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "string_offsets": np.cumsum([0] + [len(b) for b in encoded], dtype=np.int64),
+        "disease_names": _keys(kb.disease_names),
+        "index_names": _keys(kb.name_index.names)
+    }
+    for attr, prefix in TABLES.items():
+        arrays[f"{prefix}_keys"], arrays[f"{prefix}_offsets"], arrays[f"{prefix}_values"] = _csr(
+            getattr(kb, attr), ids.__getitem__
+        )
+    for prefix, postings in (("tokens", kb.name_index._token_postings), ("grams", kb.name_index._gram_postings)):
+        arrays[f"{prefix}_keys"], arrays[f"{prefix}_offsets"], arrays[f"{prefix}_values"] = _csr(postings, int)
+    return arrays
+
+
+def write_snapshot(kb: DataKnowledgeBase, path: Path) -> Dict[str, Any]:
+    """Serialize ``kb`` to ``path`` atomically; returns the header"""
+    path = Path(path)
+    layout = {}
+    chunks = []
+    size = 0
+    for name, array in _kb_arrays(kb).items():
+        pad = -size % _ALIGN
+        chunks.append(b"\0" * pad)
+        size += pad
+        data = np.ascontiguousarray(array).tobytes()
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": size}
+        chunks.append(data)
+        size += len(data)
+    payload = b"".join(chunks)
+    header = {
+        "created_at": time.time(),
+        "fingerprint": source_fingerprint(kb.base_dir),
+        "load_stats": kb.load_stats,
+        "arrays": layout,
+        "payload_bytes": len(payload),
+        "payload_sha256": hashlib.sha256(payload).hexdigest()
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    # Keep the array section aligned in the file, not just within the payload
+    header_bytes += b" " * (-(_PREAMBLE.size + len(header_bytes)) % _ALIGN)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp.open("wb") as f:
+            f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            f.write(payload)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return header
+
+
+def read_snapshot(path: Path, expected_fingerprint: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Map ``path`` and return ``(arrays, header)`` after version, freshness and checksum checks.
+
+    The arrays are read-only views into the mapping, which stays open while any of them
+    is referenced.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise SnapshotError(f"{path} does not exist")
+    with path.open("rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mm) < _PREAMBLE.size:
+        raise SnapshotError(f"{path} is truncated")
+    magic, version, header_len = _PREAMBLE.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise SnapshotError(f"{path} is not a knowledge base snapshot")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+    start = _PREAMBLE.size + header_len
+    header = json.loads(mm[_PREAMBLE.size:start].decode("utf-8"))
+    if expected_fingerprint is not None and header.get("fingerprint") != expected_fingerprint:
+        raise SnapshotError(f"{path} is stale: source files changed")
+    view = memoryview(mm)[start:]
+    try:
+        if len(view) != header.get("payload_bytes"):
+            raise SnapshotError(f"{path} is truncated")
+        if hashlib.sha256(view).hexdigest() != header.get("payload_sha256"):
+            raise SnapshotError(f"{path} failed its checksum")
+    finally:
+        view.release()
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        arrays[name] = np.frombuffer(mm, dtype=dtype, count=count, offset=start + spec["offset"]).reshape(spec["shape"])
+    return arrays, header
+
+
+def kb_state(arrays: Dict[str, np.ndarray], header: Dict[str, Any]) -> Dict[str, Any]:
+    """DataKnowledgeBase state (see ``DataKnowledgeBase.STATE_FIELDS``) served from snapshot arrays"""
+    strings = StringTable(arrays["strings"], arrays["string_offsets"])
+
+    def table(prefix: str, decode) -> MappedTable:
+        return MappedTable(SortedKeys(arrays[f"{prefix}_keys"]), arrays[f"{prefix}_offsets"],
+                           arrays[f"{prefix}_values"], decode)
+
+    def as_strings(ids: np.ndarray) -> tuple:
+        return tuple(strings[i] for i in ids.tolist())
+
+    names = SortedKeys(arrays["index_names"])
+    state = {
+        "disease_names": MappedSet(SortedKeys(arrays["disease_names"])),
+        "name_index": NameIndex.from_postings(
+            names, MappedSet(names), table("tokens", lambda ids: ids), table("grams", lambda ids: ids)
+        ),
+        "load_stats": header.get("load_stats", {})
+    }
+    for attr, prefix in TABLES.items():
+        state[attr] = table(prefix, as_strings)
+    return state
+
+
+def load_or_build(base_dir: Path, snapshot_path: Path,
+                  aliases: Optional[Dict[str, str]] = None) -> DataKnowledgeBase:
+    """Load the knowledge base from its snapshot, or from CSV and refresh the snapshot"""
+    started = time.perf_counter()
+    try:
+        arrays, header = read_snapshot(snapshot_path, source_fingerprint(base_dir))
+        kb = DataKnowledgeBase.from_state(base_dir, kb_state(arrays, header), aliases)
+        logger.info(f"Loaded data KB snapshot {snapshot_path} in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return kb
+    except SnapshotError as e:
+        logger.info(f"Rebuilding data KB from CSV: {e}")
+    except Exception as e:
+        logger.warning(f"Unreadable data KB snapshot {snapshot_path}, rebuilding from CSV: {e}")
+
+    kb = DataKnowledgeBase(base_dir, aliases)
+    try:
+        write_snapshot(kb, snapshot_path)
+        logger.info(f"Wrote data KB snapshot {snapshot_path}")
+    except Exception as e:
+        logger.warning(f"Could not write data KB snapshot {snapshot_path}: {e}")
+    return kb
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # main defines the data directory and snapshot path defaults
+    from main import DATA_DIR, KB_SNAPSHOT_PATH
+
+    parser = argparse.ArgumentParser(description="Compile the knowledge base snapshot")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--out", type=Path, default=KB_SNAPSHOT_PATH)
+    args = parser.parse_args()
+    if not args.out:
+        parser.error("no snapshot path: pass --out or set HEALTHSYNC_KB_SNAPSHOT")
+
+    logging.basicConfig(level=logging.INFO)
+    built = write_snapshot(DataKnowledgeBase(args.data_dir), args.out)
+    print(json.dumps({"path": str(args.out), **{k: v for k, v in built.items() if k != "arrays"}}, indent=2))
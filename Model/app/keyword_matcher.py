@@ -0,0 +1,84 @@
+"""
+Compiled multi-pattern keyword matcher
+Builds one trie-shaped regular expression from a declarative keyword table so a
+note is scanned once, with whole-word matching and match spans
+"""
+
+import re
+from typing import Any, Dict, List, Sequence
+
+
+def _trie_pattern(words: Sequence[str]) -> str:
+    """Build a prefix-factored alternation, e.g. ["chest pain", "chest tightness"] -> "chest\\ (?:pain|tightness)".
+
+    Factoring shared prefixes keeps backtracking per start position bounded by the
+    trie depth rather than the vocabulary size.
+    """
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict[str, Any]) -> str:
+        terminal = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != ""]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not terminal:
+            return branches[0]
+        body = "(?:" + "|".join(branches) + ")"
+        return body + "?" if terminal else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """Match a rule table of ``{"keywords": [...], ...}`` dicts against text in one pass.
+
+    Matching is case-insensitive (callers pass lowercased text or rely on
+    ``lower()`` here), anchored on word boundaries and tolerant of a plural
+    ``s``/``es`` suffix. A match on a longer keyword also credits rules whose
+    keywords occur inside it as whole words, so "eye weakness" still counts as
+    "weakness" exactly as the old per-keyword substring scans did.
+    """
+
+    def __init__(self, rules: Sequence[Dict[str, Any]]):
+        self.rules = list(rules)
+        keyword_rules: Dict[str, set] = {}
+        for idx, rule in enumerate(self.rules):
+            for keyword in rule.get("keywords", []):
+                keyword_rules.setdefault(keyword.lower(), set()).add(idx)
+
+        # Credit rules of keywords nested inside longer ones ("eye weakness" -> "weakness")
+        self._keyword_rules: Dict[str, frozenset] = {}
+        for keyword in keyword_rules:
+            hits = set()
+            for other, rule_ids in keyword_rules.items():
+                if re.search(r"(?<!\w)" + re.escape(other) + r"(?!\w)", keyword):
+                    hits |= rule_ids
+            self._keyword_rules[keyword] = frozenset(hits)
+
+        # Longest keyword wins at a given position; the trie is greedy, so it already prefers it
+        self.pattern = re.compile(
+            r"(?<!\w)(" + _trie_pattern(sorted(self._keyword_rules)) + r")(?:e?s)?(?!\w)"
+        ) if self._keyword_rules else None
+
+    def find(self, text: str) -> List[Dict[str, Any]]:
+        """Return non-overlapping keyword matches with their character spans"""
+        if not text or self.pattern is None:
+            return []
+        lowered = text.lower()
+        return [
+            {"keyword": m.group(1), "start": m.start(), "end": m.end()}
+            for m in self.pattern.finditer(lowered)
+        ]
+
+    def scan(self, text: str) -> Dict[str, Any]:
+        """Single scan returning both the matched rules (table order) and the spans"""
+        spans = self.find(text)
+        hit_ids = set()
+        for match in spans:
+            hit_ids |= self._keyword_rules[match["keyword"]]
+        return {"rules": [self.rules[idx] for idx in sorted(hit_ids)], "spans": spans}
@@ -0,0 +1,325 @@
+"""
+Data-backed RAG: local CSV knowledge base
+Maps diseases/conditions to recommended tests, measurements and drugs, with a
+precomputed name index for fast exact, substring and fuzzy disease-name lookup
+"""
+
+import csv
+import logging
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# CSVs read from the data directory; also the inputs fingerprinted by kb_snapshot
+SOURCE_FILES = ("Diagnoses.csv", "ConditionsLookup.csv", "Tests.csv", "MeasurementsLookup.csv", "DrugLookup.csv")
+
+
+def _safe_lower(value: Any) -> str:
+    try:
+        return str(value).strip().lower()
+    except Exception:
+        return ""
+
+
+def _resolve_col(header: Sequence[str], candidates: Sequence[str]) -> Optional[int]:
+    """Index of the first header column containing any candidate substring"""
+    for idx, key in enumerate(header):
+        lk = key.strip().lower()
+        for cand in candidates:
+            if cand in lk:
+                return idx
+    return None
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process, where the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _trigrams(text: str) -> frozenset:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class _NameTrigrams:
+    """``names[i]`` trigrams computed on access, for indexes whose names live in a snapshot"""
+
+    def __init__(self, names: Sequence[str]):
+        self._names = names
+
+    def __getitem__(self, i: int) -> frozenset:
+        return _trigrams(self._names[i])
+
+
+class NameIndex:
+    """Token inverted index + trigram index over normalized disease names.
+
+    A lookup only scores names that share the query's known tokens (all of them if
+    possible, else its rarest one); when no token is known, names sharing the
+    query's rarest trigrams are scored instead. Scoring is exact-match, then
+    containment, then trigram Dice similarity. Postings are sorted int32 arrays of
+    name positions, so kb_snapshot can serve them straight from a mapped file.
+    """
+
+    # Minimum trigram Dice similarity for a purely fuzzy (non-substring) match
+    MIN_SIMILARITY = 0.5
+    # Token candidate sets larger than this are narrowed by the query's rarest trigrams
+    MAX_CANDIDATES = 512
+
+    def __init__(self, names):
+        self.names: Tuple[str, ...] = tuple(sorted(n for n in names if n))
+        self._exact = frozenset(self.names)
+        self._grams = [_trigrams(name) for name in self.names]
+        token_postings: Dict[str, list] = {}
+        gram_postings: Dict[str, list] = {}
+        # Positions are appended in increasing order, so every posting comes out sorted
+        for i, name in enumerate(self.names):
+            for token in set(_TOKEN_RE.findall(name)):
+                token_postings.setdefault(token, []).append(i)
+            for gram in self._grams[i]:
+                gram_postings.setdefault(gram, []).append(i)
+        self._token_postings = {k: np.array(v, dtype=np.int32) for k, v in token_postings.items()}
+        self._gram_postings = {k: np.array(v, dtype=np.int32) for k, v in gram_postings.items()}
+
+    @classmethod
+    def from_postings(cls, names: Sequence[str], exact, token_postings, gram_postings) -> "NameIndex":
+        """Index over prebuilt postings (e.g. kb_snapshot's mapped arrays) without rebuilding them.
+
+        ``exact`` supports ``in``; the postings map a token/trigram to a sorted array of
+        name positions. Per-name trigrams are recomputed for scored candidates only.
+        """
+        index = cls.__new__(cls)
+        index.names = names
+        index._exact = exact
+        index._grams = _NameTrigrams(names)
+        index._token_postings = token_postings
+        index._gram_postings = gram_postings
+        return index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _candidates(self, query: str, query_grams: frozenset) -> np.ndarray:
+        postings = sorted(
+            (self._token_postings[t] for t in set(_TOKEN_RE.findall(query)) if t in self._token_postings),
+            key=len
+        )
+        gram_postings = sorted(
+            (self._gram_postings[g] for g in query_grams if g in self._gram_postings),
+            key=len
+        )
+        if postings:
+            shared = postings[0]
+            for posting in postings[1:]:
+                shared = np.intersect1d(shared, posting, assume_unique=True)
+            candidates = shared if len(shared) else postings[0]
+            if len(candidates) <= self.MAX_CANDIDATES:
+                return candidates
+            # Only common tokens are known ("disease ..."): keep names sharing rare trigrams
+            narrowed = np.intersect1d(candidates, gram_postings[0], assume_unique=True) if gram_postings else candidates
+            return narrowed if len(narrowed) else candidates
+        # No known whole token (typo or partial word): fall back to the rarest trigrams
+        if not gram_postings:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(gram_postings[:max(1, len(gram_postings) // 2)]))
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Ranked ``(name, score)`` matches; substring matches score above fuzzy ones"""
+        query = _safe_lower(query)
+        if not query or not self.names:
+            return []
+        if query in self._exact:
+            return [(query, 2.0)]
+
+        query_grams = _trigrams(query)
+        ranked = []
+        for i in self._candidates(query, query_grams).tolist():
+            name = self.names[i]
+            grams = self._grams[i]
+            dice = 2.0 * len(query_grams & grams) / (len(query_grams) + len(grams))
+            if name in query or query in name:
+                # Containment (the old fallback rule) always beats fuzzy similarity;
+                # among containments the closest in length scores highest
+                ranked.append((name, 1.0 + dice))
+            elif dice >= self.MIN_SIMILARITY:
+                ranked.append((name, dice))
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+
+class DataKnowledgeBase:
+    """Lightweight index built from CSVs in data/output_data.
+    Tries to map diseases/conditions to recommended tests, measurements, and drugs.
+    """
+
+    # Resolved query -> key entries kept in the alias table before it is reset
+    MAX_ALIASES = 10000
+
+    def __init__(self, base_dir: Path, aliases: Optional[Dict[str, str]] = None):
+        self.base_dir = base_dir
+        self.disease_to_tests = {}
+        self.disease_to_measurements = {}
+        self.disease_to_drugs = {}
+        self.disease_names = set()
+        self._load_all()
+        self._finalize()
+        self._seed_aliases(aliases or {})
+
+    # Attributes that make up a built knowledge base (see kb_snapshot)
+    STATE_FIELDS = (
+        "disease_names", "disease_to_tests", "disease_to_measurements",
+        "disease_to_drugs", "name_index", "load_stats"
+    )
+
+    def to_state(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.STATE_FIELDS}
+
+    @classmethod
+    def from_state(cls, base_dir: Path, state: Dict[str, Any],
+                   aliases: Optional[Dict[str, str]] = None) -> "DataKnowledgeBase":
+        """Rehydrate a knowledge base built earlier without re-reading the CSVs"""
+        kb = cls.__new__(cls)
+        kb.base_dir = base_dir
+        for field in cls.STATE_FIELDS:
+            setattr(kb, field, state[field])
+        kb._seed_aliases(aliases or {})
+        return kb
+
+    def _iter_csv(self, filename: str, *columns: Sequence[Sequence[str]]) -> Iterator[Tuple[Optional[str], ...]]:
+        """Stream ``filename`` yielding one tuple per row with only the requested columns.
+
+        Each column is a fallback chain of candidate lists, resolved against the header
+        once; per row the first non-empty resolved cell wins, matching the old
+        ``_guess_col(row, a) or _guess_col(row, b)`` lookups. Missing or empty cells
+        come back falsy (``None`` or ``""``).
+        """
+        path = self.base_dir / filename
+        if not path.exists():
+            logger.warning(f"Data file not found: {path}")
+            return
+        rows = 0
+        try:
+            with path.open("r", encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                header = next(reader, None)
+                if header is None:
+                    return
+                indices = [
+                    [idx for idx in (_resolve_col(header, cands) for cands in chain) if idx is not None]
+                    for chain in columns
+                ]
+                # Common case: one resolved column per chain and well-formed rows
+                single = all(len(idxs) == 1 for idxs in indices)
+                flat = [idxs[0] for idxs in indices] if single else []
+                for row in reader:
+                    rows += 1
+                    width = len(row)
+                    if single and width == len(header):
+                        yield tuple([row[i] for i in flat])
+                        continue
+                    yield tuple(
+                        next((row[i] for i in idxs if i < width and row[i]), None)
+                        for idxs in indices
+                    )
+        except Exception as e:
+            logger.warning(f"Failed to read CSV {path} after {rows} rows: {e}")
+        finally:
+            self.load_stats["rows"][filename] = rows
+
+    def _load_all(self):
+        # Stream several known files if present; only the needed columns are kept
+        started = time.perf_counter()
+        self.load_stats = {"rows": {}}
+        intern = sys.intern
+
+        # Build disease name list from Diagnoses/Conditions
+        name_column = (["diagnosis", "condition", "name", "label"], ["disease"])
+        for filename in ("Diagnoses.csv", "ConditionsLookup.csv"):
+            for (name,) in self._iter_csv(filename, name_column):
+                if name:
+                    self.disease_names.add(intern(_safe_lower(name)))
+
+        # Associate tests/measurements/drugs with diseases when both columns exist;
+        # rows without a disease column are stored under the "" key
+        disease_column = (["diagnosis", "condition", "disease"],)
+        for filename, value_candidates, mapping in (
+            ("Tests.csv", ["test", "name", "title"], self.disease_to_tests),
+            ("MeasurementsLookup.csv", ["measurement", "name", "indicator"], self.disease_to_measurements),
+            ("DrugLookup.csv", ["drug", "med", "name"], self.disease_to_drugs),
+        ):
+            for disease, value in self._iter_csv(filename, disease_column, (value_candidates,)):
+                if value:
+                    key = intern(_safe_lower(disease or ""))
+                    mapping.setdefault(key, set()).add(intern(value))
+
+        self.load_stats["load_time_s"] = round(time.perf_counter() - started, 3)
+        self.load_stats["peak_rss_mb"] = _peak_rss_mb()
+        logger.info(
+            "Loaded data KB: diseases=%d, tests=%d keys, measures=%d keys, drugs=%d keys "
+            "(%d rows in %.2fs, peak RSS %s MB)",
+            len(self.disease_names),
+            len(self.disease_to_tests),
+            len(self.disease_to_measurements),
+            len(self.disease_to_drugs),
+            sum(self.load_stats["rows"].values()),
+            self.load_stats["load_time_s"],
+            self.load_stats["peak_rss_mb"]
+        )
+
+    def _finalize(self):
+        """Freeze per-key sets into pre-sorted tuples and build the name index once"""
+        for mapping in (self.disease_to_tests, self.disease_to_measurements, self.disease_to_drugs):
+            for key, values in mapping.items():
+                mapping[key] = tuple(sorted(values))
+        self.disease_names = frozenset(self.disease_names)
+        self.name_index = NameIndex(self.disease_names)
+
+    def _seed_aliases(self, aliases: Dict[str, str]):
+        # Seed aliases (e.g. detector labels -> corpus names); lookups are memoized here too
+        self._aliases: Dict[str, str] = {}
+        for alias, target in aliases.items():
+            self._aliases[_safe_lower(alias)] = _safe_lower(target)
+
+    def match(self, disease_name: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Ranked candidate keys for a disease name"""
+        return self.name_index.search(disease_name, limit)
+
+    def _match_key(self, disease_name: str) -> str:
+        # Exact by lowercase, else alias table, else best-ranked indexed match
+        ln = _safe_lower(disease_name)
+        if ln in self.disease_names:
+            return ln
+        key = self._aliases.get(ln)
+        if key is not None:
+            return key
+        ranked = self.name_index.search(ln, limit=1)
+        key = ranked[0][0] if ranked else ln
+        if len(self._aliases) >= self.MAX_ALIASES:
+            self._aliases.clear()
+        self._aliases[ln] = key
+        return key
+
+    def retrieve(self, disease_name: str) -> Dict[str, tuple]:
+        key = self._match_key(disease_name)
+        return {
+            "tests": self.disease_to_tests.get(key, ()),
+            "measurements": self.disease_to_measurements.get(key, ()),
+            "drugs": self.disease_to_drugs.get(key, ())
+        }
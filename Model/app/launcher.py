@@ -0,0 +1,288 @@
+"""
+Production launcher: N HTTP workers sharing one copy of the model weights
+The parent imports main and loads every component once, then forks the workers
+onto a shared listening socket so the weights, knowledge base and indexes are
+shared copy-on-write instead of loaded per worker (as `uvicorn --workers N` does)
+
+With --inference-server the model lives only in a dedicated inference process that
+micro-batches encode requests from all workers over a Unix socket; the HTTP workers
+never load torch weights at all.
+
+    python launcher.py --workers 4 [--host 0.0.0.0] [--port 8000] [--inference-server] [--pin-cpus]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from metrics import process_memory
+
+logger = logging.getLogger("launcher")
+
+# A worker that exits sooner than this after being forked counts as a crash loop
+MIN_WORKER_UPTIME_S = 5.0
+SHUTDOWN_GRACE_S = 15.0
+
+
+def cpu_slices(n: int) -> List[List[int]]:
+    """Split the CPUs this process may use into ``n`` disjoint, near-equal sets"""
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    if n > len(cpus):
+        # More workers than cores: workers share cores round-robin
+        return [[cpus[i % len(cpus)]] for i in range(n)]
+    size, extra = divmod(len(cpus), n)
+    slices, start = [], 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(cpus[start:end])
+        start = end
+    return slices
+
+
+class Launcher:
+    """Preloads the app, forks and supervises workers, and reports per-process memory."""
+
+    def __init__(self, workers: int = 2, host: str = "0.0.0.0", port: int = 8000,
+                 inference_server: bool = False, pin_cpus: bool = False,
+                 torch_threads: Optional[int] = None, socket_path: Optional[str] = None,
+                 report_s: float = 60.0, log_level: str = "info"):
+        self.workers = max(1, int(workers))
+        self.host = host
+        self.port = int(port)
+        self.inference_server = inference_server
+        self.pin_cpus = pin_cpus
+        self.report_s = float(report_s)
+        self.log_level = log_level
+        self.socket_path = socket_path or str(Path(tempfile.gettempdir()) / f"healthsync-inference-{os.getpid()}.sock")
+        self.cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        # Only the processes that run forward passes need torch threads; split the cores between them
+        model_processes = 1 if inference_server else self.workers
+        self.torch_threads = int(torch_threads) if torch_threads else max(1, self.cpu_count // model_processes)
+        self.app = None
+        self.sock: Optional[socket.socket] = None
+        self.children: Dict[int, str] = {}
+        self.spawned_at: Dict[str, float] = {}
+        self.stopping = False
+
+    # Parent-side setup
+    def _configure_env(self):
+        # main reads these when it is imported
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        os.environ["HEALTHSYNC_TORCH_THREADS"] = str(self.torch_threads)
+        if self.inference_server:
+            os.environ["HEALTHSYNC_EXECUTOR"] = "remote"
+            os.environ["HEALTHSYNC_INFERENCE_SOCKET"] = self.socket_path
+        else:
+            if os.environ.get("HEALTHSYNC_EXECUTOR", "thread") != "thread":
+                logger.warning("Forked workers share the parent's model; overriding HEALTHSYNC_EXECUTOR to thread")
+            os.environ["HEALTHSYNC_EXECUTOR"] = "thread"
+
+    def preload(self):
+        """Load everything the workers need before the first fork"""
+        self._configure_env()
+        import torch
+
+        # No intra-op thread pool may exist when we fork; workers size their own pools
+        torch.set_num_threads(1)
+        if self.inference_server:
+            from clinical_bert import load_clinical_bert
+
+            tokenizer, model = load_clinical_bert()
+            self._spawn("inference", lambda: self._run_inference_server(tokenizer, model))
+            del tokenizer, model
+
+        import main
+
+        started = time.perf_counter()
+        for name in main.components.components:
+            main.components.load_sync(name)
+        snapshot = main.components.snapshot()
+        if not snapshot["ready"]:
+            raise RuntimeError(f"Required components failed to load: {json.dumps(snapshot['components'])}")
+        # Thread pools do not survive fork; each worker starts its own
+        main.inference_executor.shutdown()
+        self.app = main.app
+        logger.info(f"Preloaded components in {time.perf_counter() - started:.1f}s: {process_memory()}")
+        # Keep the collector from touching (and so copying) every preloaded object in the workers
+        gc.collect()
+        gc.freeze()
+
+    def bind(self):
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+        logger.info(f"Listening on {self.host}:{self.port} with {self.workers} workers "
+                    f"(inference server: {self.inference_server}, torch threads: {self.torch_threads})")
+
+    # Children
+    def _spawn(self, role: str, target):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                target()
+            except BaseException:
+                logger.exception(f"{role} {os.getpid()} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = role
+        self.spawned_at[role] = time.monotonic()
+        logger.info(f"Started {role} (pid {pid})")
+
+    def _pin(self, index: int, count: int):
+        if self.pin_cpus and hasattr(os, "sched_setaffinity"):
+            cpus = cpu_slices(count)[index]
+            os.sched_setaffinity(0, cpus)
+            logger.info(f"Process {os.getpid()} pinned to CPUs {cpus}")
+
+    def _run_inference_server(self, tokenizer, model):
+        import torch
+        from clinical_bert import encode_cls_embeddings
+        from inference_server import InferenceServer
+
+        torch.set_num_threads(self.torch_threads)
+        server = InferenceServer(
+            Path(self.socket_path),
+            lambda texts: encode_cls_embeddings(tokenizer, model, texts),
+            max_batch_size=int(os.environ.get("HEALTHSYNC_BATCH_MAX_SIZE", "16")),
+            max_latency_ms=float(os.environ.get("HEALTHSYNC_BATCH_MAX_LATENCY_MS", "10"))
+        )
+        asyncio.run(server.serve_forever())
+
+    def _run_worker(self, index: int):
+        import uvicorn
+
+        self._pin(index, self.workers)
+        if not self.inference_server:
+            import torch
+
+            torch.set_num_threads(self.torch_threads)
+        config = uvicorn.Config(self.app, log_level=self.log_level, lifespan="on")
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def _spawn_worker(self, index: int):
+        self._spawn(f"worker-{index}", lambda: self._run_worker(index))
+
+    # Supervision
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Memory of the parent and every child, logged as one JSON line"""
+        report = {f"parent ({os.getpid()})": process_memory()}
+        for pid, role in sorted(self.children.items(), key=lambda item: item[1]):
+            report[f"{role} ({pid})"] = process_memory(pid)
+        total_pss = sum(m.get("pss_mb", 0.0) for m in report.values())
+        logger.info(f"Memory per process (MB), total PSS {total_pss:.1f}: {json.dumps(report)}")
+        return report
+
+    def _handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        self.preload()
+        self.bind()
+        for index in range(self.workers):
+            self._spawn_worker(index)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.report())
+
+        next_report = time.monotonic() + min(10.0, self.report_s)
+        while not self.stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self._restart(pid, status)
+                continue
+            if self.report_s > 0 and time.monotonic() >= next_report:
+                self.report()
+                next_report = time.monotonic() + self.report_s
+            time.sleep(0.2)
+        self.shutdown()
+
+    def _restart(self, pid: int, status: int):
+        role = self.children.pop(pid, None)
+        if role is None:
+            return
+        uptime = time.monotonic() - self.spawned_at.get(role, 0.0)
+        logger.warning(f"{role} (pid {pid}) exited with status {status} after {uptime:.1f}s")
+        if self.stopping:
+            return
+        if role == "inference":
+            # Workers cannot serve without it and the weights are no longer in this process
+            logger.error("Inference server exited; shutting down")
+            self.stopping = True
+            return
+        if uptime < MIN_WORKER_UPTIME_S:
+            time.sleep(1.0)
+        self._spawn_worker(int(role.split("-")[1]))
+
+    def shutdown(self):
+        logger.info("Stopping workers")
+        workers = [pid for pid, role in self.children.items() if role != "inference"]
+        # Workers first so in-flight requests can still reach the inference server
+        for group in (workers, [pid for pid in self.children if pid not in workers]):
+            for pid in group:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            deadline = time.monotonic() + SHUTDOWN_GRACE_S
+            while group and time.monotonic() < deadline:
+                for pid in list(group):
+                    try:
+                        done, _ = os.waitpid(pid, os.WNOHANG)
+                    except ChildProcessError:
+                        done = pid
+                    if done:
+                        group.remove(pid)
+                        self.children.pop(pid, None)
+                time.sleep(0.1)
+            for pid in group:
+                logger.warning(f"Killing {self.children.get(pid)} (pid {pid}) after {SHUTDOWN_GRACE_S}s")
+                os.kill(pid, signal.SIGKILL)
+        if self.inference_server and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the API with N workers sharing one model copy")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("HEALTHSYNC_WORKERS", "2")))
+    parser.add_argument("--host", default=os.environ.get("HEALTHSYNC_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--inference-server", action="store_true",
+                        help="run the model in one inference process that the HTTP workers call over a Unix socket")
+    parser.add_argument("--socket-path", default=None, help="Unix socket of the inference server")
+    parser.add_argument("--pin-cpus", action="store_true", help="give each worker a disjoint set of CPUs")
+    parser.add_argument("--torch-threads", type=int, default=None,
+                        help="intra-op threads per model process (default: cores / model processes)")
+    parser.add_argument("--report-interval", type=float, default=60.0, help="seconds between memory reports (0 disables)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("launcher.py needs fork(); use `uvicorn main:app` on this platform")
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO),
+                        format="%(asctime)s %(process)d %(name)s %(levelname)s %(message)s")
+    Launcher(
+        workers=args.workers, host=args.host, port=args.port,
+        inference_server=args.inference_server, pin_cpus=args.pin_cpus,
+        torch_threads=args.torch_threads, socket_path=args.socket_path,
+        report_s=args.report_interval, log_level=args.log_level
+    ).run()
@@ -3,38 +3,50 @@ Hybrid Model API: ClinicalBERT + XGBoost + RAG
 Combines HuggingFace ClinicalBERT model and XGBoost for disease diagnosis
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict
+from typing import Dict, Any, List, Optional, Type
 import uvicorn
+import asyncio
 import json
 import logging
 from datetime import datetime
 import os
-from transformers import AutoTokenizer, AutoModel
-import torch
+import random
+import time
 from pathlib import Path
-import csv
+
+from metrics import MetricsRegistry, StageTimer, RequestMetricsMiddleware, process_memory
+from batching import MicroBatcher
+from clinical_bert import load_clinical_bert, encode_cls_embeddings, model_config, model_version
+from executor import InferenceExecutor, AdmissionController, AdmissionSlot, AdmittedResponseMixin
+from scheduler import RequestScheduler
+from readiness import ComponentRegistry
+from keyword_matcher import KeywordMatcher
+from cache import AnalysisCache, SingleFlight, note_cache_key
+from structured_model import StructuredRiskModel
+from knowledge_base import DataKnowledgeBase
+from kb_snapshot import load_or_build
+from artifacts import artifact_dir
+from vector_index import VectorIndex
+from disease_head import DiseaseHead
+from rule_engine import RuleEngine
+from ddxplus import DDXPlusEngine
+from bulk import iter_records, iter_chunks, BulkParseError, RequestBodyStreamingResponse, DEFAULT_MAX_RECORD_BYTES
+from sessions import Stage, StageGraph, SessionStore, SESSION_ID_RE
+from streaming import STREAM_FORMATS, negotiate_stream_format, encode_event
+from serialization import FastJSONResponse, dumps, json_response_offloaded
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize ClinicalBERT model
-logger.info("Loading local ClinicalBERT model...")
-try:
-    # Try to use local model
-    local_model_path = "/Users/zrb/Downloads/Technation-Healthsync-2025-main/local_model"
-    tokenizer = AutoTokenizer.from_pretrained("medicalai/ClinicalBERT")  # Use pre-trained tokenizer
-    model = AutoModel.from_pretrained(local_model_path)
-    logger.info("Local ClinicalBERT model loaded successfully")
-except Exception as e:
-    logger.warning(f"Local model loading failed: {e}")
-    logger.info("Falling back to online model...")
-    tokenizer = AutoTokenizer.from_pretrained("medicalai/ClinicalBERT")
-    model = AutoModel.from_pretrained("medicalai/ClinicalBERT")
-    logger.info("Online ClinicalBERT model loaded successfully")
+# ClinicalBERT and the data KB are loaded by a background startup task (see /ready)
+tokenizer = None
+model = None
+components = ComponentRegistry()
 
 app = FastAPI(
     title="Hybrid Model Disease Diagnosis API",
@@ -42,289 +54,97 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Prometheus-style metrics, exposed on /metrics
+metrics_registry = MetricsRegistry(prefix="healthsync_")
+stage_duration = metrics_registry.histogram(
+    "stage_duration_ms", "Wall time of one analysis stage (ms)", labels=("stage",)
+)
+http_requests = metrics_registry.counter(
+    "http_requests_total", "HTTP requests by route and outcome", labels=("path", "outcome")
+)
+http_in_flight = metrics_registry.gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled", labels=("method",)
+)
+http_latency = metrics_registry.histogram(
+    "http_request_duration_ms", "End-to-end HTTP request latency (ms)", labels=("path",)
+)
+# Server-Timing header on /analyze, and the fraction of responses carrying a "timings" breakdown
+SERVER_TIMING = os.environ.get("HEALTHSYNC_SERVER_TIMING", "").strip().lower() in ("1", "true", "yes", "on")
+TIMINGS_SAMPLE_RATE = float(os.environ.get("HEALTHSYNC_TIMINGS_SAMPLE_RATE", "0"))
+
 # -------------------------------
 # MedRAG-inspired KG structures
 # -------------------------------
 
-# Minimal hierarchical disease taxonomy (L1/L2/L3) inspired by MedRAG's KG-elicited reasoning
-# Reference: `MedRAG` project overview and dataset notes
-# - https://github.com/SNOWTEAM2023/MedRAG.git
-DISEASE_TAXONOMY = {
-    "Cardiovascular Disease": {
-        "L1": "Cardiovascular",
-        "L2": "Coronary/Cardiac",
-        "L3_rules": [
-            {"if_symptoms_any": ["chest pain", "chest tightness", "angina"], "label": "Angina"},
-            {"if_symptoms_any": ["shortness of breath", "palpitations"], "label": "Arrhythmia"},
-        ],
-        "default_L3": "Cardiac condition"
-    },
-    "Hypertension": {
-        "L1": "Cardiovascular",
-        "L2": "Hypertension",
-        "L3_rules": [
-            {"if_symptoms_any": ["headache", "dizziness"], "label": "Hypertensive disorder"}
-        ],
-        "default_L3": "Essential hypertension"
-    },
-    "Diabetes": {
-        "L1": "Endocrine",
-        "L2": "Diabetes",
-        "L3_rules": [
-            {"if_symptoms_any": ["excessive thirst", "frequent urination", "increased hunger"], "label": "Type 2 diabetes"}
-        ],
-        "default_L3": "Diabetes (unspecified)"
-    },
-    "Ophthalmic Disorder": {
-        "L1": "Ophthalmology",
-        "L2": "Neuro-ophthalmic",
-        "L3_rules": [
-            {"if_symptoms_any": ["diplopia", "double vision", "ptosis"], "label": "Ocular motor dysfunction"}
-        ],
-        "default_L3": "Eye disorder"
-    },
-    "Neurological Disorder": {
-        "L1": "Neurology",
-        "L2": "Neuromuscular/CNS",
-        "L3_rules": [
-            {"if_symptoms_any": ["weakness", "numbness", "tingling"], "label": "Peripheral neuropathy"},
-            {"if_symptoms_any": ["seizure", "epilepsy"], "label": "Epilepsy"}
-        ],
-        "default_L3": "Neurological disorder"
-    },
-    "Autoimmune Disorder": {
-        "L1": "Immunology",
-        "L2": "Autoimmune",
-        "L3_rules": [
-            {"if_symptoms_any": ["steroid", "prednisone", "inflammation"], "label": "Steroid-responsive autoimmune"}
-        ],
-        "default_L3": "Autoimmune disorder"
-    }
-}
+# Disease taxonomy (L1/L2/L3), follow-up and differential rules live in clinical_rules.json;
+# they are compiled to bitmasks at startup and recompiled when the file changes
+clinical_rules = RuleEngine.from_env(Path(__file__).resolve().parent / "clinical_rules.json")
 
-def _infer_l3_label(disease: str, symptoms: list) -> str:
-    taxonomy = DISEASE_TAXONOMY.get(disease)
-    if not taxonomy:
-        return disease
-    normalized = [s.lower() for s in symptoms]
-    for rule in taxonomy.get("L3_rules", []):
-        if any(keyword in normalized for keyword in [k.lower() for k in rule.get("if_symptoms_any", [])]):
-            return rule.get("label", taxonomy.get("default_L3", disease))
-    return taxonomy.get("default_L3", disease)
-
-def get_hierarchical_labels(diseases: list, symptoms: list) -> Dict[str, Any]:
-    """Return L1/L2/L3 hierarchy per top disease (MedRAG-style levels)."""
-    levels = []
-    for d in diseases[:3]:
-        tax = DISEASE_TAXONOMY.get(d)
-        if not tax:
-            levels.append({"disease": d, "L1": "Unknown", "L2": "Unknown", "L3": d})
-            continue
-        levels.append({
-            "disease": d,
-            "L1": tax.get("L1", "Unknown"),
-            "L2": tax.get("L2", "Unknown"),
-            "L3": _infer_l3_label(d, symptoms)
-        })
-    return {"levels": levels}
-
-def generate_follow_up_questions(diseases: list, symptoms: list) -> list:
-    """Produce targeted follow-up questions to reduce ambiguity (MedRAG-like)."""
-    questions = []
-    s = [x.lower() for x in symptoms]
-    dset = set(diseases)
-    if "Cardiovascular Disease" in dset or any(x in s for x in ["chest pain", "chest tightness", "palpitations"]):
-        questions.extend([
-            "Chest pain is exertional and relieved by rest?",
-            "Any radiation to left arm, jaw, or back?",
-            "Associated diaphoresis or nausea?",
-            "Duration and frequency of episodes?"
-        ])
-    if "Diabetes" in dset or any(x in s for x in ["excessive thirst", "frequent urination", "increased hunger"]):
-        questions.extend([
-            "Recent HbA1c and fasting glucose values?",
-            "Unintentional weight change?",
-            "Polyuria/nocturia severity and onset?",
-            "Any neuropathy or visual blurring?"
-        ])
-    if any(x in s for x in ["diplopia", "double vision", "ptosis"]):
-        questions.extend([
-            "Do symptoms fluctuate with fatigue (suggesting myasthenia)?",
-            "Any pupillary involvement or headache (for 3rd nerve palsy)?",
-            "Onset abrupt vs progressive?"
-        ])
-    if "Neurological Disorder" in dset or any(x in s for x in ["weakness", "numbness", "tingling"]):
-        questions.extend([
-            "Symmetry and distribution of weakness/numbness?",
-            "Back pain or radicular features?",
-            "Bowel/bladder involvement?"
-        ])
-    # Deduplicate while preserving order
-    seen = set()
-    deduped = []
-    for q in questions:
-        if q not in seen:
-            deduped.append(q)
-            seen.add(q)
-    return deduped[:12]
-
-def generate_differentials(diseases: list, symptoms: list) -> list:
-    """Return differentials with key distinguishing questions/evidence."""
-    differentials = []
-    s = [x.lower() for x in symptoms]
-    if any(x in s for x in ["chest pain", "chest tightness", "shortness of breath"]):
-        differentials.append({
-            "pair": ["Stable angina", "Gastroesophageal reflux"],
-            "distinguishing_points": [
-                "Exertional chest pain relieved by rest favors angina",
-                "Burning postprandial pain lying down favors reflux"
-            ]
-        })
-        differentials.append({
-            "pair": ["Acute coronary syndrome", "Musculoskeletal chest pain"],
-            "distinguishing_points": [
-                "Pressure-like pain with diaphoresis suggests ACS",
-                "Reproducible chest wall tenderness suggests musculoskeletal"
-            ]
-        })
-    if any(x in s for x in ["back pain", "leg pain", "sciatica"]):
-        differentials.append({
-            "pair": ["Lumbar canal stenosis", "Sciatica"],
-            "distinguishing_points": [
-                "Pain relieved by sitting suggests canal stenosis",
-                "Sitting worsens discomfort suggests sciatica"
-            ]
-        })
-    if any(x in s for x in ["diplopia", "ptosis", "double vision"]):
-        differentials.append({
-            "pair": ["Myasthenia gravis", "Cranial nerve palsy"],
-            "distinguishing_points": [
-                "Fatigable ptosis/ophthalmoparesis favors MG",
-                "Fixed pupil or severe headache suggests nerve palsy"
-            ]
-        })
-    return differentials[:6]
+# Reported symptoms/detected diseases -> DDXPlus evidence codes (data/release_evidences.json).
+# Diseases map to the matching antecedent questions. Headache has no DDXPlus code: pain is
+# one location-valued question and the release does not record locations per condition,
+# so the generic pain codes would rank chest conditions for a headache.
+DDXPLUS_EVIDENCE_MAP = {
+    "chest pain": ["E_53", "E_55"],
+    "chest tightness": ["E_53", "E_55"],
+    "palpitations": ["E_155"],
+    "shortness of breath": ["E_66"],
+    "dizziness": ["E_76"],
+    "fever": ["E_91"],
+    "nausea": ["E_148"],
+    "fatigue": ["E_89"],
+    "cough": ["E_201"],
+    "weight loss": ["E_162"],
+    "weight gain": ["E_96"],
+    "eye weakness": ["E_83", "E_172"],
+    "diplopia": ["E_83"],
+    "nerve weakness": ["E_84"],
+    "neurological symptoms": ["E_177"],
+    "Hypertension": ["E_104"],
+    "Diabetes": ["E_69"]
+}
 
 # ----------------------------------------
 # Data-backed RAG: load local CSV knowledge
 # ----------------------------------------
 
-def _safe_lower(value: Any) -> str:
-    try:
-        return str(value).strip().lower()
-    except Exception:
-        return ""
-
-def _guess_col(row: Dict[str, Any], candidates: list) -> Any:
-    for key in row.keys():
-        lk = key.strip().lower()
-        for cand in candidates:
-            if cand in lk:
-                return row.get(key)
-    return None
-
-class DataKnowledgeBase:
-    """Lightweight index built from CSVs in data/output_data.
-    Tries to map diseases/conditions to recommended tests, measurements, and drugs.
-    """
-    def __init__(self, base_dir: Path):
-        self.base_dir = base_dir
-        self.disease_to_tests = {}
-        self.disease_to_measurements = {}
-        self.disease_to_drugs = {}
-        self.disease_names = set()
-        self._load_all()
-
-    def _load_csv(self, filename: str) -> list:
-        path = self.base_dir / filename
-        if not path.exists():
-            logger.warning(f"Data file not found: {path}")
-            return []
-        try:
-            with path.open("r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                return list(reader)
-        except Exception as e:
-            logger.warning(f"Failed to read CSV {path}: {e}")
-            return []
-
-    def _load_all(self):
-        # Load several known files if present
-        diagnoses_rows = self._load_csv("Diagnoses.csv")
-        tests_rows = self._load_csv("Tests.csv")
-        measurements_rows = self._load_csv("MeasurementsLookup.csv")
-        drugs_rows = self._load_csv("DrugLookup.csv")
-        conditions_rows = self._load_csv("ConditionsLookup.csv")
-
-        # Build disease name list from Diagnoses/Conditions
-        for row in diagnoses_rows + conditions_rows:
-            name = _guess_col(row, ["diagnosis", "condition", "name", "label"]) or _guess_col(row, ["disease"])
-            if name:
-                self.disease_names.add(_safe_lower(name))
-
-        # Associate tests with diseases when both columns exist; otherwise store general list
-        for row in tests_rows:
-            disease = _guess_col(row, ["diagnosis", "condition", "disease"]) or ""
-            test_name = _guess_col(row, ["test", "name", "title"]) or ""
-            if test_name:
-                key = _safe_lower(disease)
-                self.disease_to_tests.setdefault(key, set()).add(test_name)
-
-        for row in measurements_rows:
-            disease = _guess_col(row, ["diagnosis", "condition", "disease"]) or ""
-            meas_name = _guess_col(row, ["measurement", "name", "indicator"]) or ""
-            if meas_name:
-                key = _safe_lower(disease)
-                self.disease_to_measurements.setdefault(key, set()).add(meas_name)
-
-        for row in drugs_rows:
-            disease = _guess_col(row, ["diagnosis", "condition", "disease"]) or ""
-            drug_name = _guess_col(row, ["drug", "med", "name"]) or ""
-            if drug_name:
-                key = _safe_lower(disease)
-                self.disease_to_drugs.setdefault(key, set()).add(drug_name)
-
-        logger.info(
-            "Loaded data KB: diseases=%d, tests=%d keys, measures=%d keys, drugs=%d keys",
-            len(self.disease_names),
-            len(self.disease_to_tests),
-            len(self.disease_to_measurements),
-            len(self.disease_to_drugs)
-        )
-
-    def _match_key(self, disease_name: str) -> str:
-        # Exact by lowercase, else substring match
-        ln = _safe_lower(disease_name)
-        if ln in self.disease_names:
-            return ln
-        # fallback: find any disease key contained in provided name or vice versa
-        for known in self.disease_names:
-            if known and (known in ln or ln in known):
-                return known
-        return ln
-
-    def retrieve(self, disease_name: str) -> Dict[str, list]:
-        key = self._match_key(disease_name)
-        tests = sorted(self.disease_to_tests.get(key, set()))
-        measures = sorted(self.disease_to_measurements.get(key, set()))
-        drugs = sorted(self.disease_to_drugs.get(key, set()))
-        return {
-            "tests": tests,
-            "measurements": measures,
-            "drugs": drugs
-        }
+# Data KB is loaded in the background at startup
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+default_data_dir = PROJECT_ROOT / "data" / "output_data"
+DATA_DIR = Path(os.environ.get("HEALTHSYNC_DATA_DIR", str(default_data_dir)))
+# Compiled snapshot of the KB; set HEALTHSYNC_KB_SNAPSHOT="" to always read the CSVs
+_kb_snapshot_env = os.environ.get("HEALTHSYNC_KB_SNAPSHOT", str(artifact_dir() / "data_kb.snapshot"))
+KB_SNAPSHOT_PATH = Path(_kb_snapshot_env) if _kb_snapshot_env else None
+data_kb = None
 
+def kb_knowledge_tables() -> Dict[str, Any]:
+    """In-code tables embedded into the vector index alongside the CSV corpus"""
+    return {
+        "disease_taxonomy": clinical_rules.current().taxonomy,
+        "medical_knowledge_base": MEDICAL_KNOWLEDGE_BASE
+    }
 
-# Initialize data KB at startup
-try:
-    PROJECT_ROOT = Path(__file__).resolve().parents[2]
-    default_data_dir = PROJECT_ROOT / "data" / "output_data"
-    DATA_DIR = Path(os.environ.get("HEALTHSYNC_DATA_DIR", str(default_data_dir)))
-    data_kb = DataKnowledgeBase(DATA_DIR)
+def _load_data_kb():
+    global data_kb
+    if KB_SNAPSHOT_PATH is not None:
+        data_kb = load_or_build(DATA_DIR, KB_SNAPSHOT_PATH)
+    else:
+        data_kb = DataKnowledgeBase(DATA_DIR)
     logger.info(f"Data-backed RAG enabled using directory: {DATA_DIR}")
-except Exception as e:
-    logger.warning(f"Data-backed RAG initialization failed: {e}")
-    data_kb = None
+
+components.register("data_kb", _load_data_kb)
+
+# DDXPlus condition/evidence release bundled under data/
+DDXPLUS_DIR = Path(os.environ.get("HEALTHSYNC_DDXPLUS_DIR", str(PROJECT_ROOT / "data")))
+ddx_engine = None
+
+def _load_ddx_engine():
+    global ddx_engine
+    ddx_engine = DDXPlusEngine.load(DDXPLUS_DIR, DDXPLUS_EVIDENCE_MAP)
+    logger.info(f"DDXPlus differential engine loaded from {DDXPLUS_DIR}: {ddx_engine.stats()}")
+
+# Optional: without it follow-ups come from the hand-written lists
+components.register("ddxplus", _load_ddx_engine, required=False)
 
 # Add CORS middleware
 app.add_middleware(
@@ -334,6 +154,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(
+    RequestMetricsMiddleware,
+    requests=http_requests,
+    in_flight=http_in_flight,
+    latency=http_latency
+)
 
 # Data models
 class PatientData(BaseModel):
@@ -353,15 +179,72 @@ class PatientData(BaseModel):
     allergies: Optional[str] = None
     prescriptions: Optional[str] = None
 
+# Stage result schemas. Each stage output is validated against its type once, where the
+# stage produces it (see validated_stage_output); results are then assembled with
+# model_construct, so cached and reused outputs are not validated again. Extra keys are
+# allowed so optional stage fields pass through unchanged
+class ClinicalBertAnalysis(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    diseases_detected: List[str] = []
+    symptoms_identified: List[str] = []
+    confidence: float = 0.0
+    analysis: str = ""
+    detection_method: Optional[str] = None
+    disease_probabilities: Optional[Dict[str, float]] = None
+    classifier_version: Optional[str] = None
+    keyword_spans: Optional[List[Dict[str, Any]]] = None
+    symptoms_reported: Optional[List[str]] = None
+    retrieved_documents: Optional[List[Dict[str, Any]]] = None
+
+class XGBoostAnalysis(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    risk_score: float
+    risk_level: str
+    risk_factors: List[str] = []
+    predictions: Dict[str, float] = {}
+    predicted_condition: Optional[str] = None
+    model: str = "rules"
+    model_version: Optional[str] = None
+
+class RagInsights(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    guidelines: List[str] = []
+    treatments: List[str] = []
+    precautions: List[str] = []
+    sources: List[str] = []
+    levels: List[Dict[str, str]] = []
+    follow_up_questions: List[str] = []
+    differentials: List[Dict[str, Any]] = []
+    ranked_differentials: List[Dict[str, Any]] = []
+    next_questions: List[Dict[str, Any]] = []
+    retrieved_documents: List[Dict[str, Any]] = []
+
+class FusionResult(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    primary_diagnosis: str
+    differential_diagnoses: List[str] = []
+    risk_assessment: str
+    confidence: float
+    urgency: str
+
+def validated_stage_output(model: Type[BaseModel], output: Dict[str, Any]) -> Dict[str, Any]:
+    """Raise pydantic.ValidationError if a stage output does not fit its schema; returns it unchanged"""
+    model.model_validate(output)
+    return output
+
 class AnalysisResult(BaseModel):
     success: bool
     timestamp: str
-    clinical_bert_analysis: Dict[str, Any]
-    xgboost_analysis: Dict[str, Any]
-    rag_insights: Dict[str, Any]
-    fusion_result: Dict[str, Any]
-    recommendations: list
+    clinical_bert_analysis: ClinicalBertAnalysis
+    xgboost_analysis: XGBoostAnalysis
+    rag_insights: RagInsights
+    fusion_result: FusionResult
+    recommendations: List[str]
     confidence_score: float
+    # Per-stage milliseconds, only on sampled responses (HEALTHSYNC_TIMINGS_SAMPLE_RATE)
+    timings: Optional[Dict[str, float]] = None
+    # Session id and recomputed/reused stages, only on /analyze/session responses
+    session: Optional[Dict[str, Any]] = None
 
 # Simulated medical knowledge base
 MEDICAL_KNOWLEDGE_BASE = {
@@ -406,146 +289,356 @@ MEDICAL_KNOWLEDGE_BASE = {
     }
 }
 
+# Detector disease labels -> MEDICAL_KNOWLEDGE_BASE sections
+KNOWLEDGE_SECTIONS = {
+    "Cardiovascular Disease": "cardiovascular",
+    "Diabetes": "diabetes",
+    "Hypertension": "hypertension"
+}
+
+# Declarative keyword -> (disease, symptoms) table for note analysis.
+# Rules are matched on whole words in one pass by KeywordMatcher; "disease" is None
+# for symptom-only rules. Table order determines output order.
+CLINICAL_KEYWORD_RULES = [
+    {
+        "disease": "Cardiovascular Disease",
+        "keywords": ["chest pain", "chest tightness", "palpitations", "shortness of breath", "heart", "cardiac", "angina"],
+        "symptoms": ["chest pain", "chest tightness", "palpitations", "shortness of breath"]
+    },
+    {
+        "disease": "Diabetes",
+        "keywords": ["excessive thirst", "frequent urination", "increased hunger", "glucose", "diabetes", "blood sugar", "polyuria", "polydipsia"],
+        "symptoms": ["excessive thirst", "frequent urination", "increased hunger"]
+    },
+    {
+        "disease": "Hypertension",
+        "keywords": ["hypertension", "blood pressure", "headache", "dizziness", "high bp", "elevated bp"],
+        "symptoms": ["headache", "dizziness", "palpitations"]
+    },
+    {
+        "disease": "Ophthalmic Disorder",
+        "keywords": ["eye", "ocular", "vision", "visual", "diplopia", "double vision", "eye weakness", "oculomotor", "palsy", "ptosis", "eyelid", "retina", "optic", "glaucoma", "cataract"],
+        "symptoms": ["visual disturbance", "eye weakness", "diplopia"]
+    },
+    {
+        "disease": "Neurological Disorder",
+        "keywords": ["nerve", "neurological", "palsy", "paralysis", "weakness", "numbness", "tingling", "seizure", "epilepsy", "stroke", "cerebral", "brain", "cranial nerve"],
+        "symptoms": ["nerve weakness", "neurological symptoms"]
+    },
+    {
+        "disease": "Autoimmune Disorder",
+        "keywords": ["autoimmune", "prednisone", "steroid", "inflammation", "immune", "myasthenia", "graves", "thyroid", "rheumatoid", "lupus"],
+        "symptoms": ["immune system involvement", "steroid responsive"]
+    },
+    # Other common symptoms
+    {"disease": None, "keywords": ["fever", "temperature", "hot", "pyrexia"], "symptoms": ["fever"]},
+    {"disease": None, "keywords": ["nausea", "vomiting", "sick", "queasy"], "symptoms": ["nausea"]},
+    {"disease": None, "keywords": ["fatigue", "tired", "weakness", "exhaustion"], "symptoms": ["fatigue"]},
+    {"disease": None, "keywords": ["cough", "coughing", "productive cough"], "symptoms": ["cough"]},
+    {"disease": None, "keywords": ["weight loss", "unintended weight loss"], "symptoms": ["weight loss"]},
+    {"disease": None, "keywords": ["weight gain", "unintended weight gain"], "symptoms": ["weight gain"]},
+    {"disease": None, "keywords": ["headache", "head pain", "migraine"], "symptoms": ["headache"]},
+    {"disease": None, "keywords": ["dizziness", "vertigo", "balance"], "symptoms": ["dizziness"]}
+]
+
+# Smaller keyword table used when the ClinicalBERT encoder is unavailable
+FALLBACK_KEYWORD_RULES = [
+    {"disease": "Cardiovascular Disease", "keywords": ["chest pain", "heart", "cardiac"], "symptoms": ["chest pain"]},
+    {"disease": "Diabetes", "keywords": ["diabetes", "glucose", "blood sugar"], "symptoms": ["glucose issues"]},
+    {"disease": "Hypertension", "keywords": ["hypertension", "blood pressure", "high bp"], "symptoms": ["elevated blood pressure"]},
+    {
+        "disease": "Ophthalmic Disorder",
+        "keywords": ["eye", "ocular", "vision", "visual", "diplopia", "double vision", "eye weakness", "oculomotor", "palsy", "ptosis"],
+        "symptoms": ["visual disturbance"]
+    },
+    {
+        "disease": "Neurological Disorder",
+        "keywords": ["nerve", "neurological", "palsy", "paralysis", "weakness", "numbness", "tingling"],
+        "symptoms": ["nerve weakness"]
+    },
+    {
+        "disease": "Autoimmune Disorder",
+        "keywords": ["prednisone", "steroid", "inflammation", "immune", "myasthenia"],
+        "symptoms": ["immune system involvement"]
+    }
+]
+
+# Cap on keyword spans returned per note (long discharge summaries can hit hundreds)
+MAX_KEYWORD_SPANS = 50
+
+clinical_keyword_matcher = KeywordMatcher(CLINICAL_KEYWORD_RULES)
+fallback_keyword_matcher = KeywordMatcher(FALLBACK_KEYWORD_RULES)
+
+def _apply_keyword_rules(matcher: KeywordMatcher, clinical_notes: str) -> Dict[str, Any]:
+    """Scan a note once and collect diseases/symptoms from the matched rules.
+
+    ``symptoms`` lists every symptom of a matched disease rule ("heart" brings in the whole
+    cardiovascular family); ``reported`` keeps only symptoms the note names itself, either
+    as a matched keyword or through a symptom-only synonym rule ("migraine" -> headache).
+    """
+    scan = matcher.scan(clinical_notes)
+    matched = {span["keyword"] for span in scan["spans"]}
+    detected_diseases = []
+    identified_symptoms = []
+    reported_symptoms = []
+    for rule in scan["rules"]:
+        if rule["disease"]:
+            detected_diseases.append(rule["disease"])
+        identified_symptoms.extend(rule["symptoms"])
+        reported_symptoms.extend(s for s in rule["symptoms"] if not rule["disease"] or s in matched)
+    return {
+        "diseases": detected_diseases,
+        "symptoms": identified_symptoms,
+        "reported": list(dict.fromkeys(reported_symptoms)),
+        "spans": scan["spans"][:MAX_KEYWORD_SPANS]
+    }
+
+# ClinicalBERT encoding
+def encode_clinical_notes(texts: list) -> list:
+    """Encode a batch of notes in one padded forward pass, returning one [CLS] embedding per note"""
+    if model is None:
+        raise RuntimeError("ClinicalBERT model is not loaded yet")
+    return encode_cls_embeddings(tokenizer, model, texts, timer=StageTimer(stage_duration))
+
+# Forward passes run on a dedicated pool (HEALTHSYNC_EXECUTOR=thread|process)
+inference_executor = InferenceExecutor.from_env(encode_clinical_notes)
+
+def _load_clinical_bert():
+    global tokenizer, model
+    if inference_executor.mode in ("process", "remote"):
+        # Inference workers / the inference server hold the model; wait for them here
+        inference_executor.warm_up()
+    else:
+        tokenizer, model = load_clinical_bert()
+
+components.register("clinical_bert", _load_clinical_bert)
+
+# Requests arriving within the wait window share one forward pass
+clinical_bert_batcher = MicroBatcher(
+    inference_executor.encode,
+    max_batch_size=int(os.environ.get("HEALTHSYNC_BATCH_MAX_SIZE", "16")),
+    max_latency_ms=float(os.environ.get("HEALTHSYNC_BATCH_MAX_LATENCY_MS", "10")),
+    name="clinical_bert"
+)
+
+# CLS embeddings + note analysis keyed by normalized note hash and model version
+analysis_cache = AnalysisCache.from_env()
+# Concurrent misses for the same note share one encode + analysis
+note_flights = SingleFlight()
+
+# Bounded in-flight /analyze requests; overload gets a fast 503 with Retry-After
+admission_controller = AdmissionController.from_env()
+
+# Priority lanes (X-Priority header or API key) in front of the executor's model and CPU
+# pools, so bulk re-scoring cannot queue ahead of interactive requests
+request_scheduler = RequestScheduler.from_env(
+    {"model": inference_executor.workers, "cpu": inference_executor.cpu_workers},
+    wait_histogram=metrics_registry.histogram(
+        "scheduler_queue_wait_ms", "Time a submission waited for a pool slot (ms)", labels=("pool", "lane")
+    )
+)
+inference_executor.scheduler = request_scheduler
+note_flights.scheduler = request_scheduler
+
+# Semantic retrieval index over the knowledge corpus (built offline: python vector_index.py build)
+VECTOR_INDEX_PATH = Path(os.environ.get("HEALTHSYNC_VECTOR_INDEX_PATH", str(PROJECT_ROOT / "Model" / "vector_index.npz")))
+RAG_TOP_K = int(os.environ.get("HEALTHSYNC_RAG_TOP_K", "5"))
+vector_index = None
+
+def _load_vector_index():
+    global vector_index
+    index = VectorIndex.load(VECTOR_INDEX_PATH)
+    built_with = index.metadata.get("model_version")
+    # Quantized backends are parity-checked against fp32, so only the weights need to match
+    if built_with and built_with.split("@")[0] != model_version().split("@")[0]:
+        logger.warning(f"Vector index was built with {built_with}, serving model is {model_version()}")
+    vector_index = index
+    logger.info(f"Vector index loaded from {VECTOR_INDEX_PATH}: {index.stats()}")
+
+if VECTOR_INDEX_PATH.exists():
+    # Optional: without it RAG uses the keyword-driven lookups only
+    components.register("vector_index", _load_vector_index, required=False)
+
+# Calibrated disease head over the CLS embedding (trained offline: python disease_head.py train)
+DISEASE_HEAD_PATH = Path(os.environ.get("HEALTHSYNC_DISEASE_HEAD_PATH", str(PROJECT_ROOT / "Model" / "disease_head.npz")))
+disease_head = None
+
+def _load_disease_head():
+    global disease_head
+    head = DiseaseHead.load(DISEASE_HEAD_PATH)
+    unknown = [label for label in head.labels if label not in clinical_rules.current().taxonomy]
+    if unknown:
+        raise ValueError(f"Disease head labels are not in the rule file's taxonomy: {unknown}")
+    trained_with = head.metadata.get("model_version")
+    # Another encoder's embedding space makes the probabilities meaningless; keep the keyword rules
+    if trained_with and trained_with.split("@")[0] != model_version().split("@")[0]:
+        raise ValueError(f"Disease head was trained on {trained_with}, serving model is {model_version()}")
+    disease_head = head
+    logger.info(f"Disease head loaded from {DISEASE_HEAD_PATH}: {head.stats()}")
+
+if DISEASE_HEAD_PATH.exists():
+    # Optional: without it diseases come from the keyword rules
+    components.register("disease_head", _load_disease_head, required=False)
+
+def analysis_version() -> str:
+    """Encoder version plus the disease head's, so cached analyses follow a change to either"""
+    if disease_head is None:
+        return model_version()
+    return f"{model_version()}+head:{disease_head.version}"
+
+def semantic_retrieve(cls_embedding: Any) -> list:
+    """Top-k knowledge documents for a note embedding; empty when no index is loaded"""
+    if vector_index is None or cls_embedding is None:
+        return []
+    try:
+        return vector_index.search(cls_embedding, k=RAG_TOP_K)
+    except ValueError as e:
+        logger.warning(f"Semantic retrieval skipped: {e}")
+        return []
+
 # ClinicalBERT analysis
-def analyze_with_clinical_bert(clinical_notes: str) -> Dict[str, Any]:
-    """Analyze clinical notes using ClinicalBERT"""
+def analyze_with_clinical_bert(clinical_notes: str, cls_embedding: Any = None,
+                               disease_probabilities: Any = None) -> Dict[str, Any]:
+    """Analyze clinical notes using ClinicalBERT.
+
+    ``cls_embedding`` may be supplied by the micro-batcher; otherwise the note is encoded here.
+    ``disease_probabilities`` may be supplied when the disease head scored a whole batch at once.
+    """
     if not clinical_notes:
-        return {
+        return validated_stage_output(ClinicalBertAnalysis, {
             "diseases_detected": [],
             "symptoms_identified": [],
             "confidence": 0.0,
             "analysis": "No clinical notes provided"
-        }
+        })
     
     try:
-        # Use ClinicalBERT for text encoding
-        inputs = tokenizer(clinical_notes, return_tensors="pt", truncation=True, max_length=512, padding=True)
-        
-        with torch.no_grad():
-            outputs = model(**inputs)
-            # Safely get [CLS] token representation
-            if hasattr(outputs, 'last_hidden_state') and outputs.last_hidden_state.size(1) > 0:
-                cls_embedding = outputs.last_hidden_state[:, 0, :]
-            else:
-                # If unable to get CLS embedding, use pooler_output
-                cls_embedding = outputs.pooler_output if hasattr(outputs, 'pooler_output') else None
+        if cls_embedding is None:
+            # Use ClinicalBERT for text encoding
+            cls_embedding = encode_clinical_notes([clinical_notes])[0]
             
-        # Disease detection based on embeddings (simplified method)
-        # In practice, you may need to train a classifier
-        detected_diseases = []
-        identified_symptoms = []
-        confidence = 0.8
-        
-        clinical_notes_lower = clinical_notes.lower()
-        
-        # Check cardiovascular related
-        if any(keyword in clinical_notes_lower for keyword in ["chest pain", "chest tightness", "palpitations", "shortness of breath", "heart", "cardiac", "angina"]):
-            detected_diseases.append("Cardiovascular Disease")
-            identified_symptoms.extend(["chest pain", "chest tightness", "palpitations", "shortness of breath"])
-        
-        # Check diabetes related
-        if any(keyword in clinical_notes_lower for keyword in ["excessive thirst", "frequent urination", "increased hunger", "glucose", "diabetes", "blood sugar", "polyuria", "polydipsia"]):
-            detected_diseases.append("Diabetes")
-            identified_symptoms.extend(["excessive thirst", "frequent urination", "increased hunger"])
-        
-        # Check hypertension related
-        if any(keyword in clinical_notes_lower for keyword in ["hypertension", "blood pressure", "headache", "dizziness", "high bp", "elevated bp"]):
-            detected_diseases.append("Hypertension")
-            identified_symptoms.extend(["headache", "dizziness", "palpitations"])
-        
-        # Check ophthalmic diseases
-        if any(keyword in clinical_notes_lower for keyword in ["eye", "ocular", "vision", "visual", "diplopia", "double vision", "eye weakness", "oculomotor", "palsy", "ptosis", "eyelid", "retina", "optic", "glaucoma", "cataract"]):
-            detected_diseases.append("Ophthalmic Disorder")
-            identified_symptoms.extend(["visual disturbance", "eye weakness", "diplopia"])
-        
-        # Check neurological diseases
-        if any(keyword in clinical_notes_lower for keyword in ["nerve", "neurological", "palsy", "paralysis", "weakness", "numbness", "tingling", "seizure", "epilepsy", "stroke", "cerebral", "brain", "neurological", "cranial nerve"]):
-            detected_diseases.append("Neurological Disorder")
-            identified_symptoms.extend(["nerve weakness", "neurological symptoms"])
-        
-        # Check autoimmune diseases
-        if any(keyword in clinical_notes_lower for keyword in ["autoimmune", "prednisone", "steroid", "inflammation", "immune", "myasthenia", "graves", "thyroid", "rheumatoid", "lupus"]):
-            detected_diseases.append("Autoimmune Disorder")
-            identified_symptoms.extend(["immune system involvement", "steroid responsive"])
-        
-        # Check other common symptoms
-        if any(keyword in clinical_notes_lower for keyword in ["fever", "temperature", "hot", "pyrexia"]):
-            identified_symptoms.append("fever")
-        if any(keyword in clinical_notes_lower for keyword in ["nausea", "vomiting", "sick", "queasy"]):
-            identified_symptoms.append("nausea")
-        if any(keyword in clinical_notes_lower for keyword in ["fatigue", "tired", "weakness", "exhaustion"]):
-            identified_symptoms.append("fatigue")
-        if any(keyword in clinical_notes_lower for keyword in ["cough", "coughing", "productive cough"]):
-            identified_symptoms.append("cough")
-        if any(keyword in clinical_notes_lower for keyword in ["weight loss", "unintended weight loss"]):
-            identified_symptoms.append("weight loss")
-        if any(keyword in clinical_notes_lower for keyword in ["weight gain", "unintended weight gain"]):
-            identified_symptoms.append("weight gain")
-        if any(keyword in clinical_notes_lower for keyword in ["headache", "head pain", "migraine"]):
-            identified_symptoms.append("headache")
-        if any(keyword in clinical_notes_lower for keyword in ["dizziness", "vertigo", "balance"]):
-            identified_symptoms.append("dizziness")
+        # Keywords still supply symptoms and spans; the disease head, when loaded, decides diseases
+        keyword_hits = _apply_keyword_rules(clinical_keyword_matcher, clinical_notes)
+        identified_symptoms = keyword_hits["symptoms"]
+        if disease_head is not None and cls_embedding is not None:
+            if disease_probabilities is None:
+                disease_probabilities = disease_head.predict_proba(cls_embedding)
+            hits = disease_head.detect(disease_probabilities)
+            detected_diseases = [label for label, _ in hits]
+            # Probability of the top call, or that none of the classes is present
+            confidence = hits[0][1] if hits else 1.0 - float(disease_probabilities.max())
+            detection = {
+                "detection_method": "classifier",
+                "disease_probabilities": {
+                    label: round(float(p), 4) for label, p in zip(disease_head.labels, disease_probabilities)
+                },
+                "classifier_version": disease_head.version
+            }
+        else:
+            detected_diseases = keyword_hits["diseases"]
+            confidence = 0.8
+            detection = {"detection_method": "keywords"}
         
         result = {
             "diseases_detected": detected_diseases,
             "symptoms_identified": identified_symptoms,
             "confidence": confidence,
-            "analysis": f"ClinicalBERT analysis completed, detected {len(detected_diseases)} possible diseases"
+            "analysis": f"ClinicalBERT analysis completed, detected {len(detected_diseases)} possible diseases",
+            "keyword_spans": keyword_hits["spans"],
+            "symptoms_reported": keyword_hits["reported"],
+            **detection
         }
         
         # Safely add embedding dimension information
         if cls_embedding is not None:
-            result["embedding_dim"] = cls_embedding.shape[-1]
+            result["embedding_dim"] = int(cls_embedding.shape[-1])
         else:
             result["embedding_dim"] = "N/A"
+        
+        # The CLS embedding doubles as the RAG query vector
+        if vector_index is not None:
+            result["retrieved_documents"] = semantic_retrieve(cls_embedding)
             
-        return result
+        return validated_stage_output(ClinicalBertAnalysis, result)
         
     except Exception as e:
         logger.error(f"ClinicalBERT analysis failed: {str(e)}")
-        # Fallback to simple keyword-based analysis
-        detected_diseases = []
-        identified_symptoms = []
-        clinical_notes_lower = clinical_notes.lower()
-        
-        # Simple keyword matching as fallback
-        if any(keyword in clinical_notes_lower for keyword in ["chest pain", "heart", "cardiac"]):
-            detected_diseases.append("Cardiovascular Disease")
-            identified_symptoms.append("chest pain")
-        
-        if any(keyword in clinical_notes_lower for keyword in ["diabetes", "glucose", "blood sugar"]):
-            detected_diseases.append("Diabetes")
-            identified_symptoms.append("glucose issues")
-        
-        if any(keyword in clinical_notes_lower for keyword in ["hypertension", "blood pressure", "high bp"]):
-            detected_diseases.append("Hypertension")
-            identified_symptoms.append("elevated blood pressure")
-        
-        # Ophthalmic disease detection
-        if any(keyword in clinical_notes_lower for keyword in ["eye", "ocular", "vision", "visual", "diplopia", "double vision", "eye weakness", "oculomotor", "palsy", "ptosis"]):
-            detected_diseases.append("Ophthalmic Disorder")
-            identified_symptoms.append("visual disturbance")
-        
-        # Neurological disease detection
-        if any(keyword in clinical_notes_lower for keyword in ["nerve", "neurological", "palsy", "paralysis", "weakness", "numbness", "tingling"]):
-            detected_diseases.append("Neurological Disorder")
-            identified_symptoms.append("nerve weakness")
-        
-        # Autoimmune disease detection
-        if any(keyword in clinical_notes_lower for keyword in ["prednisone", "steroid", "inflammation", "immune", "myasthenia"]):
-            detected_diseases.append("Autoimmune Disorder")
-            identified_symptoms.append("immune system involvement")
-        
-        return {
-            "diseases_detected": detected_diseases,
-            "symptoms_identified": identified_symptoms,
-            "confidence": 0.6,
-            "analysis": f"Fallback analysis completed, detected {len(detected_diseases)} diseases"
-        }
+        return _fallback_clinical_analysis(clinical_notes)
 
-# Simulate XGBoost analysis
-def analyze_with_xgboost(patient_data: PatientData) -> Dict[str, Any]:
-    """Use XGBoost to analyze structured data"""
+def _fallback_clinical_analysis(clinical_notes: str) -> Dict[str, Any]:
+    """Simple keyword-based analysis used when the ClinicalBERT encoder is unavailable"""
+    keyword_hits = _apply_keyword_rules(fallback_keyword_matcher, clinical_notes)
+    detected_diseases = keyword_hits["diseases"]
+    identified_symptoms = keyword_hits["symptoms"]
+    
+    return validated_stage_output(ClinicalBertAnalysis, {
+        "diseases_detected": detected_diseases,
+        "symptoms_identified": identified_symptoms,
+        "confidence": 0.6,
+        "analysis": f"Fallback analysis completed, detected {len(detected_diseases)} diseases",
+        "keyword_spans": keyword_hits["spans"],
+        "symptoms_reported": keyword_hits["reported"],
+        "detection_method": "keywords"
+    })
+
+async def analyze_with_clinical_bert_batched(clinical_notes: str) -> Dict[str, Any]:
+    """Analyze clinical notes, sharing the forward pass with concurrent requests"""
+    if not clinical_notes:
+        return analyze_with_clinical_bert(clinical_notes)
+    if not components.is_ready("clinical_bert"):
+        # Serve keyword analysis while the model is still loading
+        return await inference_executor.run(_fallback_clinical_analysis, clinical_notes)
+
+    cache_key = note_cache_key(clinical_notes, analysis_version())
+    cached = analysis_cache.get_memory(cache_key)
+    if cached is None:
+        # The persistent tier does blocking I/O, so look it up off the event loop
+        cached = await inference_executor.run(analysis_cache.get_persistent, cache_key)
+    if cached is None:
+        cached = await note_flights.run(cache_key, lambda: _compute_note_analysis(clinical_notes, cache_key))
+        if cached["embedding"] is None:
+            # Encoding failed; the leader's fallback analysis was not cached
+            return await inference_executor.run(_fallback_clinical_analysis, clinical_notes)
+    if cached["note"] != clinical_notes:
+        # Same normalized note, different spacing/case: keyword spans must be recomputed
+        return analyze_with_clinical_bert(clinical_notes, cls_embedding=cached["embedding"])
+    if vector_index is not None and "retrieved_documents" not in cached["analysis"]:
+        # Cached before the vector index finished loading
+        return analyze_with_clinical_bert(clinical_notes, cls_embedding=cached["embedding"])
+    return dict(cached["analysis"])
+
+async def _compute_note_analysis(clinical_notes: str, cache_key: str) -> Dict[str, Any]:
+    """Encode and analyze a note once across replicas: the lease holder computes, others wait for its result"""
+    leased = await inference_executor.run(analysis_cache.acquire_lease, cache_key)
+    if not leased:
+        cached = await analysis_cache.wait_for_leader(cache_key, inference_executor.run)
+        if cached is not None:
+            return cached
+    try:
+        started = time.perf_counter()
+        try:
+            if request_scheduler.current()[0] is request_scheduler.default_lane:
+                cls_embedding = await clinical_bert_batcher.submit(clinical_notes)
+            else:
+                # Batched forward passes run in the default lane; other lanes encode on their own
+                cls_embedding = (await inference_executor.encode([clinical_notes]))[0]
+        except HTTPException:
+            # Shed: every waiter's deadline has passed, which is not a reason to fall back to keywords
+            raise
+        except Exception as e:
+            logger.error(f"ClinicalBERT analysis failed: {str(e)}")
+            return {"note": clinical_notes, "embedding": None, "analysis": None}
+        result = await inference_executor.run(analyze_with_clinical_bert, clinical_notes, cls_embedding=cls_embedding)
+        entry = {"note": clinical_notes, "embedding": cls_embedding, "analysis": result}
+        await inference_executor.run(analysis_cache.set, cache_key, entry, time.perf_counter() - started)
+        return entry
+    finally:
+        if leased:
+            await inference_executor.run(analysis_cache.release_lease, cache_key)
+
+# Rule-based structured assessment (fallback when no trained artifact is available)
+def _rule_based_risk_assessment(patient_data: PatientData) -> Dict[str, Any]:
+    """Additive rule set over structured data; also supplies human-readable risk factors"""
     
     # Calculate risk score
     risk_score = 0.0
@@ -599,19 +692,75 @@ def analyze_with_xgboost(patient_data: PatientData) -> Dict[str, Any]:
             "cardiovascular_risk": min(risk_score * 1.2, 1.0),
             "diabetes_risk": min(risk_score * 0.8, 1.0),
             "hypertension_risk": min(risk_score * 1.1, 1.0)
-        }
+        },
+        "model": "rules"
     }
 
+def _risk_level(risk_score: float) -> str:
+    if risk_score >= 0.7:
+        return "High risk"
+    if risk_score >= 0.4:
+        return "Medium risk"
+    return "Low risk"
+
+# Trained XGBoost artifact from Model/model.ipynb (xgb_model.pkl + xgb_model.schema.json)
+XGB_MODEL_PATH = Path(os.environ.get("HEALTHSYNC_XGB_MODEL_PATH", str(PROJECT_ROOT / "Model" / "xgb_model.pkl")))
+structured_model = None
+
+def _load_structured_model():
+    global structured_model
+    # Raises SchemaMismatchError so a mismatched artifact fails readiness instead of mis-scoring
+    structured_model = StructuredRiskModel.load(XGB_MODEL_PATH)
+    logger.info(f"XGBoost model loaded from {XGB_MODEL_PATH}: {structured_model.info()}")
+
+if XGB_MODEL_PATH.exists():
+    components.register("xgboost", _load_structured_model)
+else:
+    logger.warning(f"XGBoost artifact not found at {XGB_MODEL_PATH}, using rule-based structured scoring")
+
+def analyze_with_xgboost_batch(patients: list) -> list:
+    """Score many patients with one vectorized predict_proba call"""
+    rule_results = [_rule_based_risk_assessment(p) for p in patients]
+    if structured_model is None or not patients:
+        return [validated_stage_output(XGBoostAnalysis, r) for r in rule_results]
+
+    probabilities = structured_model.predict_patients(patients)
+    labels = [structured_model.class_label(c) for c in structured_model.classes]
+    top = probabilities.argmax(axis=1)
+    results = []
+    for row, best, rules in zip(probabilities, top, rule_results):
+        risk_score = float(row[best])
+        results.append(validated_stage_output(XGBoostAnalysis, {
+            "risk_score": risk_score,
+            "risk_level": _risk_level(risk_score),
+            "risk_factors": rules["risk_factors"],
+            "predicted_condition": labels[best],
+            "predictions": {label: float(p) for label, p in zip(labels, row)},
+            "model": "xgboost",
+            "model_version": structured_model.version
+        }))
+    return results
+
+def analyze_with_xgboost(patient_data: PatientData) -> Dict[str, Any]:
+    """Use XGBoost to analyze structured data"""
+    return analyze_with_xgboost_batch([patient_data])[0]
+
 # RAG system
-def retrieve_medical_guidelines(diseases: list, symptoms: list) -> Dict[str, Any]:
-    """Retrieve relevant medical guidelines"""
+def retrieve_medical_guidelines(diseases: list, symptoms: list, retrieved: Optional[list] = None,
+                                reported: Optional[list] = None) -> Dict[str, Any]:
+    """Retrieve relevant medical guidelines.
+
+    ``retrieved`` holds semantic matches for the note embedding (see ``semantic_retrieve``).
+    ``reported`` holds the symptoms the note names itself; only these reach the DDXPlus
+    differential, which treats every input as evidence the patient reported.
+    """
     guidelines = []
     treatments = []
     precautions = []
     
     for disease in diseases:
-        if disease in MEDICAL_KNOWLEDGE_BASE:
-            kb = MEDICAL_KNOWLEDGE_BASE[disease]
+        kb = MEDICAL_KNOWLEDGE_BASE.get(KNOWLEDGE_SECTIONS.get(disease, disease))
+        if kb:
             guidelines.extend(kb.get("recommendations", []))
     
     # Add general recommendations based on symptoms
@@ -634,22 +783,38 @@ def retrieve_medical_guidelines(diseases: list, symptoms: list) -> Dict[str, Any
             if info.get("drugs"):
                 treatments.extend([f"Potential therapy: {dr}" for dr in info["drugs"]])
         sources.append("Local data corpus")
+    
+    # Guideline passages nearest to the note embedding
+    if retrieved:
+        guidelines.extend(doc["text"] for doc in retrieved if doc.get("kind") == "guideline")
+        sources.append("Semantic retrieval")
 
     # MedRAG-inspired additions: hierarchical labels, follow-ups, and differentials
     # See MedRAG (WWW'25) for KG-elicited reasoning concepts
-    kg_levels = get_hierarchical_labels(diseases, symptoms)
-    follow_ups = generate_follow_up_questions(diseases, symptoms)
-    differentials = generate_differentials(diseases, symptoms)
+    # All taxonomy/follow-up/differential rules are evaluated against one request bitmask
+    rules = clinical_rules.evaluate(diseases, symptoms)
+    
+    # Ranked DDXPlus differentials; next questions are chosen by expected information gain
+    reported = symptoms if reported is None else reported
+    ddx = ddx_engine.analyze(list(reported) + list(diseases)) if ddx_engine is not None else None
+    if ddx and ddx["next_questions"]:
+        follow_ups = [q["question"] for q in ddx["next_questions"]]
+    else:
+        # Fallback for notes with no DDXPlus evidence match
+        follow_ups = rules["follow_up_questions"]
 
-    return {
-        "guidelines": guidelines[:15],
+    return validated_stage_output(RagInsights, {
+        "guidelines": list(dict.fromkeys(guidelines))[:15],
         "treatments": treatments,
         "precautions": precautions,
         "sources": sources,
-        "levels": kg_levels.get("levels", []),
+        "levels": rules["levels"],
         "follow_up_questions": follow_ups,
-        "differentials": differentials
-    }
+        "differentials": rules["differentials"],
+        "ranked_differentials": ddx["differentials"] if ddx else [],
+        "next_questions": ddx["next_questions"] if ddx else [],
+        "retrieved_documents": retrieved or []
+    })
 
 # Fuse analysis results
 def fuse_analysis_results(clinical_bert_result: Dict, xgboost_result: Dict, rag_result: Dict) -> Dict[str, Any]:
@@ -669,62 +834,97 @@ def fuse_analysis_results(clinical_bert_result: Dict, xgboost_result: Dict, rag_
     else:
         primary_diagnosis = "Further examination needed"
     
-    return {
+    return validated_stage_output(FusionResult, {
         "primary_diagnosis": primary_diagnosis,
         "differential_diagnoses": diseases[1:] if len(diseases) > 1 else [],
         "risk_assessment": risk_level,
         "confidence": confidence,
         "urgency": "High" if risk_level == "High risk" else "Medium" if risk_level == "Medium risk" else "Low"
-    }
+    })
+
+@app.on_event("startup")
+async def start_inference():
+    inference_executor.start()
+    await clinical_bert_batcher.start()
+    # Load heavy components without delaying liveness
+    components.start_background_load()
+
+@app.on_event("shutdown")
+async def stop_inference():
+    await clinical_bert_batcher.stop()
+    inference_executor.shutdown()
 
 @app.get("/")
 async def root():
     return {"message": "Hybrid Model Disease Diagnosis API", "status": "running"}
 
+def _status_label(state: str) -> str:
+    return "loaded" if state == "ready" else state
+
 @app.get("/health")
 async def health_check():
+    """Liveness: answers as soon as the process is up, whatever the model load state"""
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "models": {
-            "clinical_bert": "loaded",
-            "xgboost": "loaded", 
-            "rag_system": "loaded"
+            "clinical_bert": _status_label(components.state("clinical_bert")),
+            "xgboost": _status_label(components.state("xgboost")) if "xgboost" in components.components else "rules",
+            "rag_system": _status_label(components.state("data_kb"))
         }
     }
 
-@app.post("/analyze", response_model=AnalysisResult)
-async def analyze_patient(patient_data: PatientData):
-    """Analyze patient data"""
-    try:
-        logger.info(f"Starting patient data analysis: {patient_data.age} years old, {patient_data.gender}")
-        
-        # 1. ClinicalBERT analysis
-        clinical_bert_result = analyze_with_clinical_bert(patient_data.clinical_notes)
-        
-        # 2. XGBoost analysis
-        xgboost_result = analyze_with_xgboost(patient_data)
-        
-        # 3. RAG retrieval
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 once every required component is loaded, 503 otherwise"""
+    body = components.snapshot()
+    body["timestamp"] = datetime.now().isoformat()
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+def build_recommendations(clinical_bert_result: Dict[str, Any], xgboost_result: Dict[str, Any],
+                          rag_result: Dict[str, Any]) -> list:
+    """Guidelines from RAG plus escalations for high structured risk and detected diseases"""
+    recommendations = []
+    recommendations.extend(rag_result.get("guidelines", []))
+    
+    if xgboost_result.get("risk_level") == "High risk":
+        recommendations.append("Recommend immediate medical attention")
+    
+    if clinical_bert_result.get("diseases_detected"):
+        recommendations.append("Recommend specialist consultation")
+    return recommendations
+
+def run_analysis_stages(patient_data: PatientData, clinical_bert_result: Dict[str, Any],
+                        xgboost_result: Optional[Dict[str, Any]] = None,
+                        timer: Optional[StageTimer] = None) -> AnalysisResult:
+    """Run the CPU-bound stages that follow ClinicalBERT (XGBoost, RAG, fusion, recommendations)"""
+    timer = timer or StageTimer(stage_duration)
+    
+    # 2. XGBoost analysis (bulk callers pass a result from one vectorized call)
+    if xgboost_result is None:
+        with timer.stage("xgboost"):
+            xgboost_result = analyze_with_xgboost(patient_data)
+    
+    # 3. RAG retrieval
+    with timer.stage("rag"):
         rag_result = retrieve_medical_guidelines(
             clinical_bert_result.get("diseases_detected", []),
-            clinical_bert_result.get("symptoms_identified", [])
+            clinical_bert_result.get("symptoms_identified", []),
+            clinical_bert_result.get("retrieved_documents"),
+            clinical_bert_result.get("symptoms_reported")
         )
-        
-        # 4. Fuse results
+    
+    # 4. Fuse results
+    with timer.stage("fusion"):
         fusion_result = fuse_analysis_results(clinical_bert_result, xgboost_result, rag_result)
-        
-        # 5. Generate recommendations
-        recommendations = []
-        recommendations.extend(rag_result.get("guidelines", []))
-        
-        if xgboost_result.get("risk_level") == "High risk":
-            recommendations.append("Recommend immediate medical attention")
-        
-        if clinical_bert_result.get("diseases_detected"):
-            recommendations.append("Recommend specialist consultation")
-        
-        result = AnalysisResult(
+    
+    # 5. Generate recommendations
+    with timer.stage("recommendations"):
+        recommendations = build_recommendations(clinical_bert_result, xgboost_result, rag_result)
+    
+    with timer.stage("response_model"):
+        # Every stage output was validated where it was produced; skip validating them again
+        return AnalysisResult.model_construct(
             success=True,
             timestamp=datetime.now().isoformat(),
             clinical_bert_analysis=clinical_bert_result,
@@ -734,33 +934,482 @@ async def analyze_patient(patient_data: PatientData):
             recommendations=recommendations,
             confidence_score=fusion_result.get("confidence", 0.0)
         )
+
+def analysis_payload(result: AnalysisResult) -> Dict[str, Any]:
+    """Response body of a constructed AnalysisResult; its fields already hold plain stage dicts"""
+    return dict(result)
+
+async def analysis_response(request: Request, result: AnalysisResult, timer: StageTimer) -> Response:
+    """Encode the result directly, bypassing response_model validation, compressed per client"""
+    headers = {}
+    if SERVER_TIMING:
+        headers["Server-Timing"] = timer.server_timing()
+    if TIMINGS_SAMPLE_RATE > 0 and random.random() < TIMINGS_SAMPLE_RATE:
+        result.timings = timer.breakdown()
+    return await json_response_offloaded(analysis_payload(result), request.headers.get("accept-encoding", ""),
+                                         headers=headers, run=inference_executor.run)
+
+# response_model only documents the schema: the endpoints return a ready Response
+@app.post("/analyze", response_model=AnalysisResult, response_class=FastJSONResponse)
+async def analyze_patient(patient_data: PatientData, request: Request):
+    """Analyze patient data"""
+    # Sheds with 503 when the lane's queue would make this request miss its deadline
+    request_scheduler.bind(request.headers, "interactive")
+    # Rejects with 503 + Retry-After when too many analyses are in flight
+    async with admission_controller:
+        try:
+            logger.info(f"Starting patient data analysis: {patient_data.age} years old, {patient_data.gender}")
+            timer = StageTimer(stage_duration)
+            
+            # 1. ClinicalBERT analysis (micro-batched with concurrent requests)
+            with timer.stage("clinical_bert"):
+                clinical_bert_result = await analyze_with_clinical_bert_batched(patient_data.clinical_notes)
+            
+            # 2-5. Remaining stages run off the event loop
+            result = await inference_executor.run(run_analysis_stages, patient_data, clinical_bert_result, timer=timer)
+            
+            logger.info(f"Analysis completed, confidence: {result.confidence_score}")
+            return await analysis_response(request, result, timer)
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Analysis failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+# Streaming analysis: each stage is sent as soon as it completes
+async def _timed(timer: StageTimer, stage: str, awaitable):
+    with timer.stage(stage):
+        return await awaitable
+
+def _timed_sync(timer: StageTimer, stage: str, fn, *args):
+    with timer.stage(stage):
+        return fn(*args)
+
+async def _stream_analysis(patient_data: PatientData, fmt: str, slot: AdmissionSlot):
+    started = time.perf_counter()
+    timer = StageTimer(stage_duration)
+    
+    def event(name: str, data: Any) -> bytes:
+        return encode_event(fmt, name, {"elapsed_ms": round((time.perf_counter() - started) * 1000, 3), "data": data})
+    
+    # The structured and text stages are independent, so they run concurrently
+    xgboost_task = asyncio.ensure_future(
+        _timed(timer, "xgboost", inference_executor.run(analyze_with_xgboost, patient_data)))
+    clinical_bert_task = asyncio.ensure_future(
+        _timed(timer, "clinical_bert", analyze_with_clinical_bert_batched(patient_data.clinical_notes)))
+    tasks = {xgboost_task: "xgboost_analysis", clinical_bert_task: "clinical_bert_analysis"}
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda t: tasks[t] != "xgboost_analysis"):
+                yield event(tasks[task], task.result())
+        xgboost_result = xgboost_task.result()
+        clinical_bert_result = clinical_bert_task.result()
+        
+        rag_result = await inference_executor.run(_timed_sync, timer, "rag", retrieve_medical_guidelines,
+                                                  clinical_bert_result.get("diseases_detected", []),
+                                                  clinical_bert_result.get("symptoms_identified", []),
+                                                  clinical_bert_result.get("retrieved_documents"),
+                                                  clinical_bert_result.get("symptoms_reported"))
+        yield event("rag_insights", rag_result)
         
-        logger.info(f"Analysis completed, confidence: {result.confidence_score}")
-        return result
+        fusion_result = await inference_executor.run(_timed_sync, timer, "fusion", fuse_analysis_results,
+                                                     clinical_bert_result, xgboost_result, rag_result)
+        yield event("fusion_result", fusion_result)
         
+        complete = {
+            "success": True,
+            "timestamp": datetime.now().isoformat(),
+            "recommendations": build_recommendations(clinical_bert_result, xgboost_result, rag_result),
+            "confidence_score": fusion_result.get("confidence", 0.0)
+        }
+        if TIMINGS_SAMPLE_RATE > 0 and random.random() < TIMINGS_SAMPLE_RATE:
+            complete["timings"] = timer.breakdown()
+        yield event("complete", complete)
     except Exception as e:
-        logger.error(f"Analysis failed: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+        logger.error(f"Streaming analysis failed: {str(e)}")
+        yield event("error", {"success": False, "detail": f"Analysis failed: {str(e)}"})
+    finally:
+        # Client went away or a stage failed: do not leave stages running for nobody
+        for task in tasks:
+            task.cancel()
+        slot.release()
+
+class AdmittedStreamingResponse(AdmittedResponseMixin, StreamingResponse):
+    pass
+
+class AdmittedBulkResponse(AdmittedResponseMixin, RequestBodyStreamingResponse):
+    pass
+
+@app.post("/analyze/stream")
+async def analyze_patient_stream(patient_data: PatientData, request: Request):
+    """Analyze patient data, streaming each stage as it completes.
+
+    Sends ``xgboost_analysis`` and ``clinical_bert_analysis`` (in completion order),
+    then ``rag_insights``, ``fusion_result`` and a final ``complete`` event with the
+    recommendations. Server-sent events when the Accept header asks for
+    text/event-stream, NDJSON otherwise.
+    """
+    request_scheduler.bind(request.headers, "interactive")
+    fmt = negotiate_stream_format(request.headers.get("accept", ""))
+    # The slot is held until the response ends, whether or not the generator ever runs
+    slot = admission_controller.slot()
+    return AdmittedStreamingResponse(
+        _stream_analysis(patient_data, fmt, slot),
+        media_type=STREAM_FORMATS[fmt],
+        # Proxies such as nginx would otherwise buffer the events until the end
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        admission_slot=slot
+    )
+
+# Incremental analysis: each session keeps its stage outputs and an update reruns only
+# the stages whose request fields or upstream outputs changed
+STRUCTURED_FIELDS = tuple(name for name in PatientData.model_fields if name != "clinical_notes")
+
+async def _session_clinical_bert(patient_data: PatientData, upstream: Dict[str, Any]) -> Dict[str, Any]:
+    return await analyze_with_clinical_bert_batched(patient_data.clinical_notes)
+
+def _session_xgboost(patient_data: PatientData, upstream: Dict[str, Any]) -> Dict[str, Any]:
+    return analyze_with_xgboost(patient_data)
+
+def _session_rag(patient_data: PatientData, upstream: Dict[str, Any]) -> Dict[str, Any]:
+    clinical_bert_result = upstream["clinical_bert"]
+    return retrieve_medical_guidelines(
+        clinical_bert_result.get("diseases_detected", []),
+        clinical_bert_result.get("symptoms_identified", []),
+        clinical_bert_result.get("retrieved_documents"),
+        clinical_bert_result.get("symptoms_reported")
+    )
+
+def _session_fusion(patient_data: PatientData, upstream: Dict[str, Any]) -> Dict[str, Any]:
+    return fuse_analysis_results(upstream["clinical_bert"], upstream["xgboost"], upstream["rag"])
+
+def _session_recommendations(patient_data: PatientData, upstream: Dict[str, Any]) -> list:
+    return build_recommendations(upstream["clinical_bert"], upstream["xgboost"], upstream["rag"])
+
+def _clinical_bert_context():
+    # A note analysed by the keyword fallback is redone once the model (or vector index) is up
+    return analysis_version(), components.is_ready("clinical_bert"), vector_index is not None
+
+def _xgboost_context():
+    return structured_model.version if structured_model is not None else None
+
+def _rag_context():
+    # current() picks up a rule file edit; loaded_at covers an edit that did not bump "version"
+    rules = clinical_rules.current()
+    return data_kb is not None, ddx_engine is not None, rules.version, clinical_rules.loaded_at
+
+analysis_graph = StageGraph([
+    Stage("clinical_bert", _session_clinical_bert, fields=("clinical_notes",),
+          context=_clinical_bert_context, is_async=True),
+    Stage("xgboost", _session_xgboost, fields=STRUCTURED_FIELDS, context=_xgboost_context),
+    Stage("rag", _session_rag, after=("clinical_bert",), context=_rag_context),
+    Stage("fusion", _session_fusion, after=("clinical_bert", "xgboost", "rag")),
+    Stage("recommendations", _session_recommendations, after=("clinical_bert", "xgboost", "rag"))
+])
+session_store = SessionStore.from_env(analysis_graph)
+
+def _check_session_id(session_id: str):
+    if not SESSION_ID_RE.match(session_id):
+        raise HTTPException(status_code=400, detail="session_id must be 1-128 characters of [A-Za-z0-9_.:-]")
+
+@app.post("/analyze/session/{session_id}", response_model=AnalysisResult, response_class=FastJSONResponse)
+async def analyze_session(session_id: str, patient_data: PatientData, request: Request):
+    """Analyze patient data within a session, recomputing only stages whose inputs changed.
+
+    Clients re-POST the full PatientData after each edit; editing a lab value reruns
+    the structured stages and fusion but not ClinicalBERT or retrieval.
+    """
+    _check_session_id(session_id)
+    request_scheduler.bind(request.headers, "interactive")
+    async with admission_controller:
+        try:
+            timer = StageTimer(stage_duration)
+            outputs, recomputed = await session_store.update(session_id, patient_data, inference_executor.run, timer=timer)
+            with timer.stage("response_model"):
+                result = AnalysisResult.model_construct(
+                    success=True,
+                    timestamp=datetime.now().isoformat(),
+                    clinical_bert_analysis=outputs["clinical_bert"],
+                    xgboost_analysis=outputs["xgboost"],
+                    rag_insights=outputs["rag"],
+                    fusion_result=outputs["fusion"],
+                    recommendations=outputs["recommendations"],
+                    confidence_score=outputs["fusion"].get("confidence", 0.0),
+                    session={
+                        "id": session_id,
+                        "recomputed": recomputed,
+                        "reused": [name for name in analysis_graph.names if name not in recomputed]
+                    }
+                )
+            
+            return await analysis_response(request, result, timer)
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Session analysis failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+@app.delete("/analyze/session/{session_id}")
+async def end_session(session_id: str):
+    """Drop a session's stored stage outputs"""
+    _check_session_id(session_id)
+    return {"session_id": session_id, "deleted": session_store.drop(session_id)}
+
+@app.get("/analyze/sessions")
+async def get_session_stats():
+    """Get session store size and per-stage recompute/reuse counters"""
+    return session_store.stats()
+
+# Bulk analysis: records per processing chunk (bounds memory regardless of upload size)
+BULK_CHUNK_SIZE = int(os.environ.get("HEALTHSYNC_BULK_CHUNK_SIZE", "64"))
+# Largest single record the parser buffers; a bigger one ends the upload with a Malformed upload line
+BULK_MAX_RECORD_BYTES = int(os.environ.get("HEALTHSYNC_BULK_MAX_RECORD_BYTES", str(DEFAULT_MAX_RECORD_BYTES)))
+
+def analyze_chunk(patients: list, embeddings: list) -> list:
+    """Analyze a chunk of validated patients given their (possibly missing) note embeddings.
+
+    Returns one AnalysisResult or Exception per patient so a bad record never fails the chunk.
+    """
+    try:
+        xgboost_results = analyze_with_xgboost_batch(patients)
+    except Exception as e:
+        logger.error(f"Vectorized XGBoost scoring failed, scoring rows individually: {e}")
+        xgboost_results = [None] * len(patients)
+    # The disease head scores every encoded note in the chunk with one matrix multiply
+    disease_probabilities = [None] * len(patients)
+    encoded = [i for i, e in enumerate(embeddings) if e is not None]
+    if disease_head is not None and encoded:
+        try:
+            for i, row in zip(encoded, disease_head.predict_proba([embeddings[i] for i in encoded])):
+                disease_probabilities[i] = row
+        except ValueError as e:
+            logger.error(f"Batched disease head scoring failed, scoring notes individually: {e}")
+    outputs = []
+    for patient_data, cls_embedding, xgboost_result, probabilities in zip(
+            patients, embeddings, xgboost_results, disease_probabilities):
+        try:
+            if patient_data.clinical_notes and cls_embedding is None:
+                clinical_bert_result = _fallback_clinical_analysis(patient_data.clinical_notes)
+            else:
+                clinical_bert_result = analyze_with_clinical_bert(
+                    patient_data.clinical_notes, cls_embedding=cls_embedding, disease_probabilities=probabilities
+                )
+            outputs.append(run_analysis_stages(patient_data, clinical_bert_result, xgboost_result))
+        except Exception as e:
+            outputs.append(e)
+    return outputs
+
+async def _encode_chunk_notes(patients: list) -> list:
+    """Encode the chunk's notes in padded batches; None where there is no note or no model"""
+    embeddings = [None] * len(patients)
+    if not components.is_ready("clinical_bert"):
+        return embeddings
+    with_notes = [i for i, p in enumerate(patients) if p.clinical_notes]
+    step = clinical_bert_batcher.max_batch_size
+    for start in range(0, len(with_notes), step):
+        idx = with_notes[start:start + step]
+        try:
+            encoded = await inference_executor.encode([patients[i].clinical_notes for i in idx])
+        except Exception as e:
+            logger.error(f"Bulk ClinicalBERT encode failed for {len(idx)} notes: {e}")
+            continue
+        for i, embedding in zip(idx, encoded):
+            embeddings[i] = embedding
+    return embeddings
+
+async def _stream_bulk_results(request: Request, slot: AdmissionSlot):
+    try:
+        records = iter_records(request.stream(), request.headers.get("content-type", ""), BULK_MAX_RECORD_BYTES)
+        async for chunk in iter_chunks(records, BULK_CHUNK_SIZE):
+            lines = {}
+            valid = []
+            for item in chunk:
+                if item["error"]:
+                    lines[item["index"]] = {"index": item["index"], "success": False, "error": item["error"]}
+                    continue
+                try:
+                    if not isinstance(item["record"], dict):
+                        raise ValueError("Record must be a JSON object")
+                    valid.append((item["index"], PatientData(**item["record"])))
+                except Exception as e:
+                    lines[item["index"]] = {"index": item["index"], "success": False, "error": f"Invalid record: {e}"}
+
+            patients = [p for _, p in valid]
+            embeddings = await _encode_chunk_notes(patients)
+            outputs = await inference_executor.run(analyze_chunk, patients, embeddings)
+            for (index, _), output in zip(valid, outputs):
+                if isinstance(output, Exception):
+                    lines[index] = {"index": index, "success": False, "error": f"Analysis failed: {output}"}
+                else:
+                    lines[index] = {"index": index, **analysis_payload(output)}
+
+            yield b"".join(dumps(lines[i]) + b"\n" for i in sorted(lines))
+    except BulkParseError as e:
+        yield (json.dumps({"success": False, "error": f"Malformed upload: {e}"}) + "\n").encode("utf-8")
+    except HTTPException as e:
+        # Shed by the scheduler mid-upload (only when the request set a deadline)
+        yield dumps({"success": False, "error": e.detail}) + b"\n"
+    finally:
+        slot.release()
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: Request):
+    """Analyze many patients from a JSON array or NDJSON body, streaming NDJSON results per chunk.
+
+    Each output line is an AnalysisResult plus its input ``index``; invalid or failed
+    records produce ``{"index", "success": false, "error"}`` lines instead.
+    """
+    # Bulk lane unless the API key or X-Priority header says otherwise
+    request_scheduler.bind(request.headers, "bulk")
+    # The whole upload holds one admission slot while it streams
+    slot = admission_controller.slot()
+    return AdmittedBulkResponse(_stream_bulk_results(request, slot), media_type="application/x-ndjson",
+                                admission_slot=slot)
 
 @app.get("/models/status")
 async def get_models_status():
     """Get model status"""
     return {
         "clinical_bert": {
-            "status": "loaded",
-            "version": "medicalai/ClinicalBERT",
+            "status": _status_label(components.state("clinical_bert")),
+            "version": model_config()["model_path"],
+            "backend": model_config()["backend"],
             "description": "ClinicalBERT model for analyzing clinical notes"
         },
         "xgboost": {
-            "status": "loaded", 
-            "version": "1.7.0",
+            "status": _status_label(components.state("xgboost")) if "xgboost" in components.components else "rules",
+            "version": structured_model.version if structured_model is not None else None,
+            "artifact": str(XGB_MODEL_PATH),
+            "schema": structured_model.info() if structured_model is not None else None,
             "description": "XGBoost model for structured data analysis"
         },
         "rag_system": {
-            "status": "loaded",
+            "status": _status_label(components.state("data_kb")),
             "description": "Medical knowledge retrieval system"
+        },
+        "vector_index": {
+            "status": _status_label(components.state("vector_index")) if "vector_index" in components.components else "disabled",
+            "artifact": str(VECTOR_INDEX_PATH),
+            "index": vector_index.stats() if vector_index is not None else None,
+            "description": "Semantic retrieval over ClinicalBERT embeddings of the knowledge corpus"
+        },
+        "disease_head": {
+            "status": _status_label(components.state("disease_head")) if "disease_head" in components.components else "keywords",
+            "artifact": str(DISEASE_HEAD_PATH),
+            "head": disease_head.stats() if disease_head is not None else None,
+            "description": "Calibrated multi-label disease classifier over the ClinicalBERT embedding"
+        },
+        "clinical_rules": {
+            "status": "loaded",
+            **clinical_rules.stats(),
+            "description": "Compiled taxonomy, follow-up and differential rules (hot-reloaded)"
         }
     }
 
+@app.get("/models/batching")
+async def get_batching_stats():
+    """Get micro-batching statistics (batch size and queue wait histograms)"""
+    return clinical_bert_batcher.stats()
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Get analysis cache hit/miss counters, hit ratios, coalescing and tier sizes"""
+    stats = await inference_executor.run(analysis_cache.stats)
+    stats["single_flight"] = note_flights.stats()
+    return stats
+
+def _collect_runtime_metrics():
+    """Scrape-time gauges for component loads, admission, cache and knowledge base sizes"""
+    yield ("component_ready", "gauge", "1 when the component has loaded",
+           [({"component": name}, float(c.state == "ready")) for name, c in components.components.items()])
+    yield ("component_load_seconds", "gauge", "Duration of the last load attempt per component",
+           [({"component": name}, c.duration_s) for name, c in components.components.items() if c.duration_s is not None])
+    admission = admission_controller.stats()
+    yield ("analyses_in_flight", "gauge", "Admitted /analyze and bulk requests in progress", [({}, admission["in_flight"])])
+    yield ("analyses_rejected_total", "counter", "Analyses rejected by admission control", [({}, admission["rejected"])])
+    scheduler = request_scheduler.stats()
+    lanes = [({"pool": pool, "lane": lane}, queue)
+             for pool, stats in scheduler["pools"].items() for lane, queue in stats["lanes"].items()]
+    yield ("scheduler_queue_depth", "gauge", "Submissions waiting for a pool slot per lane",
+           [(labels, queue["queued"]) for labels, queue in lanes])
+    yield ("scheduler_in_flight", "gauge", "Pool slots held per lane", [(labels, queue["in_flight"]) for labels, queue in lanes])
+    yield ("scheduler_requests_shed_total", "counter", "Requests shed on arrival because the queue ahead would miss their deadline",
+           [({"lane": lane}, stats["shed"]) for lane, stats in scheduler["lanes"].items()])
+    yield ("scheduler_queue_shed_total", "counter", "Submissions shed after their deadline expired in a pool queue",
+           [(labels, queue["shed"]) for labels, queue in lanes])
+    cache = analysis_cache.stats()
+    yield ("cache_lookups_total", "counter", "Analysis cache lookups by result", [
+        ({"result": "memory_hit"}, cache["hits"]),
+        ({"result": "persistent_hit"}, cache["persistent_hits"]),
+        ({"result": "miss"}, cache["misses"])
+    ])
+    entries = [({"tier": "memory"}, cache["memory"]["entries"])]
+    if cache["persistent"] is not None:
+        entries.append(({"tier": "persistent"}, cache["persistent"]["entries"]))
+    yield ("cache_entries", "gauge", "Entries per analysis cache tier", entries)
+    yield ("cache_hit_ratio", "gauge", "Analysis cache hit ratio per tier", [
+        ({"tier": "all"}, cache["hit_ratio"]),
+        ({"tier": "memory"}, cache["memory_hit_ratio"]),
+        ({"tier": "persistent"}, cache["persistent_hit_ratio"])
+    ])
+    flights = note_flights.stats()
+    yield ("cache_coalesced_total", "counter", "Note analyses served by joining an identical in-flight computation",
+           [({"scope": "process"}, flights["coalesced"]), ({"scope": "shared"}, cache["lease_wait_hits"])])
+    yield ("cache_early_refreshes_total", "counter", "Lookups turned into early recomputes by XFetch",
+           [({}, cache["early_refreshes"])])
+    yield ("cache_memory_bytes", "gauge", "Approximate bytes held by the memory cache tier", [({}, cache["memory"]["bytes"])])
+    if data_kb is not None:
+        yield ("knowledge_base_entries", "gauge", "Data knowledge base sizes", [
+            ({"table": "diseases"}, len(data_kb.disease_names)),
+            ({"table": "tests"}, len(data_kb.disease_to_tests)),
+            ({"table": "measurements"}, len(data_kb.disease_to_measurements)),
+            ({"table": "drugs"}, len(data_kb.disease_to_drugs))
+        ])
+    if vector_index is not None:
+        yield ("vector_index_documents", "gauge", "Documents in the semantic retrieval index",
+               [({}, len(vector_index.documents))])
+    memory = process_memory()
+    if memory:
+        # Per worker process; PSS counts copy-on-write pages shared with sibling workers proportionally
+        yield ("process_memory_bytes", "gauge", "Memory of this worker process", [
+            ({"kind": kind.rsplit("_", 1)[0], "pid": os.getpid()}, value * 1024 * 1024) for kind, value in memory.items()
+        ])
+    sessions = session_store.stats()
+    yield ("analysis_sessions", "gauge", "Live incremental analysis sessions", [({}, sessions["entries"])])
+    yield ("session_stage_runs_total", "counter", "Session stage evaluations by outcome", [
+        ({"stage": name, "outcome": outcome}, counts[name])
+        for outcome, counts in (("recomputed", sessions["stage_runs"]), ("reused", sessions["stage_reuses"]))
+        for name in analysis_graph.names
+    ])
+
+metrics_registry.register(clinical_bert_batcher.batch_size_histogram)
+metrics_registry.register(clinical_bert_batcher.queue_wait_histogram)
+metrics_registry.register(clinical_bert_batcher.batch_latency_histogram)
+metrics_registry.register_collector(_collect_runtime_metrics)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of request, stage, batching, cache and load metrics"""
+    # Collectors may touch the persistent cache tier, so render off the event loop
+    body = await inference_executor.run(metrics_registry.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/models/executor")
+async def get_executor_stats():
+    """Get inference executor configuration and admission control counters"""
+    return {
+        "executor": inference_executor.stats(),
+        "admission": admission_controller.stats()
+    }
+
+@app.get("/models/scheduler")
+async def get_scheduler_stats():
+    """Get per-lane queue depth, wait times, slot usage and shed counts for each pool"""
+    return request_scheduler.stats()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,317 @@
+"""
+Lightweight in-process metrics for the Hybrid Model API
+Fixed-bucket histograms, counters and gauges that can be snapshotted into
+JSON-friendly dicts or rendered in the Prometheus text exposition format
+"""
+
+import bisect
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Default buckets (milliseconds) for latency-style observations
+DEFAULT_LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items()) + "}"
+
+
+class Histogram:
+    """Thread-safe histogram with fixed upper bounds (Prometheus-style buckets)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS_MS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+            count = self._count
+        cumulative = {}
+        running = 0
+        for bound, c in zip(self.buckets, counts):
+            running += c
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = running + counts[-1]
+        return {
+            "description": self.description,
+            "count": count,
+            "sum": total,
+            "mean": (total / count) if count else 0.0,
+            "buckets": cumulative
+        }
+
+    def samples(self, name: str, labels: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any], float]]:
+        snap = self.snapshot()
+        samples = [
+            (f"{name}_bucket", {**labels, "le": bound}, value)
+            for bound, value in snap["buckets"].items()
+        ]
+        samples.append((f"{name}_sum", labels, snap["sum"]))
+        samples.append((f"{name}_count", labels, snap["count"]))
+        return samples
+
+
+class Counter:
+    """Monotonically increasing thread-safe counter (name it ``*_total``)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"description": self.description, "value": self.value}
+
+    def samples(self, name: str, labels: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any], float]]:
+        return [(name, labels, self.value)]
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = float(value)
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+
+class MetricFamily:
+    """Metrics of one type and name, one child per label-value combination."""
+
+    def __init__(self, factory: Callable[[], Any], name: str, description: str, kind: str,
+                 label_names: Sequence[str]):
+        self._factory = factory
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: Any) -> Any:
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {values}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._factory())
+        return child
+
+    def samples(self, name: str, labels: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any], float]]:
+        out = []
+        for key, child in sorted(self._children.items()):
+            out.extend(child.samples(name, {**labels, **dict(zip(self.label_names, key))}))
+        return out
+
+
+class MetricsRegistry:
+    """Named metrics plus scrape-time collectors, rendered as Prometheus text."""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]]] = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric: Any) -> Any:
+        name = self.prefix + metric.name
+        with self._lock:
+            if name in self._metrics:
+                raise ValueError(f"Metric {name} already registered")
+            self._metrics[name] = metric
+        return metric
+
+    def _family(self, cls: type, name: str, description: str, labels: Sequence[str], **kwargs) -> Any:
+        if not labels:
+            return self._add(cls(name, description, **kwargs))
+        return self._add(MetricFamily(lambda: cls(name, description, **kwargs), name, description, cls.kind, labels))
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Any:
+        return self._family(Counter, name, description, labels)
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = ()) -> Any:
+        return self._family(Gauge, name, description, labels)
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS_MS) -> Any:
+        return self._family(Histogram, name, description, labels, buckets=buckets)
+
+    def register(self, metric: Any) -> Any:
+        """Expose an existing metric object (e.g. a MicroBatcher histogram) under the registry prefix"""
+        return self._add(metric)
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]]):
+        """Add a scrape-time callback yielding ``(name, kind, description, [(labels, value), ...])``"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+
+        def emit(name: str, kind: str, description: str, samples: Iterable[Tuple[str, Dict[str, Any], float]]):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+        with self._lock:
+            metrics = list(self._metrics.items())
+        for name, metric in metrics:
+            emit(name, metric.kind, metric.description, metric.samples(name, {}))
+        for collector in self._collectors:
+            for name, kind, description, values in collector():
+                full_name = self.prefix + name
+                emit(full_name, kind, description, [(full_name, labels, value) for labels, value in values])
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Times the stages of one request into a histogram family labelled by stage.
+
+    The per-request breakdown (milliseconds per stage) is kept for Server-Timing
+    headers and sampled response payloads.
+    """
+
+    def __init__(self, histogram: Optional[MetricFamily] = None):
+        self.histogram = histogram
+        self.stages: Dict[str, float] = {}
+
+    def record(self, stage: str, duration_ms: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + duration_ms
+        if self.histogram is not None:
+            self.histogram.labels(stage).observe(duration_ms)
+
+    def stage(self, name: str) -> "_StageContext":
+        return _StageContext(self, name)
+
+    def breakdown(self) -> Dict[str, float]:
+        return {stage: round(ms, 3) for stage, ms in self.stages.items()}
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{stage};dur={ms:.2f}" for stage, ms in self.stages.items())
+
+
+class _StageContext:
+    def __init__(self, timer: StageTimer, name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.timer.record(self.name, (time.perf_counter() - self.started) * 1000)
+        return False
+
+
+def process_memory(pid: Any = "self") -> Dict[str, float]:
+    """Resident, proportional (PSS) and private memory of a process in MB (Linux only; {} elsewhere).
+
+    PSS splits pages shared copy-on-write between forked workers evenly, so summing
+    it over workers gives the real footprint; private memory is what each one adds.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    fields[name] = int(value.split()[0]) / 1024.0
+    except (OSError, ValueError):
+        return {}
+    return {
+        "rss_mb": round(fields.get("Rss", 0.0), 1),
+        "pss_mb": round(fields.get("Pss", 0.0), 1),
+        "private_mb": round(fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1)
+    }
+
+
+def _outcome(status: int) -> str:
+    if status < 400:
+        return "success"
+    if status in (429, 503):
+        return "rejected"
+    return "client_error" if status < 500 else "error"
+
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware counting HTTP requests by route and outcome.
+
+    Implemented without BaseHTTPMiddleware so streamed request and response
+    bodies (e.g. /analyze/batch) pass through untouched.
+    """
+
+    def __init__(self, app: Any, requests: MetricFamily, in_flight: MetricFamily, latency: MetricFamily):
+        self.app = app
+        self.requests = requests
+        self.in_flight = in_flight
+        self.latency = latency
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = {"code": 500}
+        # The route is only known once the router has matched it, so track in-flight by method
+        in_flight = self.in_flight.labels(scope.get("method", ""))
+        in_flight.inc()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.requests.labels(path, _outcome(status["code"])).inc()
+            self.latency.labels(path).observe((time.perf_counter() - started) * 1000)
@@ -0,0 +1,99 @@
+"""
+Background component loading and readiness tracking
+Heavy components (ClinicalBERT, the data knowledge base, ...) are loaded after the
+server starts accepting connections so liveness is reported immediately
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class Component:
+    """Load state of one named component."""
+
+    def __init__(self, name: str, loader: Callable[[], Any], required: bool = True):
+        self.name = name
+        self.loader = loader
+        self.required = required
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.duration_s: Optional[float] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "required": self.required,
+            "load_duration_s": round(self.duration_s, 3) if self.duration_s is not None else None,
+            "error": self.error
+        }
+
+
+class ComponentRegistry:
+    """Loads registered components in the background and reports readiness."""
+
+    def __init__(self):
+        self.components: Dict[str, Component] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, loader: Callable[[], Any], required: bool = True):
+        self.components[name] = Component(name, loader, required)
+
+    def state(self, name: str) -> str:
+        component = self.components.get(name)
+        return component.state if component else PENDING
+
+    def is_ready(self, name: str) -> bool:
+        return self.state(name) == READY
+
+    @property
+    def ready(self) -> bool:
+        return all(c.state == READY for c in self.components.values() if c.required)
+
+    def load_sync(self, name: str):
+        """Load one component in the calling thread, recording state and duration"""
+        component = self.components[name]
+        component.state = LOADING
+        component.error = None
+        component.started_at = time.perf_counter()
+        try:
+            component.loader()
+        except Exception as e:
+            component.state = FAILED
+            component.error = str(e)
+            logger.error(f"Component '{name}' failed to load: {e}")
+        else:
+            component.state = READY
+            logger.info(f"Component '{name}' ready")
+        finally:
+            component.duration_s = time.perf_counter() - component.started_at
+
+    async def _load_all(self, executor: Any = None):
+        loop = asyncio.get_running_loop()
+        # Components are independent, so load them concurrently
+        await asyncio.gather(*[
+            loop.run_in_executor(executor, self.load_sync, name)
+            for name, component in self.components.items()
+            if component.state in (PENDING, FAILED)
+        ])
+
+    def start_background_load(self, executor: Any = None) -> asyncio.Task:
+        """Schedule loading of all pending components without blocking the caller"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._load_all(executor), name="component-loader")
+        return self._task
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "components": {name: c.snapshot() for name, c in self.components.items()}
+        }
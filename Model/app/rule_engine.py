@@ -0,0 +1,272 @@
+"""
+Compiled clinical rules
+Loads the declarative rule file (disease taxonomy, follow-up questions, differentials)
+and interns every symptom and disease the rules mention. Each term maps to its own bit
+and to a bitmask of the rules it fires, so a request costs one dict lookup per symptom
+plus the rules that actually fire, however many rules the file holds. The file is
+re-read when it changes on disk
+
+    python rule_engine.py check [PATH]
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RuleFileError(ValueError):
+    """The rule file is malformed or references an unknown symptom group."""
+
+
+class CompiledRules:
+    """One immutable compilation of a rule file.
+
+    Symptoms are interned lower-cased under ``s:`` and diseases verbatim under ``d:``.
+    Each term holds ``[term bit, follow-up rules, differential rules]``: taxonomy L3
+    rules test ``rule_mask & term_bits``, and the other kinds OR the per-term rule sets
+    and walk the set bits in file order.
+    """
+
+    def __init__(self, spec: Dict[str, Any], source: Optional[str] = None):
+        if not isinstance(spec.get("taxonomy"), dict):
+            raise RuleFileError("rule file needs a 'taxonomy' object")
+        self.source = source
+        self.version = spec.get("version")
+        self.taxonomy: Dict[str, Any] = spec["taxonomy"]
+        self._terms: Dict[str, List[int]] = {}
+        self._groups = {
+            name: [str(s).lower() for s in members]
+            for name, members in (spec.get("symptom_groups") or {}).items()
+        }
+
+        # disease -> (L1, L2, [(mask, L3 label)], default L3)
+        self._levels: Dict[str, Tuple[str, str, List[Tuple[int, str]], str]] = {}
+        for disease, entry in self.taxonomy.items():
+            default = entry.get("default_L3", disease)
+            l3 = [(self._rule_mask(rule, f"taxonomy[{disease!r}]"), rule.get("label", default))
+                  for rule in entry.get("L3_rules", [])]
+            self._levels[disease] = (entry.get("L1", "Unknown"), entry.get("L2", "Unknown"), l3, default)
+
+        self._follow_ups = [
+            tuple(rule.get("questions", []))
+            for rule in self._index_rules(spec.get("follow_up_rules", []), "follow_up_rules", 1)
+        ]
+        self._differentials = [
+            tuple(rule.get("differentials", []))
+            for rule in self._index_rules(spec.get("differential_rules", []), "differential_rules", 2)
+        ]
+        self.follow_up_limit = int(spec.get("follow_up_limit", 12))
+        self.differential_limit = int(spec.get("differential_limit", 6))
+
+    @classmethod
+    def from_file(cls, path: Path) -> "CompiledRules":
+        path = Path(path)
+        try:
+            spec = json.loads(path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError as e:
+            raise RuleFileError(f"{path}: {e}") from e
+        return cls(spec, source=str(path))
+
+    def _term(self, key: str) -> List[int]:
+        term = self._terms.get(key)
+        if term is None:
+            term = self._terms[key] = [1 << len(self._terms), 0, 0]
+        return term
+
+    def _rule_terms(self, rule: Dict[str, Any], where: str) -> List[List[int]]:
+        terms = []
+        for symptom in rule.get("if_symptoms_any", []):
+            if symptom.startswith("@"):
+                members = self._groups.get(symptom[1:])
+                if members is None:
+                    raise RuleFileError(f"{where}: unknown symptom group {symptom!r}")
+            else:
+                members = [symptom.lower()]
+            terms.extend(self._term("s:" + member) for member in members)
+        terms.extend(self._term("d:" + disease) for disease in rule.get("if_diseases_any", []))
+        if not terms:
+            raise RuleFileError(f"{where}: rule has no if_symptoms_any / if_diseases_any condition")
+        return terms
+
+    def _rule_mask(self, rule: Dict[str, Any], where: str) -> int:
+        mask = 0
+        for term in self._rule_terms(rule, where):
+            mask |= term[0]
+        return mask
+
+    def _index_rules(self, rules: Sequence[Dict[str, Any]], kind: str, slot: int) -> Sequence[Dict[str, Any]]:
+        """Register rule ``i`` as bit ``i`` in slot ``slot`` of every term it fires on"""
+        for i, rule in enumerate(rules):
+            for term in self._rule_terms(rule, f"{kind}[{i}]"):
+                term[slot] |= 1 << i
+        return rules
+
+    def request_masks(self, diseases: Iterable[str], symptoms: Iterable[str]) -> Tuple[int, int, int]:
+        """(term bits, fired follow-up rules, fired differential rules); unknown terms are ignored"""
+        terms = self._terms
+        bits = follow_ups = differentials = 0
+        keys = ["s:" + symptom.lower() for symptom in symptoms]
+        keys.extend("d:" + disease for disease in diseases)
+        for key in keys:
+            term = terms.get(key)
+            if term is not None:
+                bits |= term[0]
+                follow_ups |= term[1]
+                differentials |= term[2]
+        return bits, follow_ups, differentials
+
+    @staticmethod
+    def _fired(rules: Sequence[Any], fired: int):
+        """Rules whose bits are set, lowest (earliest in the file) first"""
+        while fired:
+            low = fired & -fired
+            yield rules[low.bit_length() - 1]
+            fired ^= low
+
+    def levels(self, diseases: Sequence[str], mask: int) -> List[Dict[str, str]]:
+        """L1/L2/L3 hierarchy for the top three diseases; the first matching L3 rule wins"""
+        levels = []
+        for disease in diseases[:3]:
+            entry = self._levels.get(disease)
+            if entry is None:
+                levels.append({"disease": disease, "L1": "Unknown", "L2": "Unknown", "L3": disease})
+                continue
+            l1, l2, l3_rules, l3 = entry
+            for rule_mask, label in l3_rules:
+                if rule_mask & mask:
+                    l3 = label
+                    break
+            levels.append({"disease": disease, "L1": l1, "L2": l2, "L3": l3})
+        return levels
+
+    def follow_up_questions(self, fired: int) -> List[str]:
+        questions = {}
+        for rule_questions in self._fired(self._follow_ups, fired):
+            questions.update(dict.fromkeys(rule_questions))
+        return list(questions)[:self.follow_up_limit]
+
+    def differentials(self, fired: int) -> List[Dict[str, Any]]:
+        """Matching differentials; the entries are shared with the compiled rules, so treat them as read-only"""
+        found = []
+        for entries in self._fired(self._differentials, fired):
+            found.extend(entries)
+            if len(found) >= self.differential_limit:
+                break
+        return found[:self.differential_limit]
+
+    def evaluate(self, diseases: Sequence[str], symptoms: Sequence[str]) -> Dict[str, Any]:
+        """Taxonomy levels, follow-up questions and differentials from one pass over the request terms"""
+        bits, follow_ups, differentials = self.request_masks(diseases, symptoms)
+        return {
+            "levels": self.levels(diseases, bits),
+            "follow_up_questions": self.follow_up_questions(follow_ups),
+            "differentials": self.differentials(differentials)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "symbols": len(self._terms),
+            "taxonomy": len(self._levels),
+            "follow_up_rules": len(self._follow_ups),
+            "differential_rules": len(self._differentials)
+        }
+
+
+class RuleEngine:
+    """Serves the current CompiledRules and recompiles when the rule file changes.
+
+    The file's mtime and size are checked at most every ``check_interval_s`` on access;
+    a file that fails to compile is logged and the previous rules stay in service.
+    """
+
+    def __init__(self, path: Path, check_interval_s: float = 2.0):
+        self.path = Path(path)
+        self.check_interval_s = float(check_interval_s)
+        self._signature = self._stat()
+        self.rules = CompiledRules.from_file(self.path)
+        self.loaded_at = time.time()
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_error: Optional[str] = None
+
+    @classmethod
+    def from_env(cls, default_path: Path) -> "RuleEngine":
+        return cls(
+            Path(os.environ.get("HEALTHSYNC_RULES_PATH", str(default_path))),
+            check_interval_s=float(os.environ.get("HEALTHSYNC_RULES_CHECK_S", "2"))
+        )
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def current(self) -> CompiledRules:
+        if self.check_interval_s >= 0 and time.monotonic() - self._checked_at >= self.check_interval_s:
+            self.reload_if_changed()
+        return self.rules
+
+    def reload_if_changed(self) -> bool:
+        """Recompile if the file changed since the last load; True when new rules were swapped in"""
+        # Another thread is already checking; keep serving the current rules
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._checked_at = time.monotonic()
+            signature = self._stat()
+            if signature is None or signature == self._signature:
+                return False
+            # Remember the attempt either way so a broken file is not recompiled on every check
+            self._signature = signature
+            try:
+                rules = CompiledRules.from_file(self.path)
+            except (OSError, ValueError) as e:
+                self.reload_errors += 1
+                self.last_error = str(e)
+                logger.error(f"Rule file {self.path} not reloaded, keeping previous rules: {e}")
+                return False
+            self.rules = rules
+            self.loaded_at = time.time()
+            self.reloads += 1
+            self.last_error = None
+            logger.info(f"Reloaded rules from {self.path}: {rules.stats()}")
+            return True
+        finally:
+            self._lock.release()
+
+    def evaluate(self, diseases: Sequence[str], symptoms: Sequence[str]) -> Dict[str, Any]:
+        return self.current().evaluate(diseases, symptoms)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "last_error": self.last_error,
+            **self.rules.stats()
+        }
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Validate a rule file before deploying it: python rule_engine.py check [PATH]
+    if len(sys.argv) < 2 or sys.argv[1] != "check":
+        sys.exit("usage: python rule_engine.py check [PATH]")
+    target = Path(sys.argv[2]) if len(sys.argv) > 2 else Path(__file__).resolve().parent / "clinical_rules.json"
+    try:
+        print(json.dumps(CompiledRules.from_file(target).stats(), indent=2))
+    except (OSError, RuleFileError) as e:
+        sys.exit(f"{target}: {e}")
@@ -0,0 +1,405 @@
+"""
+Priority lanes in front of the model and analysis pools
+Every request is tagged with a lane (X-Priority header or API key) and a deadline.
+Each executor submission then waits for a slot on its pool, and slots go to the
+highest-priority lane first and the earliest deadline first within a lane, capped
+by per-lane concurrency limits. A request whose deadline cannot be met given the
+queue ahead of it is shed with a 503 before it does any work
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import math
+import os
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# name, priority (lower runs first), max concurrent slots per pool (None: all), default deadline
+# (ms, None: none), max notes per forward pass (None: no cap). Slots are not preempted, so the
+# bulk cap bounds how long an interactive pass can wait behind bulk work
+DEFAULT_LANES = (
+    ("interactive", 0, None, 5000.0, None),
+    ("bulk", 1, 1, None, 1)
+)
+# Smoothing of the per-lane slot hold time used to predict waits
+SERVICE_EWMA_ALPHA = 0.2
+WAIT_WINDOW = 1024
+
+
+class Lane:
+    """A traffic class; requests bound to a lane share its priority, limits and default deadline."""
+
+    def __init__(self, name: str, priority: int, max_concurrency: Optional[int] = None,
+                 deadline_ms: Optional[float] = None, max_batch: Optional[int] = None):
+        self.name = name
+        self.priority = int(priority)
+        self.max_concurrency = int(max_concurrency) if max_concurrency else None
+        self.deadline_ms = float(deadline_ms) if deadline_ms else None
+        self.max_batch = int(max_batch) if max_batch else None
+
+    def __repr__(self) -> str:
+        return f"Lane({self.name!r}, priority={self.priority})"
+
+
+# (lane, absolute deadline on the loop clock or None) of the request running in this context
+_binding: contextvars.ContextVar = contextvars.ContextVar("healthsync_lane", default=None)
+
+
+class SharedBinding:
+    """Binding of work done once on behalf of several requests (see cache.SingleFlight).
+
+    Resolves to the most urgent waiter's lane and the latest waiter deadline (none if any
+    waiter has none), so a coalesced interactive request is not queued at the bulk
+    priority of the request that started the work, and one waiter's deadline does not
+    shed work the others still wait for. Each waiter enforces its own deadline.
+    """
+
+    def __init__(self, lane: Lane, deadline: Optional[float]):
+        self._waiters: List[Tuple[Lane, Optional[float]]] = []
+        self._resolved = (lane, deadline)
+
+    def join(self, binding: Tuple[Lane, Optional[float]]):
+        self._waiters.append(binding)
+
+    def leave(self, binding: Tuple[Lane, Optional[float]]):
+        self._waiters.remove(binding)
+
+    def resolve(self) -> Tuple[Lane, Optional[float]]:
+        # Once every waiter has gone the work finishes (for the cache) as last bound
+        if self._waiters:
+            deadlines = [deadline for _, deadline in self._waiters]
+            self._resolved = (
+                min((lane for lane, _ in self._waiters), key=lambda lane: lane.priority),
+                None if None in deadlines else max(deadlines)
+            )
+        return self._resolved
+
+
+def _shed(lane: Lane, reason: str, retry_after_s: int) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Request shed: {reason} ({lane.name} lane)",
+        headers={"Retry-After": str(retry_after_s)}
+    )
+
+
+class _LaneQueue:
+    """One lane's waiters and counters on one pool."""
+
+    def __init__(self, lane: Lane, capacity: int):
+        self.lane = lane
+        self.limit = min(lane.max_concurrency or capacity, capacity)
+        self.in_flight = 0
+        # (deadline or +inf, arrival, future); cancelled futures are skipped when popped
+        self.heap: List[Tuple[float, int, asyncio.Future]] = []
+        self.queued = 0
+        self.max_queued = 0
+        self.granted = 0
+        self.shed = 0
+        self.service_ms: Optional[float] = None
+        self.waits = deque(maxlen=WAIT_WINDOW)
+
+    def record_service(self, ms: float):
+        if self.service_ms is None:
+            self.service_ms = ms
+        else:
+            self.service_ms += SERVICE_EWMA_ALPHA * (ms - self.service_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.waits)
+        return {
+            "priority": self.lane.priority,
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "granted": self.granted,
+            "shed": self.shed,
+            "service_ms": round(self.service_ms, 3) if self.service_ms is not None else None,
+            "wait_ms_mean": round(sum(waits) / len(waits), 3) if waits else None,
+            "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else None,
+            "wait_ms_max": round(waits[-1], 3) if waits else None
+        }
+
+
+class PoolScheduler:
+    """Hands out the ``capacity`` slots of one pool across lanes.
+
+    Runs on the event loop only, so the bookkeeping needs no lock. Slots are not
+    preempted: an interactive submission waits at most for the in-flight work to finish.
+    """
+
+    def __init__(self, name: str, capacity: int, lanes: Iterable[Lane], wait_histogram: Optional[Any] = None):
+        self.name = name
+        self.capacity = max(1, int(capacity))
+        self.lanes = {lane.name: _LaneQueue(lane, self.capacity) for lane in lanes}
+        # Highest priority first when dispatching
+        self._order = sorted(self.lanes.values(), key=lambda q: q.lane.priority)
+        self.in_flight = 0
+        self.wait_histogram = wait_histogram
+        self._arrivals = itertools.count()
+
+    def _has_waiters_ahead(self, queue: _LaneQueue) -> bool:
+        return any(q.queued for q in self._order if q.lane.priority <= queue.lane.priority)
+
+    def estimate_wait_ms(self, lane: Lane) -> float:
+        """Predicted queueing delay for a new submission in ``lane`` (0 until service times are known)"""
+        queue = self.lanes[lane.name]
+        ahead = [q for q in self._order if q.lane.priority <= lane.priority]
+        service = [q.service_ms for q in self.lanes.values() if q.service_ms is not None]
+        if not service:
+            return 0.0
+        mean_service = sum(service) / len(service)
+        # Slots on the whole pool, taken by equal or higher priority work ahead of us
+        pool_rounds = max(0, sum(q.queued for q in ahead) + self.in_flight - self.capacity + 1)
+        wait = math.ceil(pool_rounds / self.capacity) * mean_service
+        # Our own lane's concurrency limit
+        lane_rounds = max(0, queue.queued + queue.in_flight - queue.limit + 1)
+        if lane_rounds:
+            wait = max(wait, math.ceil(lane_rounds / queue.limit) * (queue.service_ms or mean_service))
+        return wait
+
+    def expected_ms(self, lane: Lane) -> float:
+        """Predicted wait plus hold time for one submission"""
+        return self.estimate_wait_ms(lane) + (self.lanes[lane.name].service_ms or 0.0)
+
+    def _grant(self, queue: _LaneQueue):
+        self.in_flight += 1
+        queue.in_flight += 1
+        queue.granted += 1
+
+    def _release(self, queue: _LaneQueue):
+        self.in_flight -= 1
+        queue.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.in_flight < self.capacity:
+            for queue in self._order:
+                if queue.in_flight >= queue.limit:
+                    continue
+                while queue.heap and queue.heap[0][2].done():
+                    heapq.heappop(queue.heap)
+                if queue.heap:
+                    _, _, future = heapq.heappop(queue.heap)
+                    queue.queued -= 1
+                    self._grant(queue)
+                    future.set_result(None)
+                    break
+            else:
+                return
+
+    @asynccontextmanager
+    async def slot(self, lane: Lane, deadline: Optional[float], retry_after_s: int = 1):
+        """Hold one slot of this pool for the body of the ``async with``"""
+        queue = self.lanes[lane.name]
+        loop = asyncio.get_running_loop()
+        enqueued_at = loop.time()
+        if self.in_flight < self.capacity and queue.in_flight < queue.limit and not self._has_waiters_ahead(queue):
+            self._grant(queue)
+        else:
+            budget = None
+            if deadline is not None:
+                # Stop waiting once even an immediate start would finish past the deadline
+                budget = deadline - enqueued_at - (queue.service_ms or 0.0) / 1000
+                if budget <= 0:
+                    queue.shed += 1
+                    raise _shed(lane, "deadline cannot be met", retry_after_s)
+            future = loop.create_future()
+            heapq.heappush(queue.heap, (deadline if deadline is not None else math.inf, next(self._arrivals), future))
+            queue.queued += 1
+            queue.max_queued = max(queue.max_queued, queue.queued)
+            # Waiters ahead may be held back only by their own lane's limit
+            self._dispatch()
+            try:
+                await asyncio.wait({future}, timeout=budget)
+            except BaseException:
+                # Caller cancelled (e.g. client disconnect): give back a slot granted meanwhile
+                if future.done():
+                    self._release(queue)
+                else:
+                    future.cancel()
+                    queue.queued -= 1
+                raise
+            if not future.done():
+                future.cancel()
+                queue.queued -= 1
+                queue.shed += 1
+                raise _shed(lane, "deadline expired in queue", retry_after_s)
+
+        started = loop.time()
+        wait_ms = (started - enqueued_at) * 1000
+        queue.waits.append(wait_ms)
+        if self.wait_histogram is not None:
+            self.wait_histogram.labels(self.name, lane.name).observe(wait_ms)
+        try:
+            yield
+        finally:
+            queue.record_service((loop.time() - started) * 1000)
+            self._release(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "lanes": {name: queue.stats() for name, queue in self.lanes.items()}
+        }
+
+
+class RequestScheduler:
+    """Lane selection and deadlines per request, plus one PoolScheduler per executor pool.
+
+    A request is bound to a lane with ``bind()``; executor submissions made while
+    serving it (directly or from tasks it spawns) then queue in that lane. Work
+    outside any request runs in ``default_lane`` without a deadline.
+    """
+
+    def __init__(self, lanes: Iterable[Lane], pools: Mapping[str, int], default_lane: str = "interactive",
+                 api_keys: Optional[Mapping[str, str]] = None, priority_header: str = "x-priority",
+                 deadline_header: str = "x-deadline-ms", api_key_header: str = "x-api-key",
+                 retry_after_s: int = 1, wait_histogram: Optional[Any] = None):
+        self.lanes = {lane.name: lane for lane in lanes}
+        if default_lane not in self.lanes:
+            raise ValueError(f"Unknown default lane '{default_lane}', expected one of {sorted(self.lanes)}")
+        unknown = sorted(set((api_keys or {}).values()) - set(self.lanes))
+        if unknown:
+            raise ValueError(f"API keys mapped to unknown lanes: {unknown}")
+        self.default_lane = self.lanes[default_lane]
+        self.api_keys = dict(api_keys or {})
+        self.priority_header = priority_header.lower()
+        self.deadline_header = deadline_header.lower()
+        self.api_key_header = api_key_header.lower()
+        self.retry_after_s = max(1, int(retry_after_s))
+        self.pools = {name: PoolScheduler(name, capacity, self.lanes.values(), wait_histogram)
+                      for name, capacity in pools.items()}
+        self.bound = {name: 0 for name in self.lanes}
+        # Shed at bind time; submissions shed while queued are counted per pool
+        self.shed = {name: 0 for name in self.lanes}
+
+    @classmethod
+    def from_env(cls, pools: Mapping[str, int], wait_histogram: Optional[Any] = None) -> "RequestScheduler":
+        """Per-lane overrides: HEALTHSYNC_LANE_<NAME>_CONCURRENCY, _DEADLINE_MS and _MAX_BATCH (0 = none)"""
+        lanes = []
+        for name, priority, concurrency, deadline_ms, max_batch in DEFAULT_LANES:
+            prefix = f"HEALTHSYNC_LANE_{name.upper()}_"
+            lanes.append(Lane(
+                name, priority,
+                max_concurrency=int(os.environ.get(prefix + "CONCURRENCY", concurrency or 0)),
+                deadline_ms=float(os.environ.get(prefix + "DEADLINE_MS", deadline_ms or 0)),
+                max_batch=int(os.environ.get(prefix + "MAX_BATCH", max_batch or 0))
+            ))
+        # HEALTHSYNC_LANE_API_KEYS="key1=bulk,key2=interactive"
+        api_keys = {}
+        for entry in os.environ.get("HEALTHSYNC_LANE_API_KEYS", "").split(","):
+            key, sep, lane = entry.strip().partition("=")
+            if sep and key.strip():
+                api_keys[key.strip()] = lane.strip()
+        # Slot counts default to the executor's pool sizes
+        pools = {name: int(os.environ.get(f"HEALTHSYNC_SCHED_{name.upper()}_SLOTS", capacity))
+                 for name, capacity in pools.items()}
+        return cls(
+            lanes, pools,
+            api_keys=api_keys,
+            priority_header=os.environ.get("HEALTHSYNC_PRIORITY_HEADER", "X-Priority"),
+            retry_after_s=int(os.environ.get("HEALTHSYNC_RETRY_AFTER_S", "1")),
+            wait_histogram=wait_histogram
+        )
+
+    def select(self, headers: Mapping[str, str], default: Optional[str] = None) -> Lane:
+        """Lane mapped to the caller's API key, else the one named in the priority header, else ``default``"""
+        key = headers.get(self.api_key_header)
+        if key and key in self.api_keys:
+            return self.lanes[self.api_keys[key]]
+        requested = (headers.get(self.priority_header) or "").strip().lower()
+        if requested in self.lanes:
+            return self.lanes[requested]
+        return self.lanes.get(default, self.default_lane) if default else self.default_lane
+
+    def _deadline_ms(self, headers: Mapping[str, str], lane: Lane) -> Optional[float]:
+        value = headers.get(self.deadline_header)
+        if value:
+            try:
+                ms = float(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"{self.deadline_header} must be a number of milliseconds")
+            if ms > 0:
+                return ms
+        return lane.deadline_ms
+
+    def bind(self, headers: Mapping[str, str], default: Optional[str] = None) -> Dict[str, Any]:
+        """Bind the current request to its lane and deadline, shedding it now if the queues ahead make it late"""
+        lane = self.select(headers, default)
+        deadline_ms = self._deadline_ms(headers, lane)
+        deadline = None
+        if deadline_ms is not None:
+            expected = sum(pool.expected_ms(lane) for pool in self.pools.values())
+            if expected > deadline_ms:
+                self.shed[lane.name] += 1
+                logger.warning(f"Shedding {lane.name} request: expected {expected:.0f}ms > deadline {deadline_ms:.0f}ms")
+                raise _shed(lane, f"expected {expected:.0f}ms exceeds the {deadline_ms:.0f}ms deadline", self.retry_after_s)
+            deadline = asyncio.get_running_loop().time() + deadline_ms / 1000
+        _binding.set((lane, deadline))
+        self.bound[lane.name] += 1
+        return {"lane": lane.name, "deadline_ms": deadline_ms}
+
+    def current(self) -> Tuple[Lane, Optional[float]]:
+        binding = _binding.get()
+        if isinstance(binding, SharedBinding):
+            return binding.resolve()
+        return binding or (self.default_lane, None)
+
+    def run_shared(self, fn) -> Tuple[asyncio.Task, SharedBinding]:
+        """Start ``fn()`` as a task bound to a new SharedBinding instead of the caller's lane"""
+        shared = SharedBinding(*self.current())
+        context = contextvars.copy_context()
+        context.run(_binding.set, shared)
+        return asyncio.get_running_loop().create_task(fn(), context=context), shared
+
+    @contextmanager
+    def waiting_on(self, shared: SharedBinding):
+        """Count the current request among ``shared``'s waiters for the body of the ``with``"""
+        binding = self.current()
+        shared.join(binding)
+        try:
+            yield
+        finally:
+            shared.leave(binding)
+
+    async def within_deadline(self, awaitable):
+        """Await ``awaitable`` (e.g. shielded shared work) no longer than the current request's deadline"""
+        lane, deadline = self.current()
+        if deadline is None:
+            return await awaitable
+        budget = deadline - asyncio.get_running_loop().time()
+        try:
+            if budget <= 0:
+                raise asyncio.TimeoutError
+            return await asyncio.wait_for(awaitable, budget)
+        except asyncio.TimeoutError:
+            self.shed[lane.name] += 1
+            raise _shed(lane, "deadline expired waiting for shared work", self.retry_after_s)
+
+    def slot(self, pool: str):
+        lane, deadline = self.current()
+        return self.pools[pool].slot(lane, deadline, self.retry_after_s)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "default_lane": self.default_lane.name,
+            "lanes": {
+                name: {"priority": lane.priority, "max_concurrency": lane.max_concurrency,
+                       "deadline_ms": lane.deadline_ms, "max_batch": lane.max_batch,
+                       "requests": self.bound[name], "shed": self.shed[name]}
+                for name, lane in self.lanes.items()
+            },
+            "api_keys": len(self.api_keys),
+            "pools": {name: pool.stats() for name, pool in self.pools.items()}
+        }
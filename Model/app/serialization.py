@@ -0,0 +1,247 @@
+"""
+Fast JSON responses
+Encodes response bodies with orjson when it is installed (stdlib json otherwise) and
+compresses them with brotli or gzip when the client's Accept-Encoding allows it. Large
+bodies are compressed off the event loop by json_response_offloaded.
+
+The bench subcommand compares this path with FastAPI's validated response_model path:
+
+    python serialization.py bench [--docs 50] [--repeat 200]
+"""
+
+import gzip
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Content codings we can produce, best first; brotli only when the module is installed
+RESPONSE_ENCODINGS = [
+    e.strip() for e in os.environ.get("HEALTHSYNC_RESPONSE_ENCODINGS", "br,gzip").split(",") if e.strip()
+]
+# Bodies smaller than this are sent uncompressed; the framing costs more than it saves
+COMPRESS_MIN_BYTES = int(os.environ.get("HEALTHSYNC_COMPRESS_MIN_BYTES", "1024"))
+# From this size compressing (~400us for 64 KiB at gzip 5) costs more than an executor hop (~75us)
+COMPRESS_OFFLOAD_BYTES = int(os.environ.get("HEALTHSYNC_COMPRESS_OFFLOAD_BYTES", str(32 * 1024)))
+GZIP_LEVEL = int(os.environ.get("HEALTHSYNC_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.environ.get("HEALTHSYNC_BROTLI_QUALITY", "4"))
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(obj: Any) -> Any:
+    """Values neither encoder handles natively: numpy scalars/arrays, sets, paths"""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps(content: Any) -> bytes:
+        return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _load_brotli():
+    try:
+        import brotli
+    except ImportError:
+        try:
+            import brotlicffi as brotli
+        except ImportError:
+            return None
+    return brotli
+
+
+# Resolved once: a failed import is not cached by Python and negotiation runs per response
+_brotli = _load_brotli()
+_AVAILABLE_ENCODINGS = [e for e in RESPONSE_ENCODINGS if e == "gzip" or (e == "br" and _brotli is not None)]
+
+
+def available_encodings() -> list:
+    return list(_AVAILABLE_ENCODINGS)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Best content coding the client accepts (RFC 9110 q-values), or None for identity"""
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            accepted[coding] = q
+    best, best_q = None, 0.0
+    for coding in _AVAILABLE_ENCODINGS:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return _brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported content coding: {encoding}")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the fast encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _encode(content: Any, accept_encoding: str,
+            headers: Optional[Dict[str, str]]) -> Tuple[bytes, Optional[str], Dict[str, str]]:
+    """Encoded body, the content coding to apply to it (None: send as is) and the headers"""
+    body = dumps(content)
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return body, encoding, headers
+
+
+def json_response(content: Any, accept_encoding: str = "", status_code: int = 200,
+                  headers: Optional[Dict[str, str]] = None) -> Response:
+    """Encode ``content`` once and compress it for this client when worthwhile.
+
+    Returning this from an endpoint skips FastAPI's response_model validation and
+    serialization, so ``content`` must already be JSON-shaped.
+    """
+    body, encoding, headers = _encode(content, accept_encoding, headers)
+    if encoding is not None:
+        body = compress(body, encoding)
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+async def json_response_offloaded(content: Any, accept_encoding: str = "", status_code: int = 200,
+                                  headers: Optional[Dict[str, str]] = None,
+                                  run: Optional[Callable[..., Awaitable[Any]]] = None) -> Response:
+    """json_response for async handlers: bodies of COMPRESS_OFFLOAD_BYTES or more are
+    compressed through ``run`` (e.g. InferenceExecutor.run) instead of on the event loop"""
+    body, encoding, headers = _encode(content, accept_encoding, headers)
+    if encoding is not None:
+        if run is not None and len(body) >= COMPRESS_OFFLOAD_BYTES:
+            body = await run(compress, body, encoding)
+        else:
+            body = compress(body, encoding)
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+def _bench(docs: int, repeat: int) -> Dict[str, Any]:
+    """Encode one analysis response ``repeat`` times through each path"""
+    import asyncio
+    import time
+    from typing import Optional as Opt
+
+    from fastapi.responses import JSONResponse as StdlibJSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+    from pydantic import BaseModel
+
+    from main import AnalysisResult, PatientData, _fallback_clinical_analysis, analysis_payload, run_analysis_stages
+
+    class LegacyAnalysisResult(BaseModel):
+        # AnalysisResult as it was declared before the typed stage models
+        success: bool
+        timestamp: str
+        clinical_bert_analysis: Dict[str, Any]
+        xgboost_analysis: Dict[str, Any]
+        rag_insights: Dict[str, Any]
+        fusion_result: Dict[str, Any]
+        recommendations: list
+        confidence_score: float
+        timings: Opt[Dict[str, float]] = None
+        session: Opt[Dict[str, Any]] = None
+
+    note = ("Patient reports chest pain radiating to the left arm, shortness of breath and palpitations. "
+            "History of hypertension and diabetes with blood sugar poorly controlled. ") * 4
+    clinical = _fallback_clinical_analysis(note)
+    # Semantic retrieval results dominate large responses
+    clinical["retrieved_documents"] = [
+        {"id": f"guideline:cardiovascular:{i}", "kind": "guideline" if i % 2 else "condition",
+         "disease": "Hypertension", "text": f"Passage {i}: " + "monitor blood pressure and titrate therapy; " * 12,
+         "score": round(0.9 - i / (docs * 2), 4)}
+        for i in range(docs)
+    ]
+    patient = PatientData(age=62, gender="female", blood_pressure="150/95", blood_glucose=160,
+                          cholesterol=240, clinical_notes=note)
+    fields = dict(analysis_payload(run_analysis_stages(patient, clinical)))
+    legacy_field = create_model_field(name="Response_legacy", type_=LegacyAnalysisResult, mode="serialization")
+
+    async def validated(dump_json: bool) -> bytes:
+        result = LegacyAnalysisResult(**fields)
+        content = await serialize_response(field=legacy_field, response_content=result, dump_json=dump_json)
+        return content if dump_json else StdlibJSONResponse(content).body
+
+    def fast() -> bytes:
+        return json_response(analysis_payload(AnalysisResult.model_construct(**fields))).body
+
+    def timed(fn) -> Dict[str, Any]:
+        fn()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            body = fn()
+        return {"encode_us": round((time.perf_counter() - started) / repeat * 1e6, 1), "bytes": len(body)}
+
+    loop = asyncio.new_event_loop()
+    try:
+        report = {
+            "backend": JSON_BACKEND,
+            "retrieved_documents": docs,
+            "paths": {
+                "response_model + json.dumps": timed(lambda: loop.run_until_complete(validated(False))),
+                "response_model + dump_json": timed(lambda: loop.run_until_complete(validated(True))),
+                "model_construct + " + JSON_BACKEND: timed(fast)
+            }
+        }
+    finally:
+        loop.close()
+    body = dumps(fields)
+    for encoding in available_encodings():
+        report["paths"][f"model_construct + {JSON_BACKEND} + {encoding}"] = timed(lambda: compress(dumps(fields), encoding))
+    report["compression_ratio"] = {e: round(len(body) / len(compress(body, e)), 2) for e in available_encodings()}
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Response serialization tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="compare encode time and response size with the response_model path")
+    bench.add_argument("--docs", type=int, default=50, help="retrieved documents in the sample response")
+    bench.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        print(json.dumps(_bench(args.docs, args.repeat), indent=2))
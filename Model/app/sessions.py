@@ -0,0 +1,172 @@
+"""
+Session-scoped incremental re-analysis
+Keeps each session's stage outputs and, on every update, reruns only the stages whose
+request fields or upstream outputs changed since they were last computed
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import nullcontext
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from cache import MemoryTier
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_.:-]{1,128}$")
+
+
+def output_digest(value: Any) -> Tuple[str, int]:
+    """Content hash of a stage output and its encoded size; downstream stages rerun only when the hash changes"""
+    payload = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest(), len(payload)
+
+
+class Stage:
+    """One analysis stage and what it depends on.
+
+    ``fields`` are request attributes read by ``fn``; ``after`` names the stages whose
+    outputs ``fn`` receives; ``context`` returns extra state that invalidates the stage
+    when it changes (e.g. the served model version). ``fn(request, upstream)`` is a
+    coroutine function when ``is_async`` and a blocking callable otherwise.
+    """
+
+    def __init__(self, name: str, fn: Callable[..., Any], fields: Sequence[str] = (),
+                 after: Sequence[str] = (), context: Optional[Callable[[], Any]] = None,
+                 is_async: bool = False):
+        self.name = name
+        self.fn = fn
+        self.fields = tuple(fields)
+        self.after = tuple(after)
+        self.context = context
+        self.is_async = is_async
+
+
+class StageGraph:
+    """Stages in dependency order; every ``after`` entry must name an earlier stage."""
+
+    def __init__(self, stages: Sequence[Stage]):
+        seen = set()
+        for stage in stages:
+            missing = [name for name in stage.after if name not in seen]
+            if missing:
+                raise ValueError(f"Stage {stage.name!r} depends on {missing}, which must come before it")
+            seen.add(stage.name)
+        self.stages = list(stages)
+
+    @property
+    def names(self) -> List[str]:
+        return [stage.name for stage in self.stages]
+
+
+class Session:
+    """Per-session stage outputs plus the inputs each output was computed from."""
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.outputs: Dict[str, Any] = {}
+        self.digests: Dict[str, str] = {}
+        self.sizes: Dict[str, int] = {}
+        # stage -> (field values, context, upstream digests) at its last run
+        self.keys: Dict[str, tuple] = {}
+        self.updates = 0
+        self.lock = asyncio.Lock()
+
+
+class SessionStore:
+    """Bounded LRU/TTL store of sessions over a stage graph.
+
+    Sessions live in a cache.MemoryTier sized by their stage outputs, so both the
+    session count and total bytes are capped and idle sessions expire.
+    """
+
+    def __init__(self, graph: StageGraph, max_sessions: int = 1024,
+                 max_bytes: int = 64 * 1024 * 1024, ttl_s: float = 1800.0):
+        self.graph = graph
+        self.sessions = MemoryTier(max_entries=max_sessions, max_bytes=max_bytes, ttl_s=ttl_s)
+        self.created = 0
+        self.updates = 0
+        self.stage_runs = {name: 0 for name in graph.names}
+        self.stage_reuses = {name: 0 for name in graph.names}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, graph: StageGraph) -> "SessionStore":
+        return cls(
+            graph,
+            max_sessions=int(os.environ.get("HEALTHSYNC_SESSION_MAX", "1024")),
+            max_bytes=int(os.environ.get("HEALTHSYNC_SESSION_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl_s=float(os.environ.get("HEALTHSYNC_SESSION_TTL_S", "1800"))
+        )
+
+    def _get_or_create(self, session_id: str) -> Session:
+        # Lookup and insert under one lock so concurrent first updates share one Session
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = Session(session_id)
+                self.sessions.set(session_id, session, size=0)
+                self.created += 1
+            return session
+
+    def _store(self, session: Session):
+        """Re-insert ``session`` unless it expired mid-update and a newer one took its id"""
+        with self._lock:
+            current = self.sessions.get(session.id)
+            if current is None or current is session:
+                self.sessions.set(session.id, session, size=sum(session.sizes.values()))
+
+    def drop(self, session_id: str) -> bool:
+        return self.sessions.delete(session_id)
+
+    async def update(self, session_id: str, request: Any,
+                     run_sync: Callable[..., Awaitable[Any]],
+                     timer: Any = None) -> Tuple[Dict[str, Any], List[str]]:
+        """Bring the session up to date with ``request``; returns ``(outputs, recomputed stages)``.
+
+        Blocking stages go through ``run_sync(fn, *args)`` (the inference executor).
+        A stage that raises leaves its previous output and key in place, so it and
+        everything downstream rerun on the next update.
+        """
+        session = self._get_or_create(session_id)
+        async with session.lock:
+            recomputed = []
+            for stage in self.graph.stages:
+                key = (
+                    tuple(getattr(request, name, None) for name in stage.fields),
+                    stage.context() if stage.context is not None else None,
+                    tuple(session.digests.get(name) for name in stage.after)
+                )
+                if session.keys.get(stage.name) == key:
+                    self.stage_reuses[stage.name] += 1
+                    continue
+                upstream = {name: session.outputs[name] for name in stage.after}
+                with timer.stage(stage.name) if timer is not None else nullcontext():
+                    if stage.is_async:
+                        output = await stage.fn(request, upstream)
+                    else:
+                        output = await run_sync(stage.fn, request, upstream)
+                session.outputs[stage.name] = output
+                session.digests[stage.name], session.sizes[stage.name] = output_digest(output)
+                session.keys[stage.name] = key
+                self.stage_runs[stage.name] += 1
+                recomputed.append(stage.name)
+            session.updates += 1
+            self.updates += 1
+            # Re-inserting refreshes the TTL and records the session's current size
+            self._store(session)
+            return dict(session.outputs), recomputed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.sessions.stats(),
+            "created": self.created,
+            "updates": self.updates,
+            "stage_runs": dict(self.stage_runs),
+            "stage_reuses": dict(self.stage_reuses)
+        }
@@ -0,0 +1,50 @@
+"""
+Incremental /analyze responses
+Encodes per-stage events as server-sent events or NDJSON, chosen from the Accept header
+"""
+
+from typing import Any, Dict
+
+from serialization import dumps
+
+STREAM_FORMATS = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson"
+}
+_ACCEPTED_TYPES = {
+    "text/event-stream": "sse",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson"
+}
+
+
+def negotiate_stream_format(accept: str) -> str:
+    """``sse`` when the client accepts text/event-stream, ``ndjson`` otherwise.
+
+    EventSource always sends ``Accept: text/event-stream``; fetch()-based readers and
+    command-line clients get NDJSON unless they ask for SSE explicitly.
+    """
+    best, best_q = "ndjson", -1.0
+    for part in (accept or "").split(","):
+        media_type, _, params = part.strip().partition(";")
+        media_type = media_type.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        fmt = _ACCEPTED_TYPES.get(media_type)
+        if fmt is not None and q > 0 and q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def encode_event(fmt: str, event: str, payload: Dict[str, Any]) -> bytes:
+    """One stage event; the payload carries the stage result and its elapsed time"""
+    body = dumps({"event": event, **payload})
+    if fmt == "sse":
+        return b"event: " + event.encode("utf-8") + b"\ndata: " + body + b"\n\n"
+    return body + b"\n"
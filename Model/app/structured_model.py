@@ -0,0 +1,196 @@
+"""
+Trained XGBoost model for structured (lab/demographic) risk scoring
+Loads the artifact produced by Model/model.ipynb, validates its feature schema and
+builds feature matrices from PatientData in the training column order
+"""
+
+import json
+import logging
+import math
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Training columns (model.ipynb) -> PatientData attribute
+NUMERIC_FEATURES = {
+    "Age": "age",
+    "HbA1c_level": "hba1c",
+    "blood_glucose": "blood_glucose",
+    "BUN": "bun",
+    "Cholesterol": "cholesterol",
+    "HDL": "hdl",
+    "LDL": "ldl",
+    "Cr": "creatinine"
+}
+# Derived columns
+DERIVED_FEATURES = ("BMI",)
+# One-hot prefixes from pd.get_dummies(columns=["Gender", "Blood Type"])
+CATEGORICAL_PREFIXES = {
+    "Gender_": "gender",
+    "Blood Type_": "blood_type"
+}
+# Training columns PatientData does not capture; always passed as missing
+UNAVAILABLE_FEATURES = ("smoke_status", "drinking_status")
+
+
+class SchemaMismatchError(ValueError):
+    """The artifact's feature schema does not match what the API can build."""
+
+
+def _bmi(height: Optional[float], weight: Optional[float]) -> float:
+    if not height or not weight:
+        return math.nan
+    # Height is entered in cm by the clinician forms; accept metres too
+    meters = height if height < 3 else height / 100.0
+    return weight / (meters * meters)
+
+
+def _feature_kind(name: str) -> str:
+    if name in NUMERIC_FEATURES:
+        return "numeric"
+    if name in DERIVED_FEATURES:
+        return "derived"
+    if name in UNAVAILABLE_FEATURES:
+        return "unavailable"
+    for prefix in CATEGORICAL_PREFIXES:
+        if name.startswith(prefix):
+            return "categorical"
+    return "unknown"
+
+
+class StructuredRiskModel:
+    """Wrapper around a fitted XGBClassifier plus its label classes and feature schema."""
+
+    def __init__(self, model: Any, feature_names: Sequence[str], classes: Sequence[Any],
+                 class_names: Optional[Dict[str, str]] = None, version: str = "unknown"):
+        self.model = model
+        self.feature_names = list(feature_names)
+        self.classes = list(classes)
+        self.class_names = {str(k): v for k, v in (class_names or {}).items()}
+        self.version = version
+        self._validate()
+        self._column_index = {name: i for i, name in enumerate(self.feature_names)}
+
+    @classmethod
+    def load(cls, path: Path) -> "StructuredRiskModel":
+        """Load ``xgb_model.pkl`` (bare estimator or bundle dict) and its schema.
+
+        The schema comes from the bundle itself or a ``<stem>.schema.json`` sidecar
+        with ``feature_names``, ``classes`` and optional ``class_names``.
+        """
+        import joblib
+
+        path = Path(path)
+        artifact = joblib.load(path)
+        schema: Dict[str, Any] = {}
+        if isinstance(artifact, dict):
+            model = artifact["model"]
+            schema = {k: v for k, v in artifact.items() if k != "model"}
+            encoder = schema.pop("label_encoder", None)
+            if encoder is not None and "classes" not in schema:
+                schema["classes"] = list(encoder.classes_)
+        else:
+            model = artifact
+        sidecar = path.with_suffix(".schema.json")
+        if sidecar.exists():
+            schema = {**json.loads(sidecar.read_text(encoding="utf-8")), **schema}
+
+        feature_names = schema.get("feature_names") or _model_feature_names(model)
+        if not feature_names:
+            raise SchemaMismatchError(f"{path}: no feature names in artifact or {sidecar.name}")
+        classes = schema.get("classes")
+        if classes is None:
+            classes = list(getattr(model, "classes_", range(int(getattr(model, "n_classes_", 0)))))
+        return cls(
+            model,
+            feature_names,
+            classes,
+            class_names=schema.get("class_names"),
+            version=str(schema.get("version", path.name))
+        )
+
+    def _validate(self):
+        unknown = [f for f in self.feature_names if _feature_kind(f) == "unknown"]
+        if unknown:
+            raise SchemaMismatchError(f"Model expects features the API cannot build: {unknown}")
+        trained = _model_feature_names(self.model)
+        if trained and list(trained) != self.feature_names:
+            raise SchemaMismatchError(
+                f"Schema feature order {self.feature_names} does not match the trained model {list(trained)}"
+            )
+        n_features = getattr(self.model, "n_features_in_", None)
+        if n_features is not None and int(n_features) != len(self.feature_names):
+            raise SchemaMismatchError(
+                f"Model was trained on {n_features} features, schema lists {len(self.feature_names)}"
+            )
+        n_classes = getattr(self.model, "n_classes_", None)
+        if n_classes is not None and int(n_classes) != len(self.classes):
+            raise SchemaMismatchError(f"Model has {n_classes} classes, schema lists {len(self.classes)}")
+
+    def class_label(self, cls_value: Any) -> str:
+        return self.class_names.get(str(cls_value), f"condition_{cls_value}")
+
+    def build_feature_matrix(self, patients: Sequence[Any]) -> np.ndarray:
+        """Vectorized feature construction: one column fill per feature, NaN for missing"""
+        X = np.full((len(patients), len(self.feature_names)), np.nan, dtype=np.float32)
+        if not patients:
+            return X
+        for name, j in self._column_index.items():
+            kind = _feature_kind(name)
+            if kind == "numeric":
+                attr = NUMERIC_FEATURES[name]
+                X[:, j] = [_as_float(getattr(p, attr, None)) for p in patients]
+            elif kind == "derived":
+                X[:, j] = [_bmi(getattr(p, "height", None), getattr(p, "weight", None)) for p in patients]
+            elif kind == "categorical":
+                prefix = next(p for p in CATEGORICAL_PREFIXES if name.startswith(p))
+                attr = CATEGORICAL_PREFIXES[prefix]
+                level = name[len(prefix):].strip().lower()
+                values = [getattr(p, attr, None) for p in patients]
+                X[:, j] = [
+                    math.nan if v is None else float(str(v).strip().lower() == level)
+                    for v in values
+                ]
+        return X
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities for a feature matrix of shape (n, len(feature_names))"""
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names):
+            raise SchemaMismatchError(f"Expected (n, {len(self.feature_names)}) features, got {X.shape}")
+        if X.shape[0] == 0:
+            return np.zeros((0, len(self.classes)), dtype=np.float32)
+        return np.asarray(self.model.predict_proba(X), dtype=np.float32)
+
+    def predict_patients(self, patients: Sequence[Any]) -> np.ndarray:
+        return self.predict_proba(self.build_feature_matrix(patients))
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "n_features": len(self.feature_names),
+            "feature_names": self.feature_names,
+            "classes": [self.class_label(c) for c in self.classes]
+        }
+
+
+def _as_float(value: Any) -> float:
+    if value is None:
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _model_feature_names(model: Any) -> List[str]:
+    names = getattr(model, "feature_names_in_", None)
+    if names is not None:
+        return [str(n) for n in names]
+    try:
+        booster_names = model.get_booster().feature_names
+    except Exception:
+        booster_names = None
+    return list(booster_names) if booster_names else []
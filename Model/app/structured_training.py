@@ -0,0 +1,359 @@
+"""
+Training pipeline for the structured XGBoost risk model (extracted from Model/model.ipynb)
+Streams Tests.csv in chunks into a per-patient max pivot, caches the intermediate tables
+as Parquet, trains XGBoost with the histogram method on all cores and writes a versioned
+artifact that structured_model.StructuredRiskModel loads
+
+    python structured_training.py --data-dir <csv dir> [--out ../xgb_model.pkl] [--cache-dir ...]
+
+Inputs (same files as the notebook): Patients.csv, Tests.csv, MeasurementsLookup.csv,
+Diagnoses.csv and ConditionsLookup.csv
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from metrics import StageTimer
+from structured_model import StructuredRiskModel
+
+logger = logging.getLogger(__name__)
+
+# Labs pivoted into feature columns, in training column order
+REQUIRED_LABS = ("HbA1c_level", "blood_glucose", "BMI", "BUN", "Cholesterol", "HDL", "LDL", "Cr")
+PATIENT_COLUMNS = ("patient_uhid", "Age", "Gender", "Blood Type", "smoke_status", "drinking_status")
+CATEGORICAL_COLUMNS = ("Gender", "Blood Type")
+CONDITIONS_OF_INTEREST = (8, 1, 9)
+BALANCE_MODES = ("weights", "smote", "none")
+
+
+def _file_fingerprint(paths: Sequence[Path], **params: Any) -> str:
+    """Cache key of a stage: its input files (path, size, mtime) plus the parameters it used"""
+    h = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        stat = Path(path).stat()
+        h.update(f"{Path(path).resolve()}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    h.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _parquet_engine() -> Optional[str]:
+    for engine in ("pyarrow", "fastparquet"):
+        try:
+            __import__(engine)
+            return engine
+        except ImportError:
+            continue
+    return None
+
+
+class StructuredTrainingPipeline:
+    """Parameterized version of the notebook's preprocessing, training and export cells.
+
+    Each stage is timed into ``timer``; ``pivot`` and ``dataset`` are cached under
+    ``cache_dir`` keyed by their input files and parameters, so retraining with new
+    model parameters does not re-read the lab history.
+    """
+
+    def __init__(self, data_dir: Path, cache_dir: Optional[Path] = None,
+                 chunksize: int = 1_000_000, labs: Sequence[str] = REQUIRED_LABS,
+                 conditions: Sequence[int] = CONDITIONS_OF_INTEREST, max_missing_labs: int = 1,
+                 drop_missing_fraction: float = 0.95, balance: str = "weights",
+                 test_size: float = 0.2, random_state: int = 42,
+                 xgb_params: Optional[Dict[str, Any]] = None):
+        if balance not in BALANCE_MODES:
+            raise ValueError(f"balance must be one of {BALANCE_MODES}, got {balance!r}")
+        self.data_dir = Path(data_dir)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.chunksize = int(chunksize)
+        self.labs = list(labs)
+        self.conditions = [int(c) for c in conditions]
+        self.max_missing_labs = int(max_missing_labs)
+        self.drop_missing_fraction = float(drop_missing_fraction)
+        self.balance = balance
+        self.test_size = float(test_size)
+        self.random_state = int(random_state)
+        # Notebook hyperparameters; hist + n_jobs=-1 build histograms on every core
+        self.xgb_params = {
+            "n_estimators": 100,
+            "max_depth": 3,
+            "learning_rate": 0.05,
+            "reg_alpha": 0.1,
+            "reg_lambda": 1.0,
+            "tree_method": "hist",
+            "max_bin": 256,
+            "n_jobs": -1,
+            "random_state": self.random_state,
+            **(xgb_params or {})
+        }
+        self.timer = StageTimer()
+        self.cache_hits: Dict[str, bool] = {}
+        self.pivot_key: Optional[str] = None
+
+    def _path(self, name: str) -> Path:
+        path = self.data_dir / name
+        if not path.exists():
+            raise FileNotFoundError(f"{path} not found")
+        return path
+
+    # Parquet cache
+    def _cached(self, stage: str, key: str, build: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        if self.cache_dir is None:
+            self.cache_hits[stage] = False
+            return build()
+        engine = _parquet_engine()
+        suffix = ".parquet" if engine else ".pkl"
+        path = self.cache_dir / f"{stage}-{key}{suffix}"
+        if path.exists():
+            logger.info(f"Stage {stage!r}: using cached {path.name}")
+            self.cache_hits[stage] = True
+            return pd.read_parquet(path, engine=engine) if engine else pd.read_pickle(path)
+        frame = build()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(suffix + ".tmp")
+        if engine:
+            frame.to_parquet(tmp, engine=engine, index=False)
+        else:
+            logger.warning(f"No Parquet engine (pyarrow/fastparquet) installed; caching {stage!r} as pickle")
+            frame.to_pickle(tmp)
+        os.replace(tmp, path)
+        self.cache_hits[stage] = False
+        return frame
+
+    # Stages
+    def pivot_tests(self) -> pd.DataFrame:
+        """Per-patient max of every required lab, streamed from Tests.csv.
+
+        Rows are mapped to a categorical lab code and reduced to (patient, lab) maxima
+        chunk by chunk, so memory grows with patients x labs rather than with rows.
+        """
+        tests_path = self._path("Tests.csv")
+        lookup_path = self._path("MeasurementsLookup.csv")
+        key = self.pivot_key = _file_fingerprint([tests_path, lookup_path], labs=self.labs)
+
+        def build() -> pd.DataFrame:
+            lookup = pd.read_csv(lookup_path, usecols=["measurement_id", "measurement_name"])
+            lookup = lookup[lookup["measurement_name"].isin(self.labs)]
+            lab_dtype = pd.CategoricalDtype(self.labs)
+            lab_of = pd.Series(
+                pd.Categorical(lookup["measurement_name"], dtype=lab_dtype),
+                index=lookup["measurement_id"].to_numpy()
+            )
+            running: Optional[pd.Series] = None
+            rows = 0
+            for chunk in pd.read_csv(tests_path, usecols=["patient_uhid", "measurement_id", "value"],
+                                     chunksize=self.chunksize):
+                rows += len(chunk)
+                labs = pd.Categorical(chunk["measurement_id"].map(lab_of), dtype=lab_dtype)
+                values = pd.to_numeric(chunk["value"], errors="coerce").astype(np.float32)
+                keep = ~pd.isna(labs) & values.notna().to_numpy()
+                if not keep.any():
+                    continue
+                part = pd.DataFrame({
+                    "patient_uhid": chunk["patient_uhid"].to_numpy()[keep],
+                    "lab": labs[keep],
+                    "value": values.to_numpy()[keep]
+                }).groupby(["patient_uhid", "lab"], observed=True)["value"].max()
+                running = part if running is None else pd.concat([running, part]).groupby(level=[0, 1], observed=True).max()
+            logger.info(f"Pivoted {rows} test rows into {0 if running is None else len(running)} patient/lab maxima")
+            if running is None:
+                return pd.DataFrame(columns=["patient_uhid", *self.labs])
+            wide = running.unstack("lab").reindex(columns=self.labs).astype(np.float32)
+            wide.columns = list(self.labs)
+            return wide.reset_index()
+
+        with self.timer.stage("pivot"):
+            return self._cached("pivot", key, build)
+
+    def build_dataset(self, pivot: pd.DataFrame) -> pd.DataFrame:
+        """Patients with a label and at most ``max_missing_labs`` missing labs"""
+        patients_path = self._path("Patients.csv")
+        diagnoses_path = self._path("Diagnoses.csv")
+        key = _file_fingerprint([patients_path, diagnoses_path], pivot=self.pivot_key,
+                                conditions=self.conditions, max_missing_labs=self.max_missing_labs)
+
+        def build() -> pd.DataFrame:
+            labs = pivot[pivot[self.labs].isna().sum(axis=1) <= self.max_missing_labs]
+            patients = pd.read_csv(patients_path, usecols=list(PATIENT_COLUMNS))
+            diagnoses = pd.read_csv(diagnoses_path, usecols=["patient_uhid", "condition_id"])
+            diagnoses["condition_id"] = pd.to_numeric(diagnoses["condition_id"], errors="coerce")
+            diagnoses = diagnoses[diagnoses["condition_id"].isin(self.conditions)]
+            # One label per patient, as in the notebook: the first matching diagnosis
+            labels = diagnoses.groupby("patient_uhid", as_index=False)["condition_id"].first()
+            dataset = patients.merge(labels, on="patient_uhid", how="inner").merge(labs, on="patient_uhid", how="inner")
+            dataset["condition_id"] = dataset["condition_id"].astype(np.int64)
+            for column in ("Age", "smoke_status", "drinking_status"):
+                dataset[column] = pd.to_numeric(dataset[column], errors="coerce").astype(np.float32)
+            for column in CATEGORICAL_COLUMNS:
+                dataset[column] = dataset[column].astype(str)
+            return dataset.reset_index(drop=True)
+
+        with self.timer.stage("dataset"):
+            return self._cached("dataset", key, build)
+
+    def encode(self, dataset: pd.DataFrame):
+        """Feature matrix in the column layout StructuredRiskModel builds, plus encoded labels"""
+        with self.timer.stage("encode"):
+            features = dataset.drop(columns=["patient_uhid", "condition_id"])
+            missing = features.isna().mean()
+            dropped = [c for c in features.columns if missing[c] > self.drop_missing_fraction]
+            if dropped:
+                logger.info(f"Dropping columns more than {self.drop_missing_fraction:.0%} missing: {dropped}")
+                features = features.drop(columns=dropped)
+            categorical = [c for c in CATEGORICAL_COLUMNS if c in features.columns]
+            for column in categorical:
+                features[column] = features[column].astype(pd.CategoricalDtype(sorted(features[column].unique())))
+            features = pd.get_dummies(features, columns=categorical, drop_first=True, dtype=np.float32)
+            classes = np.sort(dataset["condition_id"].unique())
+            y = np.searchsorted(classes, dataset["condition_id"].to_numpy())
+            return features.astype(np.float32), y, classes, dropped
+
+    def _resample(self, X: pd.DataFrame, y: np.ndarray):
+        """Class balancing on the training split only; returns (X, y, sample_weight)"""
+        if self.balance == "smote":
+            try:
+                from imblearn.over_sampling import SMOTE
+            except ImportError:
+                logger.warning("imbalanced-learn is not installed; balancing with sample weights instead")
+            else:
+                # SMOTE cannot interpolate NaN; impute with column medians for the synthetic rows only
+                X_filled = X.fillna(X.median())
+                X_res, y_res = SMOTE(random_state=self.random_state).fit_resample(X_filled, y)
+                return X_res, np.asarray(y_res), None
+        if self.balance == "none":
+            return X, y, None
+        from sklearn.utils.class_weight import compute_sample_weight
+
+        return X, y, compute_sample_weight("balanced", y)
+
+    def train(self, X: pd.DataFrame, y: np.ndarray, classes: np.ndarray):
+        import xgboost as xgb
+        from sklearn.metrics import accuracy_score, classification_report
+        from sklearn.model_selection import train_test_split
+
+        with self.timer.stage("split"):
+            stratify = y if np.bincount(y).min() >= 2 else None
+            X_train, X_test, y_train, y_test = train_test_split(
+                X, y, test_size=self.test_size, random_state=self.random_state, stratify=stratify
+            )
+            X_train, y_train, weights = self._resample(X_train, y_train)
+
+        with self.timer.stage("fit"):
+            objective = "multi:softprob" if len(classes) > 2 else "binary:logistic"
+            model = xgb.XGBClassifier(objective=objective, **self.xgb_params)
+            model.fit(X_train, y_train, sample_weight=weights, eval_set=[(X_test, y_test)], verbose=False)
+
+        with self.timer.stage("evaluate"):
+            y_pred = model.predict(X_test)
+            report = classification_report(
+                y_test, y_pred, labels=list(range(len(classes))),
+                target_names=[str(c) for c in classes], output_dict=True, zero_division=0
+            )
+            evaluation = {
+                "accuracy": float(accuracy_score(y_test, y_pred)),
+                "n_train": int(len(y_train)),
+                "n_test": int(len(y_test)),
+                "per_class": {k: v for k, v in report.items() if k in {str(c) for c in classes}}
+            }
+        return model, evaluation
+
+    def class_names(self, classes: Sequence[int]) -> Dict[str, str]:
+        path = self.data_dir / "ConditionsLookup.csv"
+        if not path.exists():
+            return {}
+        lookup = pd.read_csv(path)
+        # One dict lookup per class instead of scanning the table for every prediction
+        names = lookup.set_index("condition_id").iloc[:, 0].to_dict()
+        return {str(int(c)): str(names.get(c, f"condition_{c}")) for c in classes}
+
+    def run(self, out: Path) -> Dict[str, Any]:
+        """Run every stage and publish the artifact at ``out``; returns the training report"""
+        started = time.perf_counter()
+        pivot = self.pivot_tests()
+        dataset = self.build_dataset(pivot)
+        if dataset.empty:
+            raise ValueError("No labelled patients with enough lab results to train on")
+        X, y, classes, dropped = self.encode(dataset)
+        model, evaluation = self.train(X, y, classes)
+        with self.timer.stage("export"):
+            artifact = self.export(model, list(X.columns), classes, evaluation, dropped, Path(out))
+        report = {
+            **artifact,
+            "rows": {"patients_with_labs": int(len(pivot)), "training_rows": int(len(dataset))},
+            "evaluation": evaluation,
+            "cache_hits": dict(self.cache_hits),
+            "timings_ms": self.timer.breakdown(),
+            "total_s": round(time.perf_counter() - started, 3)
+        }
+        return report
+
+    def export(self, model: Any, feature_names: List[str], classes: np.ndarray,
+               evaluation: Dict[str, Any], dropped: List[str], out: Path) -> Dict[str, Any]:
+        """Write ``<stem>-<version>.pkl`` + schema sidecar, validate them and publish to ``out``.
+
+        The bundle holds the estimator and its schema, which StructuredRiskModel.load
+        reads directly; the sidecar keeps the schema readable without unpickling.
+        """
+        import joblib
+        import xgboost as xgb
+
+        version = time.strftime("%Y%m%d-%H%M%S") + "-" + hashlib.blake2b(
+            json.dumps([feature_names, classes.tolist(), self.xgb_params], default=str).encode("utf-8"),
+            digest_size=4
+        ).hexdigest()
+        schema = {
+            "version": version,
+            "feature_names": feature_names,
+            "classes": [int(c) for c in classes],
+            "class_names": self.class_names(classes),
+            "dropped_features": dropped,
+            "params": self.xgb_params,
+            "xgboost_version": xgb.__version__,
+            "evaluation": {"accuracy": evaluation["accuracy"], "n_train": evaluation["n_train"]}
+        }
+        out.parent.mkdir(parents=True, exist_ok=True)
+        versioned = out.with_name(f"{out.stem}-{version}{out.suffix}")
+        joblib.dump({"model": model, **schema}, versioned)
+        versioned.with_suffix(".schema.json").write_text(json.dumps(schema, indent=2), encoding="utf-8")
+
+        # Refuse to publish an artifact the API would reject at startup
+        loaded = StructuredRiskModel.load(versioned)
+        for src, dst in ((versioned, out), (versioned.with_suffix(".schema.json"), out.with_suffix(".schema.json"))):
+            tmp = dst.with_name(dst.name + ".tmp")
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+        logger.info(f"Published structured model {version} to {out}: {loaded.info()['classes']}")
+        return {"version": version, "artifact": str(versioned), "published": str(out)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    default_out = Path(os.environ.get("HEALTHSYNC_XGB_MODEL_PATH", str(Path(__file__).resolve().parents[1] / "xgb_model.pkl")))
+    parser = argparse.ArgumentParser(description="Train the structured XGBoost risk model")
+    parser.add_argument("--data-dir", type=Path, required=True, help="directory with the notebook's CSV files")
+    parser.add_argument("--out", type=Path, default=default_out, help="artifact path main.py loads")
+    parser.add_argument("--cache-dir", type=Path, default=None, help="Parquet cache of intermediate tables")
+    parser.add_argument("--chunksize", type=int, default=1_000_000, help="Tests.csv rows per chunk")
+    parser.add_argument("--balance", choices=BALANCE_MODES, default="weights")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--max-depth", type=int, default=3)
+    parser.add_argument("--learning-rate", type=float, default=0.05)
+    parser.add_argument("--max-bin", type=int, default=256)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pipeline = StructuredTrainingPipeline(
+        args.data_dir, cache_dir=args.cache_dir, chunksize=args.chunksize, balance=args.balance,
+        xgb_params={"n_estimators": args.n_estimators, "max_depth": args.max_depth,
+                    "learning_rate": args.learning_rate, "max_bin": args.max_bin}
+    )
+    print(json.dumps(pipeline.run(args.out), indent=2))
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app modules import each other as top-level modules (uvicorn runs from Model/app)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,174 @@
+"""
+The keyword if-chains main.py used before clinical_rules.json (verbatim), kept as the
+reference the compiled rule engine is checked against
+"""
+
+from typing import Dict, Any
+
+DISEASE_TAXONOMY = {
+    "Cardiovascular Disease": {
+        "L1": "Cardiovascular",
+        "L2": "Coronary/Cardiac",
+        "L3_rules": [
+            {"if_symptoms_any": ["chest pain", "chest tightness", "angina"], "label": "Angina"},
+            {"if_symptoms_any": ["shortness of breath", "palpitations"], "label": "Arrhythmia"},
+        ],
+        "default_L3": "Cardiac condition"
+    },
+    "Hypertension": {
+        "L1": "Cardiovascular",
+        "L2": "Hypertension",
+        "L3_rules": [
+            {"if_symptoms_any": ["headache", "dizziness"], "label": "Hypertensive disorder"}
+        ],
+        "default_L3": "Essential hypertension"
+    },
+    "Diabetes": {
+        "L1": "Endocrine",
+        "L2": "Diabetes",
+        "L3_rules": [
+            {"if_symptoms_any": ["excessive thirst", "frequent urination", "increased hunger"], "label": "Type 2 diabetes"}
+        ],
+        "default_L3": "Diabetes (unspecified)"
+    },
+    "Ophthalmic Disorder": {
+        "L1": "Ophthalmology",
+        "L2": "Neuro-ophthalmic",
+        "L3_rules": [
+            {"if_symptoms_any": ["diplopia", "double vision", "ptosis"], "label": "Ocular motor dysfunction"}
+        ],
+        "default_L3": "Eye disorder"
+    },
+    "Neurological Disorder": {
+        "L1": "Neurology",
+        "L2": "Neuromuscular/CNS",
+        "L3_rules": [
+            {"if_symptoms_any": ["weakness", "numbness", "tingling"], "label": "Peripheral neuropathy"},
+            {"if_symptoms_any": ["seizure", "epilepsy"], "label": "Epilepsy"}
+        ],
+        "default_L3": "Neurological disorder"
+    },
+    "Autoimmune Disorder": {
+        "L1": "Immunology",
+        "L2": "Autoimmune",
+        "L3_rules": [
+            {"if_symptoms_any": ["steroid", "prednisone", "inflammation"], "label": "Steroid-responsive autoimmune"}
+        ],
+        "default_L3": "Autoimmune disorder"
+    }
+}
+
+def _infer_l3_label(disease: str, symptoms: list) -> str:
+    taxonomy = DISEASE_TAXONOMY.get(disease)
+    if not taxonomy:
+        return disease
+    normalized = [s.lower() for s in symptoms]
+    for rule in taxonomy.get("L3_rules", []):
+        if any(keyword in normalized for keyword in [k.lower() for k in rule.get("if_symptoms_any", [])]):
+            return rule.get("label", taxonomy.get("default_L3", disease))
+    return taxonomy.get("default_L3", disease)
+
+def get_hierarchical_labels(diseases: list, symptoms: list) -> Dict[str, Any]:
+    """Return L1/L2/L3 hierarchy per top disease (MedRAG-style levels)."""
+    levels = []
+    for d in diseases[:3]:
+        tax = DISEASE_TAXONOMY.get(d)
+        if not tax:
+            levels.append({"disease": d, "L1": "Unknown", "L2": "Unknown", "L3": d})
+            continue
+        levels.append({
+            "disease": d,
+            "L1": tax.get("L1", "Unknown"),
+            "L2": tax.get("L2", "Unknown"),
+            "L3": _infer_l3_label(d, symptoms)
+        })
+    return {"levels": levels}
+
+# Symptom groups for follow-up/differential triggers, built once instead of per call
+_CARDIAC_SYMPTOMS = frozenset(["chest pain", "chest tightness", "palpitations"])
+_DIABETES_SYMPTOMS = frozenset(["excessive thirst", "frequent urination", "increased hunger"])
+_OCULAR_MOTOR_SYMPTOMS = frozenset(["diplopia", "double vision", "ptosis"])
+_NEURO_SYMPTOMS = frozenset(["weakness", "numbness", "tingling"])
+_CHEST_PAIN_SYMPTOMS = frozenset(["chest pain", "chest tightness", "shortness of breath"])
+_BACK_PAIN_SYMPTOMS = frozenset(["back pain", "leg pain", "sciatica"])
+
+
+def generate_follow_up_questions(diseases: list, symptoms: list) -> list:
+    """Produce targeted follow-up questions to reduce ambiguity (MedRAG-like).
+
+    Fallback for notes with no DDXPlus evidence match (see ``ddx_engine``).
+    """
+    questions = []
+    s = {x.lower() for x in symptoms}
+    dset = set(diseases)
+    if "Cardiovascular Disease" in dset or not s.isdisjoint(_CARDIAC_SYMPTOMS):
+        questions.extend([
+            "Chest pain is exertional and relieved by rest?",
+            "Any radiation to left arm, jaw, or back?",
+            "Associated diaphoresis or nausea?",
+            "Duration and frequency of episodes?"
+        ])
+    if "Diabetes" in dset or not s.isdisjoint(_DIABETES_SYMPTOMS):
+        questions.extend([
+            "Recent HbA1c and fasting glucose values?",
+            "Unintentional weight change?",
+            "Polyuria/nocturia severity and onset?",
+            "Any neuropathy or visual blurring?"
+        ])
+    if not s.isdisjoint(_OCULAR_MOTOR_SYMPTOMS):
+        questions.extend([
+            "Do symptoms fluctuate with fatigue (suggesting myasthenia)?",
+            "Any pupillary involvement or headache (for 3rd nerve palsy)?",
+            "Onset abrupt vs progressive?"
+        ])
+    if "Neurological Disorder" in dset or not s.isdisjoint(_NEURO_SYMPTOMS):
+        questions.extend([
+            "Symmetry and distribution of weakness/numbness?",
+            "Back pain or radicular features?",
+            "Bowel/bladder involvement?"
+        ])
+    # Deduplicate while preserving order
+    seen = set()
+    deduped = []
+    for q in questions:
+        if q not in seen:
+            deduped.append(q)
+            seen.add(q)
+    return deduped[:12]
+
+def generate_differentials(diseases: list, symptoms: list) -> list:
+    """Return differentials with key distinguishing questions/evidence."""
+    differentials = []
+    s = {x.lower() for x in symptoms}
+    if not s.isdisjoint(_CHEST_PAIN_SYMPTOMS):
+        differentials.append({
+            "pair": ["Stable angina", "Gastroesophageal reflux"],
+            "distinguishing_points": [
+                "Exertional chest pain relieved by rest favors angina",
+                "Burning postprandial pain lying down favors reflux"
+            ]
+        })
+        differentials.append({
+            "pair": ["Acute coronary syndrome", "Musculoskeletal chest pain"],
+            "distinguishing_points": [
+                "Pressure-like pain with diaphoresis suggests ACS",
+                "Reproducible chest wall tenderness suggests musculoskeletal"
+            ]
+        })
+    if not s.isdisjoint(_BACK_PAIN_SYMPTOMS):
+        differentials.append({
+            "pair": ["Lumbar canal stenosis", "Sciatica"],
+            "distinguishing_points": [
+                "Pain relieved by sitting suggests canal stenosis",
+                "Sitting worsens discomfort suggests sciatica"
+            ]
+        })
+    if not s.isdisjoint(_OCULAR_MOTOR_SYMPTOMS):
+        differentials.append({
+            "pair": ["Myasthenia gravis", "Cranial nerve palsy"],
+            "distinguishing_points": [
+                "Fatigable ptosis/ophthalmoparesis favors MG",
+                "Fixed pupil or severe headache suggests nerve palsy"
+            ]
+        })
+    return differentials[:6]
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from executor import AdmissionController
+
+PATIENT = {"age": 58, "gender": "male", "blood_pressure": "150/95", "clinical_notes": "chest pain and fever"}
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    controller = AdmissionController(max_in_flight=2)
+    monkeypatch.setattr(main, "admission_controller", controller)
+    return controller
+
+
+@pytest.fixture
+def client():
+    # No startup: models stay unloaded and analyses use the keyword/rule fallbacks
+    return TestClient(main.app)
+
+
+def test_slot_rejects_beyond_max_in_flight_and_releases_once():
+    controller = AdmissionController(max_in_flight=1, retry_after_s=3)
+    slot = controller.slot()
+    with pytest.raises(HTTPException) as rejected:
+        controller.slot()
+    assert rejected.value.status_code == 503 and rejected.value.headers["Retry-After"] == "3"
+    slot.release()
+    slot.release()
+    assert controller.in_flight == 0 and controller.stats()["rejected"] == 1
+
+
+def test_response_releases_a_slot_whose_generator_never_started():
+    controller = AdmissionController(max_in_flight=1)
+    slot = controller.slot()
+    started = []
+
+    async def body():
+        started.append(True)
+        yield b"never sent"
+
+    async def disconnected(message):
+        raise OSError("client went away")
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    response = main.AdmittedStreamingResponse(body(), admission_slot=slot)
+    with pytest.raises(Exception):
+        asyncio.run(response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, disconnected))
+    assert not started and controller.in_flight == 0
+
+
+def test_handlers_take_the_slot_before_streaming(controller, client):
+    controller.slot()
+    controller.slot()
+    assert client.post("/analyze/batch", content=json.dumps([PATIENT])).status_code == 503
+    assert client.post("/analyze/stream", json=PATIENT).status_code == 503
+    assert controller.in_flight == 2
+
+
+def test_streams_release_their_slot(controller, client):
+    lines = client.post("/analyze/batch", content=json.dumps([PATIENT, {"age": "old"}])).text.splitlines()
+    assert [json.loads(line)["index"] for line in lines] == [0, 1]
+    events = client.post("/analyze/stream", json=PATIENT).text
+    assert "complete" in events
+    assert controller.in_flight == 0 and controller.admitted == 2
+
+
+def test_analyze_is_rejected_at_the_limit_and_releases_its_slot(controller, client):
+    slot = controller.slot()
+    slot_two = controller.slot()
+    rejected = client.post("/analyze", json=PATIENT)
+    assert rejected.status_code == 503 and rejected.headers["retry-after"] == "1"
+    slot.release()
+    slot_two.release()
+    assert client.post("/analyze", json=PATIENT).status_code == 200
+    assert controller.stats()["in_flight"] == 0 and controller.stats()["rejected"] == 1
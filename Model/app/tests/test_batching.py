@@ -0,0 +1,85 @@
+import asyncio
+
+from batching import MicroBatcher
+
+
+def test_results_go_back_to_their_callers_in_submission_order():
+    batches = []
+
+    async def encode(texts):
+        batches.append(list(texts))
+        return [text.upper() for text in texts]
+
+    async def scenario():
+        batcher = MicroBatcher(encode, max_batch_size=4, max_latency_ms=20)
+        try:
+            return await asyncio.gather(*(batcher.submit(f"note {i}") for i in range(10)))
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(scenario()) == [f"NOTE {i}" for i in range(10)]
+    assert [len(b) for b in batches] == [4, 4, 2]
+    assert [t for b in batches for t in b] == [f"note {i}" for i in range(10)]
+
+
+def test_blocking_encode_runs_off_the_loop():
+    async def scenario():
+        batcher = MicroBatcher(lambda texts: [len(t) for t in texts], max_batch_size=8, max_latency_ms=5)
+        try:
+            return await asyncio.gather(batcher.submit("a"), batcher.submit("bbb"))
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(scenario()) == [1, 3]
+
+
+def test_a_lone_request_is_dispatched_after_the_latency_window():
+    async def scenario():
+        batcher = MicroBatcher(lambda texts: texts, max_batch_size=16, max_latency_ms=10)
+        try:
+            return await asyncio.wait_for(batcher.submit("only"), 1.0)
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(scenario()) == "only"
+
+
+def test_encode_error_fails_every_caller_in_the_batch_and_the_batcher_keeps_serving():
+    calls = []
+
+    async def encode(texts):
+        calls.append(len(texts))
+        if len(calls) == 1:
+            raise ValueError("tokenizer exploded")
+        return texts
+
+    async def scenario():
+        batcher = MicroBatcher(encode, max_batch_size=3, max_latency_ms=20)
+        try:
+            failed = await asyncio.gather(*(batcher.submit(str(i)) for i in range(3)), return_exceptions=True)
+            recovered = await batcher.submit("after")
+            return failed, recovered
+        finally:
+            await batcher.stop()
+
+    failed, recovered = asyncio.run(scenario())
+    assert all(isinstance(e, ValueError) and str(e) == "tokenizer exploded" for e in failed)
+    assert recovered == "after"
+    assert calls == [3, 1]
+
+
+def test_stop_fails_in_flight_and_queued_requests():
+    async def encode(texts):
+        await asyncio.Event().wait()
+
+    async def scenario():
+        batcher = MicroBatcher(encode, max_batch_size=1, max_latency_ms=0)
+        in_flight = asyncio.create_task(batcher.submit("in flight"))
+        queued = asyncio.create_task(batcher.submit("queued"))
+        await asyncio.sleep(0.01)
+        await batcher.stop()
+        return await asyncio.wait_for(asyncio.gather(in_flight, queued, return_exceptions=True), 1.0)
+
+    results = asyncio.run(scenario())
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+    assert all(str(r) == "Micro-batcher stopped" for r in results)
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from bulk import BulkParseError, iter_chunks, iter_records
+
+PATIENT = {"age": 58, "gender": "male", "blood_pressure": "150/95", "clinical_notes": "chest pain and fever"}
+
+
+@pytest.fixture
+def client():
+    # No startup: models stay unloaded and analyses use the keyword/rule fallbacks
+    return TestClient(main.app)
+
+
+def _parse(parts, content_type="", **kwargs):
+    async def chunks():
+        for part in parts:
+            yield part
+
+    async def collect():
+        return [item async for item in iter_records(chunks(), content_type, **kwargs)]
+    return asyncio.run(collect())
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_ndjson_lines_split_across_chunks():
+    body = json.dumps({"note": "fièvre"}, ensure_ascii=False).encode("utf-8") + b"\n\n" + b'{"a": 1}'
+    split = body.index("è".encode("utf-8")) + 1
+    assert _parse([b"", body[:split], body[split:]]) == [({"note": "fièvre"}, None), ({"a": 1}, None)]
+
+
+def test_bad_ndjson_line_is_reported_inline():
+    records = _parse([b'{"a": 1}\n{oops\n[1]\n'], "application/x-ndjson")
+    assert records[0] == ({"a": 1}, None)
+    assert records[1][0] is None and records[1][1].startswith("Invalid JSON")
+    assert records[2] == ([1], None)
+
+
+def test_json_array_elements_stream_and_truncation_raises():
+    assert _parse([b' [{"a": 1}, {"b":', b' [2, 3]}]']) == [({"a": 1}, None), ({"b": [2, 3]}, None)]
+    with pytest.raises(BulkParseError):
+        _parse([b'[{"a": 1}, {"b": 2'])
+
+
+def test_invalid_array_element_fails_without_reading_the_rest_of_the_upload():
+    read = []
+
+    async def chunks():
+        yield b'[{"a": 1}, {"b": oops, "c": 3},'
+        for i in range(1000):
+            read.append(i)
+            yield b' {"d": 4},'
+
+    async def collect():
+        return [item async for item in iter_records(chunks())]
+    with pytest.raises(BulkParseError, match="Invalid JSON array element at offset 11"):
+        asyncio.run(collect())
+    assert read == []
+
+
+def test_oversized_record_ends_the_upload_with_its_offset():
+    element = b'{"clinical_notes": "' + b"x" * 100 + b'"}'
+    with pytest.raises(BulkParseError, match="element at offset 11 exceeds 64 bytes"):
+        _parse([b'[{"a": 1}, '] + [element[i:i + 16] for i in range(0, len(element), 16)] + [b"]"],
+               max_record_bytes=64)
+    with pytest.raises(BulkParseError, match="Line at offset 9 exceeds 64 bytes"):
+        _parse([b'{"a": 1}\n'] + [element[i:i + 16] for i in range(0, len(element), 16)], "application/x-ndjson",
+               max_record_bytes=64)
+    # Many small records in one chunk are not one big record
+    assert len(_parse([b"[" + b", ".join([b'{"a": 1}'] * 50) + b"]"], max_record_bytes=64)) == 50
+
+
+def test_separator_error_reports_the_offset_in_the_upload():
+    with pytest.raises(BulkParseError, match="at offset 20"):
+        _parse([b'[{"a": 1}, ', b'{"b": 2} {"c": 3}]'])
+
+
+def test_chunks_keep_input_indices():
+    async def records():
+        for i in range(5):
+            yield {"i": i}, None
+
+    async def collect():
+        return [chunk async for chunk in iter_chunks(records(), 2)]
+    chunks = asyncio.run(collect())
+    assert [[item["index"] for item in chunk] for chunk in chunks] == [[0, 1], [2, 3], [4]]
+
+
+def test_ndjson_upload_reports_bad_records_inline_in_input_order(client):
+    body = "\n".join([json.dumps(PATIENT), "{not json", "[1, 2]", json.dumps({"age": "old"}), json.dumps(PATIENT)])
+    response = client.post("/analyze/batch", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200
+    lines = _lines(response)
+    assert [line["index"] for line in lines] == [0, 1, 2, 3, 4]
+    assert [line["success"] for line in lines] == [True, False, False, False, True]
+    assert lines[1]["error"].startswith("Invalid JSON")
+    assert lines[2]["error"] == "Invalid record: Record must be a JSON object"
+    assert lines[3]["error"].startswith("Invalid record:")
+
+
+def test_json_array_upload_matches_ndjson(client):
+    body = json.dumps([PATIENT, {"age": "old"}])
+    lines = _lines(client.post("/analyze/batch", content=body, headers={"content-type": "application/json"}))
+    assert [(line["index"], line["success"]) for line in lines] == [(0, True), (1, False)]
+
+
+def test_malformed_array_upload_ends_with_an_error_line(client):
+    lines = _lines(client.post("/analyze/batch", content=b'[{"age": 58, "gender": "male"}, {"age":',
+                               headers={"content-type": "application/json"}))
+    assert lines[-1]["success"] is False
+    assert lines[-1]["error"].startswith("Malformed upload:")
+    assert "index" not in lines[-1]
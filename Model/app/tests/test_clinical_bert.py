@@ -0,0 +1,109 @@
+import re
+from pathlib import Path
+
+import pytest
+
+import clinical_bert
+from clinical_bert import (
+    has_valid_parity_stamp, int8_onnx_path, parity_stamp_path, remove_onnx_artifacts, write_parity_stamp
+)
+
+CONFIG = {"model_path": "medicalai/ClinicalBERT", "parity_min_cosine": 0.99}
+PASSED = {"passed": True, "min_cosine": 0.9995}
+
+
+def _graph(tmp_path: Path, content: bytes = b"graph") -> Path:
+    graph = tmp_path / "clinicalbert.onnx"
+    graph.write_bytes(content)
+    return graph
+
+
+def test_default_onnx_path_is_outside_the_source_tree(monkeypatch, tmp_path):
+    monkeypatch.delenv("HEALTHSYNC_ONNX_PATH", raising=False)
+    monkeypatch.setenv("HEALTHSYNC_ARTIFACT_DIR", str(tmp_path))
+    assert Path(clinical_bert.model_config()["onnx_path"]) == tmp_path / "clinicalbert.onnx"
+
+
+def test_unstamped_graph_is_not_trusted(tmp_path):
+    assert not has_valid_parity_stamp(_graph(tmp_path), CONFIG)
+
+
+def test_stamp_accepts_the_checked_graph(tmp_path):
+    graph = _graph(tmp_path)
+    write_parity_stamp(graph, CONFIG, PASSED)
+    assert has_valid_parity_stamp(graph, CONFIG)
+
+
+def test_stamp_rejects_a_changed_graph_model_or_threshold(tmp_path):
+    graph = _graph(tmp_path)
+    write_parity_stamp(graph, CONFIG, PASSED)
+    assert not has_valid_parity_stamp(graph, {**CONFIG, "model_path": "/models/finetuned"})
+    assert not has_valid_parity_stamp(graph, {**CONFIG, "parity_min_cosine": 0.9999})
+    graph.write_bytes(b"another graph")
+    assert not has_valid_parity_stamp(graph, CONFIG)
+
+
+def test_failed_stamp_is_not_trusted(tmp_path):
+    graph = _graph(tmp_path)
+    write_parity_stamp(graph, CONFIG, {"passed": False, "min_cosine": 0.5})
+    assert not has_valid_parity_stamp(graph, CONFIG)
+
+
+def test_remove_onnx_artifacts_deletes_graphs_and_stamps(tmp_path):
+    graph = _graph(tmp_path)
+    int8 = int8_onnx_path(graph)
+    int8.write_bytes(b"int8")
+    write_parity_stamp(int8, CONFIG, PASSED)
+    remove_onnx_artifacts(graph)
+    assert not any(p.exists() for p in (graph, int8, parity_stamp_path(int8)))
+
+
+def test_onnx_backend_without_onnxruntime_falls_back_to_torch(monkeypatch):
+    import builtins
+
+    real_import = builtins.__import__
+
+    def no_onnxruntime(name, *args, **kwargs):
+        if name == "onnxruntime":
+            raise ImportError("No module named 'onnxruntime'")
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setenv("HEALTHSYNC_BERT_BACKEND", "onnx")
+    monkeypatch.setattr(builtins, "__import__", no_onnxruntime)
+    monkeypatch.setattr(clinical_bert, "load_tokenizer", lambda config: "tokenizer")
+    monkeypatch.setattr(clinical_bert, "load_torch_model", lambda config: "fp32 model")
+    assert clinical_bert.load_clinical_bert() == ("tokenizer", "fp32 model")
+
+
+@pytest.fixture(scope="module")
+def tiny_bert(tmp_path_factory):
+    """Randomly initialised two-layer BERT with a word-level vocab over the parity notes"""
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizer
+
+    words = sorted({w for note in clinical_bert.PARITY_NOTES for w in re.findall(r"\w+|[^\w\s]", note.lower())})
+    vocab = tmp_path_factory.mktemp("tiny_bert") / "vocab.txt"
+    vocab.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words) + "\n")
+    tokenizer = BertTokenizer(str(vocab))
+    torch.manual_seed(0)
+    model = BertModel(BertConfig(vocab_size=tokenizer.vocab_size, hidden_size=32, num_hidden_layers=2,
+                                 num_attention_heads=2, intermediate_size=64)).eval()
+    return tokenizer, model
+
+
+def test_int8_torch_backend_passes_parity_against_fp32(tiny_bert):
+    import copy
+
+    tokenizer, model = tiny_bert
+    report = clinical_bert.parity_check(tokenizer, model, clinical_bert.quantize_int8(copy.deepcopy(model)))
+    assert report["notes"] == len(clinical_bert.PARITY_NOTES) and report["passed"]
+
+
+def test_exported_onnx_graph_matches_torch(tiny_bert, tmp_path):
+    # onnxruntime (and onnx, which torch.onnx.export needs) are optional and not test dependencies
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    tokenizer, model = tiny_bert
+    graph = clinical_bert.export_onnx(tokenizer, model, tmp_path / "clinicalbert.onnx")
+    report = clinical_bert.parity_check(tokenizer, model, clinical_bert.OnnxEncoder(graph))
+    assert report["passed"] and report["max_abs_diff"] < 1e-3
@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import pytest
+
+import main
+from ddxplus import DDXPlusEngine
+
+DATA_DIR = Path(__file__).resolve().parents[3] / "data"
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return DDXPlusEngine.load(DATA_DIR, main.DDXPLUS_EVIDENCE_MAP)
+
+
+def _ranked(engine, terms):
+    return [d["condition"] for d in engine.analyze(terms)["differentials"]]
+
+
+def test_fever_alone_does_not_rank_the_most_severe_condition_first(engine):
+    ranked = engine.analyze(["fever"])["differentials"]
+    assert ranked[0]["condition"] == "Croup"
+    assert ranked[0]["probability"] > next(d for d in ranked if d["condition"] == "Ebola")["probability"]
+
+
+def test_exact_ties_keep_release_order_not_severity(engine):
+    ranked = engine.analyze(["fever"])["differentials"]
+    tied = [d for d in ranked if d["condition"] in ("Bronchiolitis", "Ebola")]
+    assert tied[0]["probability"] == tied[1]["probability"]
+    assert [d["condition"] for d in tied] == ["Bronchiolitis", "Ebola"]
+
+
+def test_condition_with_fewer_evidences_gains_more_from_a_shared_one(engine):
+    assert _ranked(engine, ["palpitations", "shortness of breath"])[:2] == ["Atrial fibrillation", "Pericarditis"]
+
+
+def test_headache_is_not_generic_pain(engine):
+    assert _ranked(engine, ["headache"]) == []
+    assert "Possible NSTEMI / STEMI" not in _ranked(engine, ["headache", "fever"])
+
+
+def test_only_symptoms_named_in_the_note_are_reported():
+    hits = main._apply_keyword_rules(main.clinical_keyword_matcher, "History of heart disease, now fever and a migraine")
+    assert "chest pain" in hits["symptoms"]
+    assert hits["reported"] == ["fever", "headache"]
+
+
+def test_differentials_use_reported_symptoms(engine, monkeypatch):
+    monkeypatch.setattr(main, "ddx_engine", engine)
+    family = ["chest pain", "chest tightness", "palpitations", "shortness of breath"]
+    insights = main.retrieve_medical_guidelines(["Cardiovascular Disease"], family, reported=["fever"])
+    assert [d["condition"] for d in insights["ranked_differentials"]] == _ranked(engine, ["fever"])
@@ -0,0 +1,37 @@
+import numpy as np
+
+from disease_head import MIN_THRESHOLD, _best_threshold, train_head
+
+
+def test_well_separated_class_gets_the_middle_of_the_tied_range():
+    y = np.array([0] * 50 + [1] * 50)
+    p = np.concatenate([np.full(50, 0.02), np.full(50, 0.98)])
+    assert _best_threshold(p, y) == 0.5
+
+
+def test_tied_range_above_the_default():
+    y = np.array([0] * 50 + [1] * 50)
+    p = np.concatenate([np.full(50, 0.52), np.full(50, 0.98)])
+    assert _best_threshold(p, y) == 0.75
+
+
+def test_threshold_is_floored():
+    y = np.array([0] * 50 + [1] * 50)
+    p = np.concatenate([np.full(50, 0.01), np.full(50, 0.12)])
+    assert _best_threshold(p, y) == MIN_THRESHOLD
+
+
+def test_best_f1_still_wins_over_ties():
+    y = np.array([0, 0, 0, 1, 1, 1])
+    p = np.array([0.1, 0.3, 0.62, 0.58, 0.7, 0.9])
+    assert _best_threshold(p, y) == 0.45
+
+
+def test_trained_head_does_not_default_to_the_lowest_threshold():
+    rng = np.random.default_rng(0)
+    labels = ["Diabetes", "Hypertension", "Asthma"]
+    centers = rng.standard_normal((3, 16)) * 4
+    cls = rng.integers(0, 3, 300)
+    X = centers[cls] + rng.standard_normal((300, 16))
+    head = train_head(X, [[labels[c]] for c in cls], labels, epochs=200)
+    assert np.all(head.thresholds >= 0.3) and np.all(head.thresholds <= 0.7)
@@ -0,0 +1,83 @@
+import csv
+
+import numpy as np
+import pytest
+
+import kb_snapshot
+from knowledge_base import DataKnowledgeBase
+from kb_snapshot import MappedTable, SnapshotError, load_or_build, read_snapshot, write_snapshot
+
+NAMES = ["type 2 diabetes", "hypertension", "heart failure", "acute kidney injury", "café au lait spots"]
+
+
+def _write_csv(path, header, rows):
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    base = tmp_path / "data"
+    base.mkdir()
+    _write_csv(base / "Diagnoses.csv", ["diagnosis"], [[n] for n in NAMES])
+    _write_csv(base / "Tests.csv", ["diagnosis", "test"],
+               [["Type 2 Diabetes", "HbA1c"], ["type 2 diabetes", "Fasting glucose"], ["Heart Failure", "BNP"], ["", "CBC"]])
+    _write_csv(base / "DrugLookup.csv", ["condition", "drug"],
+               [["hypertension", "Amlodipine"], ["hypertension", "Lisinopril"], ["café au lait spots", "None"]])
+    return base
+
+
+def test_snapshot_serves_the_same_answers_from_mapped_arrays(data_dir, tmp_path):
+    built = DataKnowledgeBase(data_dir)
+    path = tmp_path / "kb.snapshot"
+    load_or_build(data_dir, path)
+    mapped = load_or_build(data_dir, path)
+    assert isinstance(mapped.disease_to_tests, MappedTable)
+    assert sorted(mapped.disease_names) == sorted(built.disease_names)
+    for query in NAMES + ["diabetes", "hypertensoin", "kidney", "cafe", "unknown", ""]:
+        assert mapped.retrieve(query) == built.retrieve(query)
+        assert mapped.match(query) == built.match(query)
+
+
+def test_arrays_are_views_of_the_mapped_file(data_dir, tmp_path):
+    path = tmp_path / "kb.snapshot"
+    write_snapshot(DataKnowledgeBase(data_dir), path)
+    arrays, _ = read_snapshot(path)
+    for array in arrays.values():
+        assert not array.flags.owndata and not array.flags.writeable
+        assert array.ctypes.data % 64 == 0
+
+
+def test_snapshot_is_reused_until_a_source_csv_changes(data_dir, tmp_path, monkeypatch):
+    path = tmp_path / "kb.snapshot"
+    load_or_build(data_dir, path)
+    rebuilds = []
+    real_init = DataKnowledgeBase.__init__
+    monkeypatch.setattr(DataKnowledgeBase, "__init__", lambda self, *a, **kw: rebuilds.append(1) or real_init(self, *a, **kw))
+    load_or_build(data_dir, path)
+    assert rebuilds == []
+    with (data_dir / "Tests.csv").open("a", encoding="utf-8") as f:
+        f.write("hypertension,ECG\n")
+    kb = load_or_build(data_dir, path)
+    assert rebuilds == [1]
+    assert kb.retrieve("hypertension")["tests"] == ("ECG",)
+
+
+def test_corrupt_snapshot_is_rejected_and_rebuilt(data_dir, tmp_path):
+    path = tmp_path / "kb.snapshot"
+    write_snapshot(DataKnowledgeBase(data_dir), path)
+    raw = bytearray(path.read_bytes())
+    raw[-1] ^= 0xFF
+    path.write_bytes(bytes(raw))
+    with pytest.raises(SnapshotError, match="checksum"):
+        read_snapshot(path)
+    assert load_or_build(data_dir, path).retrieve("heart failure")["tests"] == ("BNP",)
+    read_snapshot(path, kb_snapshot.source_fingerprint(data_dir))
+
+
+def test_name_index_postings_are_sorted_position_arrays(data_dir):
+    index = DataKnowledgeBase(data_dir).name_index
+    for posting in list(index._token_postings.values()) + list(index._gram_postings.values()):
+        assert posting.dtype == np.int32 and np.all(np.diff(posting) > 0)
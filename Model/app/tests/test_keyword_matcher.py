@@ -0,0 +1,46 @@
+from keyword_matcher import KeywordMatcher
+
+RULES = [
+    {"name": "cardiac", "keywords": ["chest pain", "chest tightness", "heart"]},
+    {"name": "neuro", "keywords": ["weakness", "numbness"]},
+    {"name": "eye", "keywords": ["eye weakness", "ptosis"]},
+    {"name": "rash", "keywords": ["rash"]},
+]
+
+
+def _names(matcher, text):
+    return [rule["name"] for rule in matcher.scan(text)["rules"]]
+
+
+def test_keywords_only_match_whole_words():
+    matcher = KeywordMatcher(RULES)
+    assert matcher.find("sat by the hearth, no heartburn") == []
+    assert matcher.find("a brash decision") == []
+    assert _names(matcher, "heart racing") == ["cardiac"]
+
+
+def test_matching_is_case_insensitive_and_tolerates_plurals():
+    matcher = KeywordMatcher(RULES)
+    assert [m["keyword"] for m in matcher.find("Chest Pains and RASHES")] == ["chest pain", "rash"]
+    assert matcher.find("rashly") == []
+
+
+def test_spans_point_at_the_matched_text():
+    matcher = KeywordMatcher(RULES)
+    text = "Reports chest tightness; numbness."
+    assert [(m["keyword"], text[m["start"]:m["end"]]) for m in matcher.find(text)] == [
+        ("chest tightness", "chest tightness"), ("numbness", "numbness")
+    ]
+
+
+def test_longest_keyword_wins_and_credits_nested_keywords():
+    matcher = KeywordMatcher(RULES)
+    scan = matcher.scan("left eye weakness")
+    assert [m["keyword"] for m in scan["spans"]] == ["eye weakness"]
+    # "weakness" occurs inside "eye weakness", so the neuro rule fires too, in table order
+    assert [rule["name"] for rule in scan["rules"]] == ["neuro", "eye"]
+
+
+def test_empty_inputs():
+    assert KeywordMatcher([]).scan("chest pain") == {"rules": [], "spans": []}
+    assert KeywordMatcher(RULES).find("") == []
@@ -0,0 +1,100 @@
+import json
+import os
+import random
+import shutil
+from pathlib import Path
+
+import pytest
+
+import legacy_rules
+from rule_engine import CompiledRules, RuleEngine, RuleFileError
+
+RULES_PATH = Path(__file__).resolve().parents[1] / "clinical_rules.json"
+
+SYMPTOMS = sorted(
+    {k for entry in legacy_rules.DISEASE_TAXONOMY.values() for rule in entry["L3_rules"] for k in rule["if_symptoms_any"]}
+    | legacy_rules._CARDIAC_SYMPTOMS | legacy_rules._DIABETES_SYMPTOMS | legacy_rules._OCULAR_MOTOR_SYMPTOMS
+    | legacy_rules._NEURO_SYMPTOMS | legacy_rules._CHEST_PAIN_SYMPTOMS | legacy_rules._BACK_PAIN_SYMPTOMS
+    | {"fever", "cough", "rash", "chest", "pain"}
+)
+DISEASES = sorted(legacy_rules.DISEASE_TAXONOMY) + ["Respiratory Infection", "Migraine"]
+
+
+def _legacy(diseases, symptoms):
+    return {
+        "levels": legacy_rules.get_hierarchical_labels(diseases, symptoms)["levels"],
+        "follow_up_questions": legacy_rules.generate_follow_up_questions(diseases, symptoms),
+        "differentials": legacy_rules.generate_differentials(diseases, symptoms)
+    }
+
+
+@pytest.fixture(scope="module")
+def rules():
+    return CompiledRules.from_file(RULES_PATH)
+
+
+def test_matches_the_legacy_if_chains_on_random_requests(rules):
+    rng = random.Random(1234)
+    for _ in range(5000):
+        diseases = rng.sample(DISEASES, rng.randint(0, 5))
+        symptoms = [rng.choice([s, s.upper(), s.title()]) for s in rng.sample(SYMPTOMS, rng.randint(0, 8))]
+        if symptoms and rng.random() < 0.2:
+            symptoms.append(symptoms[0])
+        assert rules.evaluate(diseases, symptoms) == _legacy(diseases, symptoms), (diseases, symptoms)
+
+
+def test_empty_request(rules):
+    assert rules.evaluate([], []) == _legacy([], []) == {"levels": [], "follow_up_questions": [], "differentials": []}
+
+
+def test_unknown_symptom_group_is_rejected(tmp_path):
+    spec = json.loads(RULES_PATH.read_text())
+    spec["follow_up_rules"][0]["if_symptoms_any"] = ["@no_such_group"]
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(spec))
+    with pytest.raises(RuleFileError):
+        CompiledRules.from_file(path)
+
+
+def test_engine_reloads_a_changed_file_and_keeps_the_old_rules_on_error(tmp_path):
+    path = tmp_path / "rules.json"
+    shutil.copy(RULES_PATH, path)
+    engine = RuleEngine(path, check_interval_s=0)
+    before = engine.evaluate(["Diabetes"], [])
+
+    spec = json.loads(path.read_text())
+    spec["taxonomy"]["Diabetes"]["L1"] = "Metabolic"
+    path.write_text(json.dumps(spec))
+    os.utime(path, ns=(1, 1))
+    assert engine.evaluate(["Diabetes"], [])["levels"][0]["L1"] == "Metabolic"
+    assert engine.reloads == 1
+
+    path.write_text("{not json")
+    os.utime(path, ns=(2, 2))
+    assert engine.evaluate(["Diabetes"], [])["levels"][0]["L1"] == "Metabolic"
+    assert engine.reload_errors == 1 and engine.last_error
+    assert before["levels"][0]["L1"] == "Endocrine"
+
+
+def test_a_rule_reload_invalidates_session_retrieval(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    path = tmp_path / "rules.json"
+    shutil.copy(RULES_PATH, path)
+    monkeypatch.setattr(main, "clinical_rules", RuleEngine(path, check_interval_s=0))
+    client = TestClient(main.app)
+    patient = {"age": 58, "gender": "male", "clinical_notes": "chest pain and palpitations"}
+
+    first = client.post("/analyze/session/rules-reload", json=patient).json()
+    assert "rag" in first["session"]["recomputed"]
+    assert "rag" in client.post("/analyze/session/rules-reload", json=patient).json()["session"]["reused"]
+
+    spec = json.loads(path.read_text())
+    spec["differential_rules"][0]["differentials"][0]["pair"] = ["Edited", "Pair"]
+    path.write_text(json.dumps(spec))
+    os.utime(path, ns=(1, 1))
+    edited = client.post("/analyze/session/rules-reload", json=patient).json()
+    assert "rag" in edited["session"]["recomputed"]
+    assert ["Edited", "Pair"] in [d["pair"] for d in edited["rag_insights"]["differentials"]]
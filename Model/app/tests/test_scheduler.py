@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from cache import SingleFlight
+from scheduler import Lane, RequestScheduler
+
+LANES = [Lane("interactive", 0), Lane("bulk", 1, max_concurrency=1)]
+
+
+def _scheduler(capacity: int = 1) -> RequestScheduler:
+    return RequestScheduler(LANES, {"model": capacity})
+
+
+async def _as(scheduler, lane, deadline_ms, coro):
+    """Run ``coro`` as a request bound to ``lane`` (own context, like a request task)"""
+    async def request():
+        headers = {"x-priority": lane}
+        if deadline_ms:
+            headers["x-deadline-ms"] = str(deadline_ms)
+        scheduler.bind(headers)
+        return await coro()
+    return await asyncio.create_task(request())
+
+
+def test_slots_go_to_the_higher_priority_lane_first():
+    async def scenario():
+        scheduler = _scheduler()
+        order = []
+
+        async def work(name):
+            async with scheduler.slot("model"):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        holder = asyncio.create_task(_as(scheduler, "bulk", None, lambda: work("holder")))
+        await asyncio.sleep(0.001)
+        bulk = asyncio.create_task(_as(scheduler, "bulk", None, lambda: work("bulk")))
+        interactive = asyncio.create_task(_as(scheduler, "interactive", None, lambda: work("interactive")))
+        await asyncio.gather(holder, bulk, interactive)
+        return order
+
+    assert asyncio.run(scenario()) == ["holder", "interactive", "bulk"]
+
+
+def test_coalesced_work_runs_in_the_most_urgent_waiters_lane():
+    async def scenario():
+        scheduler = _scheduler()
+        flights = SingleFlight()
+        flights.scheduler = scheduler
+        gate = asyncio.Event()
+        seen = []
+
+        async def compute():
+            await gate.wait()
+            seen.append(scheduler.current()[0].name)
+            return "done"
+
+        leader = asyncio.create_task(_as(scheduler, "bulk", None, lambda: flights.run("k", compute)))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(_as(scheduler, "interactive", None, lambda: flights.run("k", compute)))
+        await asyncio.sleep(0.01)
+        gate.set()
+        return await asyncio.gather(leader, follower), seen, flights.stats()
+
+    results, seen, stats = asyncio.run(scenario())
+    assert results == ["done", "done"] and seen == ["interactive"]
+    assert stats == {"in_flight": 0, "leaders": 1, "coalesced": 1}
+
+
+def test_a_waiters_deadline_sheds_only_that_waiter():
+    async def scenario():
+        scheduler = _scheduler()
+        flights = SingleFlight()
+        flights.scheduler = scheduler
+
+        async def compute():
+            await asyncio.sleep(0.2)
+            return "done"
+
+        leader = asyncio.create_task(_as(scheduler, "interactive", 50, lambda: flights.run("k", compute)))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(_as(scheduler, "interactive", None, lambda: flights.run("k", compute)))
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+
+    leader, follower = asyncio.run(scenario())
+    assert isinstance(leader, HTTPException) and leader.status_code == 503
+    assert follower == "done"
+
+
+def test_expired_deadline_is_shed_before_waiting():
+    async def scenario():
+        scheduler = _scheduler()
+
+        async def late():
+            await asyncio.sleep(0.03)
+            return await scheduler.within_deadline(asyncio.get_running_loop().create_future())
+
+        return await _as(scheduler, "interactive", 10, late)
+
+    with pytest.raises(HTTPException, match="deadline expired"):
+        asyncio.run(scenario())
@@ -0,0 +1,74 @@
+import asyncio
+import builtins
+import gzip
+import json
+
+import pytest
+
+import serialization
+from serialization import compress, json_response, json_response_offloaded, negotiate_encoding
+
+LARGE = {"documents": [{"id": i, "text": "monitor blood pressure and titrate therapy; " * 12} for i in range(80)]}
+
+
+def test_negotiation_honours_q_values():
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("identity, gzip;q=0.5") == "gzip"
+    assert negotiate_encoding("*;q=0.1") == serialization.available_encodings()[0]
+
+
+def test_negotiation_does_not_import_per_call(monkeypatch):
+    def no_imports(name, *args, **kwargs):
+        raise AssertionError(f"import {name} during negotiation")
+
+    monkeypatch.setattr(builtins, "__import__", no_imports)
+    assert negotiate_encoding("br, gzip") in ("br", "gzip")
+
+
+def test_small_bodies_are_sent_uncompressed():
+    response = json_response({"ok": True}, "gzip")
+    assert "content-encoding" not in response.headers and json.loads(response.body) == {"ok": True}
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_large_bodies_are_compressed_for_the_client():
+    response = json_response(LARGE, "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.body)) == LARGE
+
+
+def test_offloaded_compression_runs_through_the_executor_above_the_threshold(monkeypatch):
+    calls = []
+
+    async def run(fn, *args):
+        calls.append(fn)
+        return fn(*args)
+
+    monkeypatch.setattr(serialization, "COMPRESS_OFFLOAD_BYTES", 10 ** 9)
+    small = asyncio.run(json_response_offloaded(LARGE, "gzip", run=run))
+    assert calls == []
+    monkeypatch.setattr(serialization, "COMPRESS_OFFLOAD_BYTES", 1024)
+    offloaded = asyncio.run(json_response_offloaded(LARGE, "gzip", run=run, headers={"Server-Timing": "x"}))
+    assert calls == [compress]
+    assert offloaded.body == small.body and offloaded.headers["server-timing"] == "x"
+
+
+def test_stage_outputs_are_validated_where_they_are_produced():
+    import pydantic
+
+    import main
+
+    patient = main.PatientData(age=61, gender="Male", cholesterol=240, clinical_notes="chest pain")
+    bert = main._fallback_clinical_analysis(patient.clinical_notes)
+    xgb = main.analyze_with_xgboost(patient)
+    rag = main.retrieve_medical_guidelines(bert["diseases_detected"], bert["symptoms_identified"])
+    fusion = main.fuse_analysis_results(bert, xgb, rag)
+    for model, output in ((main.ClinicalBertAnalysis, bert), (main.XGBoostAnalysis, xgb),
+                          (main.RagInsights, rag), (main.FusionResult, fusion)):
+        assert main.validated_stage_output(model, output) is output
+
+    with pytest.raises(pydantic.ValidationError):
+        main.validated_stage_output(main.FusionResult, {**fusion, "confidence": "high"})
+    with pytest.raises(pydantic.ValidationError):
+        main.validated_stage_output(main.XGBoostAnalysis, {"risk_level": "High risk"})
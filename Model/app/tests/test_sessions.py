@@ -0,0 +1,133 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from sessions import SessionStore, Stage, StageGraph
+
+STRUCTURED = ("age", "cholesterol")
+
+
+class StubGraph:
+    """The analysis graph's shape (see main.analysis_graph) over cheap stub stages"""
+
+    def __init__(self):
+        self.model_version = "v1"
+        self.fail = set()
+        self.gate = None
+
+        async def clinical_bert(request, upstream):
+            if self.gate is not None:
+                await self.gate.wait()
+            return {"note": request.clinical_notes, "model": self.model_version}
+
+        def stage(name):
+            def fn(request, upstream):
+                if name in self.fail:
+                    raise RuntimeError(f"{name} failed")
+                return {"stage": name, "fields": [getattr(request, f) for f in STRUCTURED], "upstream": upstream}
+            return fn
+
+        self.graph = StageGraph([
+            Stage("clinical_bert", clinical_bert, fields=("clinical_notes",),
+                  context=lambda: self.model_version, is_async=True),
+            Stage("xgboost", stage("xgboost"), fields=STRUCTURED),
+            Stage("rag", stage("rag"), after=("clinical_bert",)),
+            Stage("fusion", stage("fusion"), after=("clinical_bert", "xgboost", "rag")),
+            Stage("recommendations", stage("recommendations"), after=("clinical_bert", "xgboost", "rag"))
+        ])
+
+
+async def run_sync(fn, *args):
+    return fn(*args)
+
+
+def _request(**changes):
+    return SimpleNamespace(**{"clinical_notes": "chest pain", "age": 60, "cholesterol": 200, **changes})
+
+
+def _update(store, session_id, request):
+    return asyncio.run(store.update(session_id, request, run_sync))
+
+
+ALL = ["clinical_bert", "xgboost", "rag", "fusion", "recommendations"]
+
+
+def test_structured_edit_reruns_only_xgboost_and_its_dependents():
+    store = SessionStore(StubGraph().graph)
+    assert _update(store, "s", _request())[1] == ALL
+    assert _update(store, "s", _request())[1] == []
+    outputs, recomputed = _update(store, "s", _request(cholesterol=260))
+    assert recomputed == ["xgboost", "fusion", "recommendations"]
+    assert outputs["fusion"]["fields"] == [60, 260]
+
+
+def test_context_change_reruns_the_stage_and_everything_after_it():
+    stub = StubGraph()
+    store = SessionStore(stub.graph)
+    _update(store, "s", _request())
+    stub.model_version = "v2"
+    outputs, recomputed = _update(store, "s", _request())
+    assert recomputed == ["clinical_bert", "rag", "fusion", "recommendations"]
+    assert outputs["rag"]["upstream"]["clinical_bert"]["model"] == "v2"
+
+
+def test_failed_stage_reruns_on_the_next_update():
+    stub = StubGraph()
+    store = SessionStore(stub.graph)
+    stub.fail.add("rag")
+    with pytest.raises(RuntimeError, match="rag failed"):
+        _update(store, "s", _request())
+    stub.fail.clear()
+    assert _update(store, "s", _request())[1] == ["rag", "fusion", "recommendations"]
+
+
+def test_sessions_are_evicted_by_count_and_expire():
+    store = SessionStore(StubGraph().graph, max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        _update(store, session_id, _request())
+    assert _update(store, "a", _request())[1] == ALL
+    assert store.stats()["evictions"] >= 1
+
+    expiring = SessionStore(StubGraph().graph, ttl_s=0.05)
+    _update(expiring, "s", _request())
+    time.sleep(0.1)
+    assert _update(expiring, "s", _request())[1] == ALL
+    assert expiring.stats()["created"] == 2
+
+
+def test_concurrent_first_updates_share_one_session():
+    stub = StubGraph()
+    store = SessionStore(stub.graph)
+
+    async def scenario():
+        stub.gate = asyncio.Event()
+        first = asyncio.create_task(store.update("s", _request(), run_sync))
+        second = asyncio.create_task(store.update("s", _request(), run_sync))
+        await asyncio.sleep(0.01)
+        stub.gate.set()
+        return await first, await second
+
+    first, second = asyncio.run(scenario())
+    assert (first[1], second[1]) == (ALL, [])
+    assert store.stats()["created"] == 1
+
+
+def test_update_that_outlives_its_session_does_not_replace_the_new_one():
+    stub = StubGraph()
+    store = SessionStore(stub.graph, ttl_s=0.5)
+
+    async def scenario():
+        stub.gate = asyncio.Event()
+        stale = asyncio.create_task(store.update("s", _request(clinical_notes="old note"), run_sync))
+        await asyncio.sleep(0.6)
+        # The first session expired while its update was stuck; this one starts afresh
+        stub.gate.set()
+        fresh = await store.update("s", _request(clinical_notes="new note"), run_sync)
+        await stale
+        return fresh
+
+    fresh = asyncio.run(scenario())
+    assert fresh[1] == ALL
+    assert store.sessions.get("s").outputs["clinical_bert"]["note"] == "new note"
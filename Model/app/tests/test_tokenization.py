@@ -0,0 +1,80 @@
+import random
+
+import numpy as np
+import pytest
+
+from tokenization import length_buckets, pool_windows, window_notes
+
+WORDS = [f"w{i}" for i in range(300)]
+
+
+@pytest.fixture(scope="module")
+def tokenizer(tmp_path_factory):
+    """Fast WordPiece tokenizer where each ``w<i>`` word is one token"""
+    from transformers import BertTokenizerFast
+
+    vocab = tmp_path_factory.mktemp("tokenizer") / "vocab.txt"
+    vocab.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS) + "\n")
+    return BertTokenizerFast(str(vocab))
+
+
+def _note(n_words: int, first: int = 0) -> str:
+    return " ".join(WORDS[first:first + n_words])
+
+
+def _words(tokenizer, window):
+    tokens = tokenizer.convert_ids_to_tokens(window)
+    assert tokens[0] == "[CLS]" and tokens[-1] == "[SEP]"
+    return tokens[1:-1]
+
+
+def test_long_note_is_split_into_overlapping_windows_owned_by_it(tokenizer):
+    windows, owners = window_notes(tokenizer, [_note(5), _note(40), _note(3, 100)],
+                                   max_length=16, stride=4, max_windows=0)
+    assert owners == [0, 1, 1, 1, 1, 2]
+    assert all(len(w) <= 16 for w in windows)
+    long_windows = [_words(tokenizer, w) for w, owner in zip(windows, owners) if owner == 1]
+    for previous, following in zip(long_windows, long_windows[1:]):
+        assert previous[-4:] == following[:4]
+    # Dropping each overlap rebuilds the note exactly
+    rebuilt = long_windows[0] + [t for w in long_windows[1:] for t in w[4:]]
+    assert rebuilt == WORDS[:40]
+    assert _words(tokenizer, windows[0]) == WORDS[:5]
+
+
+def test_max_windows_thins_evenly_and_keeps_both_ends(tokenizer):
+    texts = [_note(200), _note(2)]
+    all_windows, all_owners = window_notes(tokenizer, texts, max_length=16, stride=4, max_windows=0)
+    windows, owners = window_notes(tokenizer, texts, max_length=16, stride=4, max_windows=5)
+    n_long = all_owners.count(0)
+    assert n_long > 5
+    assert owners == [0] * 5 + [1]
+    kept = [all_windows.index(w) for w in windows[:5]]
+    assert kept[0] == 0 and kept[-1] == n_long - 1
+    gaps = np.diff(kept)
+    assert gaps.max() - gaps.min() <= 1
+    assert windows[5] == all_windows[-1]
+
+
+def test_length_buckets_respect_the_token_and_padding_budgets():
+    rng = random.Random(0)
+    lengths = [rng.choice([rng.randint(3, 20), rng.randint(100, 512)]) for _ in range(300)]
+    buckets = length_buckets(lengths, max_tokens=2048, max_padding=0.25)
+    assert sorted(i for bucket in buckets for i in bucket) == list(range(len(lengths)))
+    for bucket in buckets:
+        sizes = [lengths[i] for i in bucket]
+        padded = len(sizes) * max(sizes)
+        if len(bucket) > 1:
+            assert padded <= 2048
+            assert sum(sizes) >= 0.75 * padded
+    # A lone window longer than the budget still gets its own bucket
+    assert length_buckets([600, 4], max_tokens=512) == [[1], [0]]
+
+
+def test_pool_windows_keeps_single_windows_and_averages_the_rest():
+    embeddings = np.arange(12, dtype=np.float32).reshape(4, 3)
+    pooled = pool_windows(embeddings, [0, 1, 1, 2], 3)
+    assert np.array_equal(pooled[0], embeddings[0])
+    assert np.array_equal(pooled[2], embeddings[3])
+    assert np.allclose(pooled[1], embeddings[1:3].mean(axis=0))
+
@@ -0,0 +1,129 @@
+"""
+Length-aware tokenization for ClinicalBERT
+Notes are tokenized in one batched fast-tokenizer call, split into overlapping
+windows when longer than the model's 512-token limit, and grouped into buckets of
+similar length so each forward pass pads as little as possible
+
+HEALTHSYNC_BERT_MAX_LENGTH      tokens per window including [CLS]/[SEP] (default: 512)
+HEALTHSYNC_BERT_WINDOW_STRIDE   tokens shared by consecutive windows (default: 128)
+HEALTHSYNC_BERT_MAX_WINDOWS     windows kept per note, evenly spaced; 0 keeps all (default: 16)
+HEALTHSYNC_BERT_BUCKET_TOKENS   padded tokens per forward pass (default: 8192)
+HEALTHSYNC_BERT_MAX_PADDING     largest padded fraction of a bucket (default: 0.5)
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAX_LENGTH = int(os.environ.get("HEALTHSYNC_BERT_MAX_LENGTH", "512"))
+WINDOW_STRIDE = int(os.environ.get("HEALTHSYNC_BERT_WINDOW_STRIDE", "128"))
+MAX_WINDOWS = int(os.environ.get("HEALTHSYNC_BERT_MAX_WINDOWS", "16"))
+BUCKET_TOKENS = int(os.environ.get("HEALTHSYNC_BERT_BUCKET_TOKENS", "8192"))
+MAX_PADDING = float(os.environ.get("HEALTHSYNC_BERT_MAX_PADDING", "0.5"))
+
+_MODEL_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def window_notes(tokenizer: Any, texts: Sequence[str], max_length: int = MAX_LENGTH,
+                 stride: int = WINDOW_STRIDE, max_windows: int = MAX_WINDOWS) -> Tuple[List[List[int]], List[int]]:
+    """Token ids of every window and the index of the note it came from.
+
+    Uses the fast tokenizer's overflow support, so a long note costs one pass over its
+    text plus one window per ``max_length - stride`` tokens. Slow tokenizers cannot
+    report overflow and fall back to plain truncation.
+    """
+    texts = list(texts)
+    if not getattr(tokenizer, "is_fast", False):
+        encoded = tokenizer(texts, truncation=True, max_length=max_length,
+                            return_attention_mask=False, return_token_type_ids=False)
+        return encoded["input_ids"], list(range(len(texts)))
+
+    encoded = tokenizer(
+        texts, truncation=True, max_length=max_length, stride=stride,
+        return_overflowing_tokens=True, return_attention_mask=False, return_token_type_ids=False
+    )
+    windows, owners = encoded["input_ids"], list(encoded["overflow_to_sample_mapping"])
+    if not max_windows or len(windows) <= max_windows:
+        return windows, owners
+
+    # Overflow windows of a note are contiguous; thin out notes with too many of them
+    keep: List[int] = []
+    start = 0
+    while start < len(owners):
+        end = start
+        while end < len(owners) and owners[end] == owners[start]:
+            end += 1
+        if end - start > max_windows:
+            logger.debug(f"Note {owners[start]} has {end - start} windows, keeping {max_windows}")
+            keep.extend(int(i) for i in np.linspace(start, end - 1, max_windows).round())
+        else:
+            keep.extend(range(start, end))
+        start = end
+    return [windows[i] for i in keep], [owners[i] for i in keep]
+
+
+def length_buckets(lengths: Sequence[int], max_tokens: int = BUCKET_TOKENS,
+                   max_padding: float = MAX_PADDING) -> List[List[int]]:
+    """Group window indices by length.
+
+    A bucket closes when its padded size would exceed ``max_tokens`` or more than
+    ``max_padding`` of it would be padding, so one long note does not stretch a
+    batch of short ones to its length.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    buckets: List[List[int]] = []
+    current: List[int] = []
+    real_tokens = 0
+    for i in order:
+        # Sorted ascending, so the newest member sets the bucket's padded length
+        padded = (len(current) + 1) * lengths[i]
+        if current and (padded > max_tokens or real_tokens + lengths[i] < (1.0 - max_padding) * padded):
+            buckets.append(current)
+            current = []
+            real_tokens = 0
+        current.append(i)
+        real_tokens += lengths[i]
+    if current:
+        buckets.append(current)
+    return buckets
+
+
+def pad_bucket(windows: Sequence[List[int]], pad_token_id: int, input_names: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Right-pad a bucket of windows into int64 model inputs"""
+    width = max(len(w) for w in windows)
+    input_ids = np.full((len(windows), width), pad_token_id or 0, dtype=np.int64)
+    attention_mask = np.zeros((len(windows), width), dtype=np.int64)
+    for row, ids in enumerate(windows):
+        input_ids[row, :len(ids)] = ids
+        attention_mask[row, :len(ids)] = 1
+    inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+    if "token_type_ids" in input_names:
+        inputs["token_type_ids"] = np.zeros_like(input_ids)
+    return inputs
+
+
+def tokenize_notes(tokenizer: Any, texts: Sequence[str]) -> Tuple[List[Tuple[List[int], Dict[str, np.ndarray]]], List[int]]:
+    """Windowed, bucketed model inputs for ``texts``.
+
+    Returns ``(buckets, owners)``: each bucket pairs the window indices it holds with
+    its padded inputs, and ``owners[i]`` is the note window ``i`` belongs to.
+    """
+    windows, owners = window_notes(tokenizer, texts)
+    input_names = [n for n in getattr(tokenizer, "model_input_names", _MODEL_INPUTS) if n in _MODEL_INPUTS]
+    buckets = []
+    for members in length_buckets([len(w) for w in windows]):
+        buckets.append((members, pad_bucket([windows[i] for i in members], tokenizer.pad_token_id, input_names)))
+    return buckets, owners
+
+
+def pool_windows(window_embeddings: np.ndarray, owners: Sequence[int], n_notes: int) -> np.ndarray:
+    """Mean of each note's window embeddings; a note with a single window keeps its own"""
+    owners = np.asarray(owners)
+    pooled = np.zeros((n_notes, window_embeddings.shape[1]), dtype=np.float32)
+    np.add.at(pooled, owners, window_embeddings)
+    counts = np.bincount(owners, minlength=n_notes).astype(np.float32)
+    return pooled / np.maximum(counts, 1.0)[:, None]
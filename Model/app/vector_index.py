@@ -0,0 +1,285 @@
+"""
+Semantic vector index over the knowledge corpus
+Unit-normalized ClinicalBERT embeddings of condition names, guideline text and
+data-KB entries, searched by cosine similarity with an exact NumPy scan or an
+inverted-file (IVF) index whose lists are stored contiguously
+
+    python vector_index.py build [--out PATH] [--lists N]
+    python vector_index.py bench [--index PATH | --synthetic N] [--queries Q]
+"""
+
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Corpora smaller than this are always searched exactly
+IVF_MIN_DOCUMENTS = 4096
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 15, sample_size: int = 65536,
+           seed: int = 0) -> np.ndarray:
+    """Spherical k-means (Lloyd iterations on a sample); returns unit-norm centroids"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=n_clusters)
+        empty = counts == 0
+        # Re-seed empty clusters from random points so every list stays useful
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class VectorIndex:
+    """Cosine top-k search over ``documents`` with optional IVF partitioning.
+
+    With ``centroids`` set, vectors are grouped by nearest centroid and stored list
+    by list (``offsets[i]:offsets[i + 1]``), so probing a list is one contiguous
+    matrix-vector product; only ``nprobe`` lists are scanned per query.
+    """
+
+    def __init__(self, embeddings: np.ndarray, documents: Sequence[Dict[str, Any]],
+                 centroids: Optional[np.ndarray] = None, offsets: Optional[np.ndarray] = None,
+                 nprobe: int = 8, metadata: Optional[Dict[str, Any]] = None):
+        self.embeddings = _normalize(embeddings)
+        self.documents = list(documents)
+        self.centroids = None if centroids is None else _normalize(centroids)
+        self.offsets = None if offsets is None else np.asarray(offsets, dtype=np.int64)
+        self.nprobe = max(1, int(nprobe))
+        self.metadata = dict(metadata or {})
+        if len(self.embeddings) != len(self.documents):
+            raise ValueError(f"{len(self.embeddings)} embeddings for {len(self.documents)} documents")
+
+    @property
+    def dim(self) -> int:
+        return int(self.embeddings.shape[1]) if self.embeddings.ndim == 2 else 0
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, documents: Sequence[Dict[str, Any]],
+              n_lists: Optional[int] = None, nprobe: int = 8,
+              metadata: Optional[Dict[str, Any]] = None) -> "VectorIndex":
+        """Build an exact index, or an IVF index with ``n_lists`` lists (default ~sqrt(n))"""
+        embeddings = _normalize(embeddings)
+        documents = list(documents)
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(documents))) if len(documents) >= IVF_MIN_DOCUMENTS else 0
+        if n_lists <= 1:
+            return cls(embeddings, documents, nprobe=nprobe, metadata=metadata)
+
+        centroids = kmeans(embeddings, n_lists)
+        assign = np.argmax(embeddings @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        return cls(
+            embeddings[order], [documents[i] for i in order],
+            centroids=centroids, offsets=offsets, nprobe=nprobe, metadata=metadata
+        )
+
+    def _exact_scores(self, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return np.arange(len(self.embeddings)), self.embeddings @ query
+
+    def _ivf_scores(self, query: np.ndarray, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        nprobe = min(nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        ids = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in probe]
+        ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        # Lists are contiguous, so each slice is a view rather than a gather
+        scores = np.concatenate([self.embeddings[self.offsets[c]:self.offsets[c + 1]] @ query for c in probe])
+        return ids, scores
+
+    def search_ids(self, query: np.ndarray, k: int = 5, nprobe: Optional[int] = None,
+                   exact: bool = False) -> List[tuple]:
+        """Top-k ``(row, score)`` pairs, best first"""
+        if not len(self.documents) or k <= 0:
+            return []
+        query = _normalize(np.asarray(query, dtype=np.float32).reshape(-1))
+        if query.shape[0] != self.dim:
+            raise ValueError(f"Query has dimension {query.shape[0]}, index has {self.dim}")
+        if exact or self.centroids is None:
+            ids, scores = self._exact_scores(query)
+        else:
+            ids, scores = self._ivf_scores(query, nprobe or self.nprobe)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def search(self, query: np.ndarray, k: int = 5, nprobe: Optional[int] = None,
+               exact: bool = False) -> List[Dict[str, Any]]:
+        """Top-k documents with their cosine ``score``"""
+        return [
+            {**self.documents[row], "score": round(score, 4)}
+            for row, score in self.search_ids(query, k, nprobe, exact)
+        ]
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {
+            "embeddings": self.embeddings,
+            "documents": np.array(json.dumps(self.documents)),
+            "metadata": np.array(json.dumps({**self.metadata, "nprobe": self.nprobe}))
+        }
+        if self.centroids is not None:
+            arrays["centroids"] = self.centroids
+            arrays["offsets"] = self.offsets
+        with path.open("wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> "VectorIndex":
+        with np.load(Path(path), allow_pickle=False) as data:
+            metadata = json.loads(str(data["metadata"]))
+            return cls(
+                data["embeddings"],
+                json.loads(str(data["documents"])),
+                centroids=data["centroids"] if "centroids" in data.files else None,
+                offsets=data["offsets"] if "offsets" in data.files else None,
+                nprobe=metadata.pop("nprobe", 8),
+                metadata=metadata
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.documents),
+            "dim": self.dim,
+            "kind": "ivf" if self.centroids is not None else "exact",
+            "lists": 0 if self.centroids is None else len(self.centroids),
+            "nprobe": self.nprobe,
+            **self.metadata
+        }
+
+
+def build_corpus(knowledge: Dict[str, Any], data_kb: Any = None) -> List[Dict[str, Any]]:
+    """Documents from the taxonomy, the guideline tables and (optionally) the data KB"""
+    documents = []
+    for disease, tax in knowledge.get("disease_taxonomy", {}).items():
+        labels = [rule.get("label") for rule in tax.get("L3_rules", [])] + [tax.get("default_L3")]
+        documents.append({
+            "id": f"condition:{disease}",
+            "kind": "condition",
+            "disease": disease,
+            "text": f"{disease} ({tax.get('L1')}, {tax.get('L2')}): {', '.join(l for l in labels if l)}"
+        })
+    for section, entry in knowledge.get("medical_knowledge_base", {}).items():
+        documents.append({
+            "id": f"profile:{section}",
+            "kind": "condition",
+            "disease": section,
+            "text": f"{section}: symptoms {', '.join(entry.get('symptoms', []))}; "
+                    f"conditions {', '.join(entry.get('conditions', []))}"
+        })
+        for i, text in enumerate(entry.get("recommendations", [])):
+            documents.append({"id": f"guideline:{section}:{i}", "kind": "guideline", "disease": section, "text": text})
+    if data_kb is not None:
+        for disease in sorted(data_kb.disease_names):
+            info = data_kb.retrieve(disease)
+            parts = [f"{label} {', '.join(info[field][:20])}" for field, label in
+                     (("tests", "tests"), ("measurements", "measurements"), ("drugs", "drugs")) if info[field]]
+            documents.append({
+                "id": f"data:{disease}",
+                "kind": "data",
+                "disease": disease,
+                "text": f"{disease}: {'; '.join(parts)}" if parts else disease
+            })
+    return documents
+
+
+def embed_documents(documents: Sequence[Dict[str, Any]], encode_fn: Callable[[list], list],
+                    batch_size: int = 32) -> np.ndarray:
+    vectors = []
+    for start in range(0, len(documents), batch_size):
+        vectors.extend(encode_fn([d["text"] for d in documents[start:start + batch_size]]))
+    return np.stack(vectors).astype(np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+
+def benchmark(index: VectorIndex, queries: np.ndarray, k: int = 10,
+              nprobes: Sequence[int] = (1, 4, 8, 16, 32)) -> Dict[str, Any]:
+    """Recall@k of IVF probing against exact search, and per-query latency percentiles"""
+
+    def timed(fn) -> tuple:
+        results, latencies = [], []
+        for q in queries:
+            started = time.perf_counter()
+            results.append({row for row, _ in fn(q)})
+            latencies.append((time.perf_counter() - started) * 1000)
+        return results, {
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3)
+        }
+
+    truth, exact_latency = timed(lambda q: index.search_ids(q, k, exact=True))
+    report = {"documents": len(index.documents), "dim": index.dim, "k": k, "exact": exact_latency}
+    if index.centroids is not None:
+        report["ivf"] = []
+        for nprobe in nprobes:
+            found, latency = timed(lambda q: index.search_ids(q, k, nprobe=nprobe))
+            recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+            report["ivf"].append({"nprobe": nprobe, "recall": round(float(recall), 4), **latency})
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or benchmark the knowledge vector index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="Embed the knowledge corpus with ClinicalBERT")
+    build_cmd.add_argument("--out", type=Path, default=None)
+    build_cmd.add_argument("--lists", type=int, default=None, help="IVF lists (0 = exact)")
+    bench_cmd = sub.add_parser("bench", help="Recall/latency of IVF vs exact search")
+    bench_cmd.add_argument("--index", type=Path, default=None)
+    bench_cmd.add_argument("--synthetic", type=int, default=0, help="Benchmark N random clustered passages instead")
+    bench_cmd.add_argument("--dim", type=int, default=768)
+    bench_cmd.add_argument("--queries", type=int, default=200)
+    bench_cmd.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "build":
+        from clinical_bert import encode_cls_embeddings, load_clinical_bert, model_version
+        from main import DATA_DIR, VECTOR_INDEX_PATH, kb_knowledge_tables
+        from knowledge_base import DataKnowledgeBase
+
+        tokenizer, bert = load_clinical_bert()
+        documents = build_corpus(kb_knowledge_tables(), DataKnowledgeBase(DATA_DIR))
+        started = time.perf_counter()
+        embeddings = embed_documents(documents, lambda texts: encode_cls_embeddings(tokenizer, bert, texts))
+        index = VectorIndex.build(embeddings, documents, n_lists=args.lists, metadata={"model_version": model_version()})
+        out = args.out or VECTOR_INDEX_PATH
+        index.save(out)
+        print(json.dumps({"path": str(out), "build_s": round(time.perf_counter() - started, 2), **index.stats()}, indent=2))
+    else:
+        rng = np.random.default_rng(0)
+        if args.synthetic:
+            # Clustered vectors resemble real embedding geometry better than uniform noise
+            centers = rng.standard_normal((256, args.dim)).astype(np.float32)
+            vectors = centers[rng.integers(0, 256, args.synthetic)] + 0.5 * rng.standard_normal(
+                (args.synthetic, args.dim)).astype(np.float32)
+            docs = [{"id": str(i)} for i in range(args.synthetic)]
+            index = VectorIndex.build(vectors, docs)
+        else:
+            from main import VECTOR_INDEX_PATH
+
+            index = VectorIndex.load(args.index or VECTOR_INDEX_PATH)
+        picks = rng.choice(len(index.documents), min(args.queries, len(index.documents)), replace=False)
+        queries = index.embeddings[picks] + 0.1 * rng.standard_normal((len(picks), index.dim)).astype(np.float32)
+        print(json.dumps(benchmark(index, queries, k=args.k), indent=2))